@@ -1,3 +1,567 @@
-from django.test import TestCase
+import asyncio
+import copy
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import aiohttp
+from aiohttp.test_utils import TestClient, TestServer
+from django.test import SimpleTestCase
+
+from modules.circuit_breaker import lardi_circuit_breaker
+from modules.cookie_manager import lardi_cookie_manager
+from modules.fake_lardi_server import FakeLardiServer
+from modules.filter_matcher import ProposalFacts, compile_filter, match_batch
+from modules.firehose import SubscriptionIndex, poll_firehose
+from modules.http_session import lardi_http_session
+from modules.json_codec import JsonCodec, json_codec
+from modules.lardi_api_client import LardiClient, LardiGeoClient, LardiNotificationClient, lardi_notification_client
+from modules.notification_write_buffer import notification_write_buffer
+from modules.notifications_module import notify_filter_group
+from modules.proposal import Proposal
+from modules.session_pool import LardiSession, lardi_session_pool, parse_extra_accounts
+from modules.utils import filter_fingerprint
+
+# Фільтри за замовчуванням у форматі user_filter_to_dict (UA -> UA, готівка/карта)
+BASE_FILTERS = {
+    "directionFrom": {"directionRows": [{"countrySign": "UA"}]},
+    "directionTo": {"directionRows": [{"countrySign": "UA"}]},
+    "mass1": None, "mass2": None, "volume1": None, "volume2": None,
+    "length1": None, "length2": None, "width1": None, "width2": None, "height1": None, "height2": None,
+    "dateFromISO": None, "dateToISO": None,
+    "bodyTypeIds": [], "loadTypes": [], "paymentFormIds": [2, 10],
+    "groupage": False, "photos": False, "show_ignore": False,
+    "only_actual": False, "only_new": False, "only_relevant": False, "only_shippers": False,
+    "only_carrier": False, "only_expedition": False, "only_with_stavka": False, "only_partners": False,
+    "distanceKmFrom": None, "distanceKmTo": None,
+    "partnerGroups": [], "cargos": [], "cargoPackagingIds": [], "excludeCargos": [],
+    "cargoBodyTypeProperties": [], "paymentCurrencyId": 4, "paymentValue": None,
+    "paymentValueType": "TOTAL", "companyRefId": None, "companyName": None,
+    "includeDocuments": [], "excludeDocuments": [], "adr": None,
+}
+
+
+def _waypoint(country, region_id, town_id, town):
+    return {"countrySign": country, "regionId": region_id, "townId": town_id, "town": town, "region": "", "address": ""}
+
+
+# Синтетична відповідь у форматі /webapi/proposal/search/gruz/ (лише поля, які використовує бот).
+# Значення (loadTypes, regionId, townId тощо) підібрано під словник фільтрів, а не записано з Lardi,
+# тож тести нижче перевіряють логіку matcher-а, а не його відповідність серверній фільтрації Lardi.
+SYNTHETIC_RESPONSE = {"result": {"proposals": [
+    {"id": 101, "dateCreate": "2025-06-01T10:00:00+00:00",
+     "waypointListSource": [_waypoint("UA", 23, 1001, "Київ")],
+     "waypointListTarget": [_waypoint("UA", 14, 2001, "Львів")],
+     "gruzMass": "20 т", "gruzVolume": "86 м³", "loadTypes": ["top", "side"],
+     "payment": "25000 грн", "paymentForms": [{"id": 2, "name": "Готівка"}], "distance": 540000},
+    {"id": 102, "dateCreate": "2025-06-01T09:58:00+00:00",
+     "waypointListSource": [_waypoint("UA", 23, 1001, "Київ")],
+     "waypointListTarget": [_waypoint("UA", 8, 3001, "Одеса")],
+     "gruzMass": "1,5 т", "gruzVolume": "10 м³", "loadTypes": ["back"],
+     "payment": "запит ставки", "paymentForms": [{"id": 10, "name": "Карта"}], "distance": 475000},
+    {"id": 103, "dateCreate": "2025-06-01T09:55:00+00:00",
+     "waypointListSource": [_waypoint("UA", 14, 2001, "Львів")],
+     "waypointListTarget": [_waypoint("UA", 23, 1001, "Київ")],
+     "gruzMass": "5 т", "gruzVolume": "30 м³", "loadTypes": ["top"],
+     "payment": "12000 грн", "paymentForms": [{"id": 2, "name": "Готівка"}], "distance": 540000},
+    {"id": 104, "dateCreate": "2025-06-01T09:50:00+00:00",
+     "waypointListSource": [_waypoint("UA", 8, 3001, "Одеса")],
+     "waypointListTarget": [_waypoint("UA", 14, 2001, "Львів"), _waypoint("UA", 23, 1001, "Київ")],
+     "gruzMass": "10 т", "gruzVolume": "45 м³", "loadTypes": ["side", "tail_lift"],
+     "payment": "30000 грн", "paymentForms": [{"id": 10, "name": "Карта"}], "distance": 790000},
+    {"id": 105, "dateCreate": "2025-06-01T09:45:00+00:00",
+     "waypointListSource": [_waypoint("UA", 23, 1001, "Київ")],
+     "waypointListTarget": [_waypoint("UA", 23, 1002, "Біла Церква")],
+     "gruzMass": "0.8 т", "loadTypes": ["back"],
+     "payment": "3000 грн", "paymentForms": [{"id": 2, "name": "Готівка"}], "distance": 85000},
+]}}
+
+# Вужчі фільтри та ID вантажів, які вони мають відібрати з SYNTHETIC_RESPONSE
+SYNTHETIC_SEARCHES = [
+    ("mass_to_10", {"mass2": 10}, [102, 103, 104, 105]),
+    ("mass_range", {"mass1": 2, "mass2": 15}, [103, 104]),
+    ("volume_from_40", {"volume1": 40}, [101, 104, 105]),
+    ("load_type_top", {"loadTypes": ["top"]}, [101, 103]),
+    ("payment_card_only", {"paymentFormIds": [10]}, [102, 104]),
+    ("distance_range", {"distanceKmFrom": 100, "distanceKmTo": 600}, [101, 102, 103]),
+    ("with_stavka", {"only_with_stavka": True}, [101, 103, 104, 105]),
+    ("from_kyiv_region", {"directionFrom": {"directionRows": [{"countrySign": "UA", "regionId": 23}]}},
+     [101, 102, 105]),
+    ("to_lviv_town", {"directionTo": {"directionRows": [{"countrySign": "UA", "townId": 2001}]}}, [101, 104]),
+    ("to_poland", {"directionTo": {"directionRows": [{"countrySign": "PL"}]}}, []),
+]
+
+
+def _filters(**overrides):
+    filters = copy.deepcopy(BASE_FILTERS)
+    filters.update(overrides)
+    return filters
+
+
+class FilterMatcherSyntheticTests(SimpleTestCase):
+    """
+    Локальна перевірка фільтрів на синтетичних вантажах відбирає очікуваний набір вантажів.
+    """
+
+    def test_base_filter_matches_whole_response(self):
+        proposals = SYNTHETIC_RESPONSE["result"]["proposals"]
+        compiled = compile_filter(BASE_FILTERS)
+        self.assertEqual([p["id"] for p in proposals if compiled(p)], [p["id"] for p in proposals])
+        self.assertTrue(compiled.exact)
+
+    def test_synthetic_searches(self):
+        proposals = SYNTHETIC_RESPONSE["result"]["proposals"]
+        for name, overrides, expected_ids in SYNTHETIC_SEARCHES:
+            with self.subTest(name):
+                compiled = compile_filter(_filters(**overrides))
+                self.assertEqual([p["id"] for p in proposals if compiled.matches(p)], expected_ids)
+
+    def test_match_batch_groups_by_key(self):
+        proposals = SYNTHETIC_RESPONSE["result"]["proposals"]
+        compiled = [compile_filter(_filters(**overrides), key=name) for name, overrides, _ in SYNTHETIC_SEARCHES]
+        matched = match_batch(compiled, proposals)
+        for name, _, expected_ids in SYNTHETIC_SEARCHES:
+            with self.subTest(name):
+                self.assertEqual([p["id"] for p in matched[name]], expected_ids)
+
+    def test_match_batch_accepts_proposals(self):
+        raw = SYNTHETIC_RESPONSE["result"]["proposals"]
+        proposals = [Proposal(p) for p in raw]
+        facts_by_id = {p["id"]: ProposalFacts(p) for p in raw}
+        compiled = [compile_filter(_filters(**overrides), key=name) for name, overrides, _ in SYNTHETIC_SEARCHES]
+        matched = match_batch(compiled, proposals, facts_by_id)
+        for name, _, expected_ids in SYNTHETIC_SEARCHES:
+            with self.subTest(name):
+                self.assertEqual([p.id for p in matched[name]], expected_ids)
+        # Proposal не тримає фактів: без facts_by_id вантажі не перевіряються
+        self.assertFalse(hasattr(proposals[0], "facts"))
+        self.assertEqual(match_batch(compiled, proposals), {name: [] for name, _, _ in SYNTHETIC_SEARCHES})
+
+    def test_direction_stored_as_json_string(self):
+        compiled = compile_filter(_filters(directionTo='{"directionRows": [{"countrySign": "PL"}]}'))
+        self.assertFalse(compiled.matches(SYNTHETIC_RESPONSE["result"]["proposals"][0]))
+
+    def test_missing_fields_do_not_reject(self):
+        compiled = compile_filter(_filters(mass2=1, loadTypes=["top"], distanceKmTo=10))
+        self.assertTrue(compiled.matches({"id": 1}))
+
+    def test_remote_only_options_mark_filter_inexact(self):
+        self.assertFalse(compile_filter(_filters(only_partners=True)).exact)
+        self.assertFalse(compile_filter(_filters(companyName="ТОВ Вантаж")).exact)
+
+    def test_load_types_from_unknown_vocabulary_do_not_reject(self):
+        compiled = compile_filter(_filters(loadTypes=["top"]))
+        self.assertFalse(compiled.exact)
+        for load_types in ("верхнє, бічне", ["Верхнє"], ["top", "Бічне"], [], None):
+            with self.subTest(load_types=load_types):
+                self.assertTrue(compiled.matches({"id": 1, "loadTypes": load_types}))
+        self.assertFalse(compiled.matches({"id": 1, "loadTypes": ["side", "back"]}))
+
+
+LARDI_RECORDINGS_DIR = Path(__file__).resolve().parent / "fixtures" / "lardi_recorded"
+
+
+class LardiParityTests(SimpleTestCase):
+    """
+    Звірка локального matcher-а з фільтрацією Lardi на записаних відповідях (modules/lardi_parity_recorder.py).
+    Для точних фільтрів локальний результат має збігатися з результатом Lardi, для неточних - містити його.
+    """
+
+    def test_recorded_searches(self):
+        recordings = sorted(LARDI_RECORDINGS_DIR.glob("*.json"))
+        if not recordings:
+            self.skipTest("Немає записаних відповідей Lardi (див. modules/lardi_parity_recorder.py).")
+        for path in recordings:
+            with open(path, encoding="utf-8") as f:
+                recording = json.load(f)
+            proposals = recording["broad"]["proposals"]
+            broad_ids = {p.get("id") for p in proposals}
+            for search in recording["searches"]:
+                with self.subTest(recording=path.name, search=search["name"]):
+                    compiled = compile_filter(search["filter"])
+                    local_ids = {p.get("id") for p in proposals if compiled.matches(p)}
+                    # Вантажі, що з'явилися між широким і вужчим запитами, не входять у широкий пошук
+                    server_ids = set(search["ids"]) & broad_ids
+                    if compiled.exact:
+                        self.assertEqual(local_ids, server_ids)
+                    else:
+                        self.assertLessEqual(server_ids, local_ids)
+
+
+class SubscriptionIndexTests(SimpleTestCase):
+    """
+    Firehose-розподіл має давати кожному користувачу ті самі вантажі, що й його власний фільтр.
+    """
+
+    def _user(self, user_id):
+        return SimpleNamespace(id=user_id, notification_time=datetime(2025, 6, 1, 9, 0, tzinfo=timezone.utc))
+
+    def test_route_matches_per_filter_results(self):
+        proposals = SYNTHETIC_RESPONSE["result"]["proposals"]
+        users = [self._user(i) for i in range(len(SYNTHETIC_SEARCHES))]
+        filters_by_user = {
+            user.id: _filters(**overrides) for user, (_, overrides, _) in zip(users, SYNTHETIC_SEARCHES)
+        }
+        index = SubscriptionIndex.build(users, filters_by_user)
+        routed = index.route(proposals)
+
+        # Фільтр з типами завантаження неточний і обслуговується звичайним пошуком
+        self.assertEqual([u.id for u in index.fallback_users],
+                         [u.id for u in users if not compile_filter(filters_by_user[u.id]).exact])
+        self.assertEqual(set(index.origin_countries), {"UA"})
+        for user, (name, _, expected_ids) in zip(users, SYNTHETIC_SEARCHES):
+            if user in index.subscribers:
+                with self.subTest(name):
+                    self.assertEqual([p["id"] for p in routed.get(user.id, [])], expected_ids)
+
+    async def test_failed_country_keeps_its_subscribers_unserved(self):
+        class CountryClient:
+            """Клієнт, у якого firehose-запит для PL завжди завершується помилкою."""
+
+            def default_filters(self):
+                return copy.deepcopy(BASE_FILTERS)
+
+            async def get_new_offers_for_filters(self, filters, since, facts=None):
+                if filters["directionFrom"]["directionRows"][0]["countrySign"] == "PL":
+                    raise aiohttp.ClientError("firehose PL")
+                raw = SYNTHETIC_RESPONSE["result"]["proposals"]
+                if facts is not None:
+                    facts.update((p["id"], ProposalFacts(p)) for p in raw)
+                return [Proposal(p) for p in raw]
+
+        users = [self._user(1), self._user(2), self._user(3)]
+        index = SubscriptionIndex.build(users, {
+            1: _filters(),
+            2: _filters(directionFrom={"directionRows": [{"countrySign": "PL"}]}),
+            3: _filters(directionFrom={"directionRows": [{"countrySign": "UA"}, {"countrySign": "PL"}]}),
+        })
+        routed = await poll_firehose(CountryClient(), index)
+        # Лише користувач 1 обслугований повністю; 2 і 3 зберігають свій notification_time
+        self.assertEqual(set(routed), {1})
+        self.assertEqual([p.id for p in routed[1]], [101, 102, 103, 104, 105])
+
+    async def test_poll_firehose_checks_facts_collected_with_search(self):
+        users = [self._user(i) for i in range(len(SYNTHETIC_SEARCHES))]
+        filters_by_user = {
+            user.id: _filters(**overrides) for user, (_, overrides, _) in zip(users, SYNTHETIC_SEARCHES)
+        }
+        index = SubscriptionIndex.build(users, filters_by_user)
+        async with fake_lardi() as (server, _):
+            server.add_proposals(list(reversed(SYNTHETIC_RESPONSE["result"]["proposals"])))
+            routed = await poll_firehose(lardi_notification_client, index)
+
+        for user, (name, _, expected_ids) in zip(users, SYNTHETIC_SEARCHES):
+            if user in index.subscribers:
+                with self.subTest(name):
+                    self.assertEqual([p.id for p in routed[user.id]], expected_ids)
+
+    def test_inexact_any_origin_or_load_type_filters_fall_back(self):
+        users = [self._user(1), self._user(2), self._user(3)]
+        index = SubscriptionIndex.build(users, {
+            1: _filters(only_partners=True),
+            2: _filters(directionFrom={"directionRows": []}),
+            3: _filters(loadTypes=["top"]),
+        })
+        self.assertEqual([u.id for u in index.fallback_users], [1, 2, 3])
+        self.assertEqual(index.subscribers, [])
+
+
+class FakeLardiServerTests(SimpleTestCase):
+    """
+    Фейковий Lardi API має фільтрувати синтетичні вантажі так само, як локальний matcher, і розбивати їх на сторінки.
+    """
+
+    def _server(self, **kwargs):
+        server = FakeLardiServer(cargos=0, seed=1, **kwargs)
+        server.add_proposals(list(reversed(SYNTHETIC_RESPONSE["result"]["proposals"])))
+        return server
+
+    async def _search(self, server, filters, page=1, size=20):
+        async with TestClient(TestServer(server.app())) as client:
+            response = await client.post("/webapi/proposal/search/gruz/",
+                                         json={"page": page, "size": size, "filter": filters})
+            return response.status, response.headers, await response.json()
+
+    async def test_search_applies_filters_newest_first(self):
+        server = self._server()
+        for name, overrides, expected_ids in SYNTHETIC_SEARCHES:
+            with self.subTest(name):
+                _, _, data = await self._search(server, _filters(**overrides))
+                self.assertEqual([p["id"] for p in data["result"]["proposals"]], expected_ids)
+
+    async def test_search_paginates(self):
+        server = self._server()
+        _, _, first = await self._search(server, _filters(mass2=10), page=1, size=3)
+        _, _, second = await self._search(server, _filters(mass2=10), page=2, size=3)
+        self.assertEqual([p["id"] for p in first["result"]["proposals"]], [102, 103, 104])
+        self.assertEqual([p["id"] for p in second["result"]["proposals"]], [105])
+        self.assertEqual(first["result"]["paginator"]["totalSize"], 4)
+
+    async def test_error_injection(self):
+        server = self._server(error_rates={"429": 1.0}, retry_after=7)
+        status, headers, _ = await self._search(server, BASE_FILTERS)
+        self.assertEqual((status, headers["Retry-After"]), (429, "7"))
+        self.assertEqual(server.stats["429"], 1)
+
+
+@asynccontextmanager
+async def fake_lardi(**server_kwargs):
+    """
+    Фейковий Lardi API для lardi_notification_client з окремою сесією пулу.
+    Глобальний стан (сесії пулу, URL клієнта, circuit breaker, HTTP-сесія) відновлюється після тесту.
+    """
+    server = FakeLardiServer(cargos=0, seed=1, **server_kwargs)
+    base_url = await server.start(port=0)
+    session = LardiSession("test", lardi_cookie_manager, rate=100, burst=100)
+    pool_sessions, lardi_session_pool.sessions = lardi_session_pool.sessions, [session]
+    client_url, lardi_notification_client.url = lardi_notification_client.url, f"{base_url}/webapi/proposal/search/gruz/"
+    try:
+        yield server, session
+    finally:
+        lardi_notification_client.url = client_url
+        lardi_session_pool.sessions = pool_sessions
+        lardi_circuit_breaker.record_success()
+        await lardi_http_session.close()
+        await server.stop()
+        if session._recovery_task is not None:
+            session._recovery_task.cancel()
+
+
+class LardiSessionPoolTests(SimpleTestCase):
+    """
+    Сесія, що отримує 429 на кожен запит, має виключатися з ротації й на шляху сповіщень.
+    """
+
+    async def test_repeated_429_evicts_session(self):
+        async with fake_lardi(error_rates={"429": 1.0}, retry_after=0) as (server, session):
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await lardi_notification_client.get_new_offers_for_filters(
+                    BASE_FILTERS, datetime(2025, 6, 1, tzinfo=timezone.utc)
+                )
+
+        self.assertFalse(session.healthy)
+        # Одна оренда сесії на кожен фактичний запит
+        self.assertEqual(session.total_requests, server.stats["429"])
+        self.assertEqual(session.in_flight, 0)
+
+    def test_extra_accounts_are_validated(self):
+        self.assertEqual(parse_extra_accounts(""), [])
+        self.assertEqual(parse_extra_accounts('[{"username": "a", "password": "b", "name": "second"}]'),
+                         [{"username": "a", "password": "b", "name": "second"}])
+        for raw, message in (
+            ("[{'username': 'a'}]", "коректним JSON"),
+            ('{"username": "a", "password": "b"}', "JSON-списком"),
+            ('["a:b"]', "LARDI_EXTRA_ACCOUNTS[1]"),
+            ('[{"username": "a", "password": "b"}, {"username": "c"}]', "LARDI_EXTRA_ACCOUNTS[2]: відсутні або порожні ключі password"),
+            ('[{"username": "a", "password": "b", "pasword": "c"}]', "невідомі ключі pasword"),
+        ):
+            with self.subTest(raw=raw):
+                with self.assertRaisesMessage(ValueError, message):
+                    parse_extra_accounts(raw)
+
+    async def test_backoff_waits_outside_lease(self):
+        real_sleep = asyncio.sleep
+        in_flight_during_backoff = []
+
+        async def backoff_sleep(delay):
+            in_flight_during_backoff.append(session.in_flight)
+            await real_sleep(0)
+
+        async with fake_lardi(error_rates={"5xx": 1.0}) as (server, session):
+            with mock.patch("modules.lardi_api_client.asyncio.sleep", backoff_sleep):
+                with self.assertRaises(aiohttp.ClientResponseError):
+                    await lardi_notification_client.get_new_offers_for_filters(
+                        BASE_FILTERS, datetime(2025, 6, 1, tzinfo=timezone.utc)
+                    )
+
+        self.assertEqual(len(in_flight_during_backoff), server.stats["5xx"] - 1)
+        self.assertEqual(set(in_flight_during_backoff), {0})
+
+    async def test_geo_errors_reach_retry_decorator(self):
+        async with fake_lardi() as (server, session):
+            geo_client = LardiGeoClient()
+            # Фейковий сервер не має геоендпоінта: 404 має дійти до виклику, а не стати порожнім списком
+            geo_client.url = lardi_notification_client.url.replace("/webapi/proposal/search/gruz/", "/webapi/geo/")
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await geo_client.get_geo_data(query="Львів")
+        self.assertEqual(session.in_flight, 0)
+
+
+class GetAllOffersTests(SimpleTestCase):
+    """
+    Повний пошук завантажує сторінки паралельно і дає той самий результат, що й послідовний.
+    """
+
+    def _add_cargos(self, server, count):
+        now = datetime.now(timezone.utc)
+        server.add_proposals([server.generator.proposal(now - timedelta(minutes=count - i)) for i in range(count)])
+        compiled = compile_filter(BASE_FILTERS)
+        return [p["id"] for p, facts in reversed(server._proposals) if compiled.matches_facts(facts)]
+
+    async def test_concurrent_pages_match_sequential(self):
+        async with fake_lardi(latency=0.05) as (server, _):
+            expected_ids = self._add_cargos(server, 400)
+            self.assertGreater(len(expected_ids), 2 * lardi_notification_client.page_size)
+
+            started_at = time.monotonic()
+            sequential = await lardi_notification_client.get_all_offers_for_filters(BASE_FILTERS, concurrent=False)
+            sequential_elapsed = time.monotonic() - started_at
+            started_at = time.monotonic()
+            concurrent = await lardi_notification_client.get_all_offers_for_filters(BASE_FILTERS, concurrent=True)
+            concurrent_elapsed = time.monotonic() - started_at
+
+        self.assertEqual([p["id"] for p in sequential], expected_ids)
+        self.assertEqual([p["id"] for p in concurrent], expected_ids)
+        self.assertLess(concurrent_elapsed, sequential_elapsed)
+
+    async def test_page_error_cancels_other_pages(self):
+        class FailingPageClient(LardiClient):
+            started, cancelled = [], []
+
+            async def _fetch_page(self, filters, page, page_size, sort=None):
+                if page == 3:
+                    raise aiohttp.ClientResponseError(None, (), status=503)
+                if page > 3:
+                    self.started.append(page)
+                    try:
+                        await asyncio.sleep(10)
+                    except asyncio.CancelledError:
+                        self.cancelled.append(page)
+                        raise
+                return {"result": {"proposals": [{"id": page * 100 + i} for i in range(page_size)],
+                                   "paginator": {"totalPages": 6}}}
+
+        client = FailingPageClient()
+        with self.assertRaises(aiohttp.ClientResponseError):
+            await client.get_all_offers_for_filters(BASE_FILTERS, concurrent=True)
+        await asyncio.sleep(0)
+        # Сторінки, що вже виконувались, скасовано; решта так і не стартувала
+        self.assertTrue(client.started)
+        self.assertEqual(client.cancelled, client.started)
+
+
+class PagedNewOffersClient(LardiNotificationClient):
+    """Клієнт сповіщень зі сторінками пошуку з пам'яті, у заданому порядку."""
+
+    def __init__(self, pages):
+        super().__init__()
+        self.watermark_overlap = timedelta(0)
+        self.pages = pages
+        self.pages_fetched = 0
+
+    async def iter_offer_pages(self, filters, page_size=20, sort=None):
+        for page in self.pages:
+            self.pages_fetched += 1
+            yield page
+
+
+class NewOffersEarlyStopTests(SimpleTestCase):
+    """
+    Пагінація нових вантажів зупиняється на першій сторінці зі старішими за watermark вантажами,
+    але лише якщо сторінки справді відсортовані від новіших до старіших.
+    """
+
+    since = datetime(2025, 6, 1, 9, 0, tzinfo=timezone.utc)
+
+    @staticmethod
+    def _page(first_id, *times):
+        """Сторінка вантажів з ID від first_id і dateCreate 2025-06-01 о заданих годинах "HH:MM"."""
+        return [{"id": first_id + i, "dateCreate": f"2025-06-01T{t}:00+00:00"} for i, t in enumerate(times)]
+
+    async def test_sorted_pages_stop_at_watermark(self):
+        client = PagedNewOffersClient([
+            self._page(1, "09:30", "09:20", "09:10"),
+            self._page(4, "09:05", "09:00", "08:55"),
+            self._page(7, "08:50", "08:45", "08:40"),
+        ])
+        offers = await client.get_new_offers_for_filters(BASE_FILTERS, self.since)
+        self.assertEqual([offer.id for offer in offers], [1, 2, 3, 4])
+        self.assertEqual(client.pages_fetched, 2)
+
+    async def test_unsorted_page_disables_early_stop(self):
+        client = PagedNewOffersClient([
+            self._page(1, "09:30", "08:55", "09:40"),
+            self._page(4, "09:50", "09:45", "08:40"),
+            self._page(7, "08:30"),
+        ])
+        with self.assertLogs("modules.lardi_api_client", "WARNING"):
+            offers = await client.get_new_offers_for_filters(BASE_FILTERS, self.since)
+        self.assertEqual([offer.id for offer in offers], [1, 3, 4, 5])
+        self.assertEqual(client.pages_fetched, 3)
+
+
+class NotifyFilterGroupTests(SimpleTestCase):
+    """
+    notification_time групи зсувається лише після повністю завершеного пошуку.
+    """
+
+    def _group(self):
+        user = SimpleNamespace(id=9001, telegram_id=9001,
+                               notification_time=datetime(2025, 6, 1, 9, 0, tzinfo=timezone.utc))
+        self.addCleanup(notification_write_buffer.discard_user, user.id)
+        return [user]
+
+    async def test_failed_search_keeps_watermark(self):
+        group = self._group()
+        async with fake_lardi(error_rates={"429": 1.0}, retry_after=0):
+            await notify_filter_group(group, BASE_FILTERS, datetime.now(timezone.utc))
+        self.assertNotIn(9001, notification_write_buffer._notification_times)
+
+    async def test_completed_search_advances_watermark(self):
+        group = self._group()
+        tick_started_at = datetime.now(timezone.utc)
+        async with fake_lardi():
+            await notify_filter_group(group, BASE_FILTERS, tick_started_at)
+        self.assertEqual(notification_write_buffer._notification_times[9001], tick_started_at)
+
+
+class CanonicalFiltersTests(SimpleTestCase):
+    """Однакові за змістом фільтри дають однаковий payload, ключ кешу і відбиток."""
+
+    def reordered(self, filters):
+        """Ті самі фільтри з оберненим порядком ключів і елементів списків."""
+        def reverse(value):
+            if isinstance(value, dict):
+                return {key: reverse(value[key]) for key in reversed(list(value))}
+            if isinstance(value, list):
+                return [reverse(item) for item in reversed(value)]
+            return value
+        return reverse(filters)
+
+    def filters(self):
+        filters = copy.deepcopy(BASE_FILTERS)
+        filters["directionTo"] = {"directionRows": [{"countrySign": "UA"}, {"countrySign": "PL", "townId": 7}]}
+        filters["bodyTypeIds"] = [3, 1, 2]
+        filters["mass2"] = 20
+        return filters
+
+    def test_fingerprint_ignores_key_and_list_order(self):
+        filters = self.filters()
+        reordered = self.reordered(filters)
+        self.assertNotEqual(list(filters), list(reordered))
+        self.assertEqual(filter_fingerprint(filters), filter_fingerprint(reordered))
+        for codec in (json_codec, JsonCodec("json")):
+            with self.subTest(backend=codec.backend):
+                self.assertEqual(codec.canonical_dumps(codec.canonical_filters(filters)),
+                                 codec.canonical_dumps(codec.canonical_filters(reordered)))
+
+    def test_neutral_values_are_dropped(self):
+        canonical = json_codec.canonical_filters(self.filters())
+        self.assertNotIn("mass1", canonical)
+        self.assertNotIn("groupage", canonical)
+        self.assertNotIn("loadTypes", canonical)
+        self.assertEqual(canonical["bodyTypeIds"], [1, 2, 3])
+        self.assertEqual(canonical["paymentFormIds"], [2, 10])
+
+        explicit = self.filters()
+        sparse = {key: value for key, value in explicit.items() if key in canonical}
+        self.assertEqual(filter_fingerprint(explicit), filter_fingerprint(sparse))
+
+    def test_different_filters_differ(self):
+        changed = self.filters()
+        changed["mass2"] = 21
+        self.assertNotEqual(filter_fingerprint(self.filters()), filter_fingerprint(changed))
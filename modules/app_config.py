@@ -12,11 +12,107 @@ class EnvConfig:
     LARDI_USERNAME: str = os.getenv("LARDI_USERNAME", "") # Нова змінна для логіну Lardi-Trans
     LARDI_PASSWORD: str = os.getenv("LARDI_PASSWORD", "") # Нова змінна для пароля Lardi-Trans
     LARDI_LOGIN_URL: str = os.getenv("LARDI_LOGIN_URL", "")
+    LARDI_CHROME_PROFILE_DIR: str = os.getenv(
+        "LARDI_CHROME_PROFILE_DIR", r"C:\Users\artur\PycharmProjects\LardiTrans_Search\modules\profile"
+    )
 
     # Виправлено типографічну помилку в домені для всіх URL
     WEBAPP_BASE_URL: str = os.getenv("WEBAPP_BASE_URL", "https://9891-91-245-124-201.ngrok-free.app/webapp/cargo_details")
     WEBAPP_API_PROXY_URL: str = os.getenv("WEBAPP_API_PROXY_URL", "https://9891-91-245-124-201.ngrok-free.app/api/cargo_details")
 
+    # Відправка повідомлень Telegram: загальний ліміт (повідомлень на секунду), мінімальний інтервал
+    # між повідомленнями в один чат (секунди), кількість воркерів, повторів після TelegramRetryAfter
+    # і скільки секунд при зупинці бота чекати на відправку повідомлень з черги
+    TELEGRAM_GLOBAL_RATE_LIMIT: float = float(os.getenv("TELEGRAM_GLOBAL_RATE_LIMIT", "30"))
+    TELEGRAM_CHAT_INTERVAL: float = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1"))
+    TELEGRAM_SEND_WORKERS: int = int(os.getenv("TELEGRAM_SEND_WORKERS", "8"))
+    TELEGRAM_SEND_MAX_RETRIES: int = int(os.getenv("TELEGRAM_SEND_MAX_RETRIES", "5"))
+    TELEGRAM_SEND_DRAIN_TIMEOUT: float = float(os.getenv("TELEGRAM_SEND_DRAIN_TIMEOUT", "10"))
+
+    # Базова адреса Lardi-Trans API (для розробки - адреса modules.fake_lardi_server)
+    LARDI_BASE_URL: str = os.getenv("LARDI_BASE_URL", "https://lardi-trans.com").rstrip("/")
+
+    # Пул HTTP-з'єднань до Lardi-Trans API
+    LARDI_HTTP_POOL_LIMIT: int = int(os.getenv("LARDI_HTTP_POOL_LIMIT", "20"))
+    LARDI_HTTP_POOL_LIMIT_PER_HOST: int = int(os.getenv("LARDI_HTTP_POOL_LIMIT_PER_HOST", "10"))
+    LARDI_HTTP_TIMEOUT: float = float(os.getenv("LARDI_HTTP_TIMEOUT", "30"))
+
+    # JSON-бекенд ("auto" - orjson, якщо встановлено, або "json") та компактні фільтри в запитах пошуку
+    # (без ключів зі значеннями "без обмеження", зі відсортованими списками)
+    LARDI_JSON_BACKEND: str = os.getenv("LARDI_JSON_BACKEND", "auto").lower()
+    LARDI_COMPACT_FILTERS: bool = os.getenv("LARDI_COMPACT_FILTERS", "true").lower() in ("1", "true", "yes")
+
+    # Паралельне завантаження сторінок повного пошуку (get_all_offers)
+    LARDI_CONCURRENT_PAGES: bool = os.getenv("LARDI_CONCURRENT_PAGES", "true").lower() in ("1", "true", "yes")
+    LARDI_PAGE_CONCURRENCY: int = int(os.getenv("LARDI_PAGE_CONCURRENCY", "4"))
+
+    # Запас часу (сек.) нижче watermark, до якого ще гортаються сторінки нових вантажів
+    LARDI_WATERMARK_OVERLAP_SECONDS: int = int(os.getenv("LARDI_WATERMARK_OVERLAP_SECONDS", "120"))
+
+    # Режим сповіщень: "per_filter" - пошук на кожен унікальний фільтр,
+    # "firehose" - широкі запити за країнами завантаження з локальним розподілом вантажів
+    NOTIFICATION_MODE: str = os.getenv("NOTIFICATION_MODE", "per_filter")
+    # Скільки користувачів (груп з однаковим фільтром) обробляється одночасно в тіку сповіщень
+    # та максимальний час обробки одного користувача/групи (секунди)
+    NOTIFICATION_CONCURRENCY: int = int(os.getenv("NOTIFICATION_CONCURRENCY", "10"))
+    NOTIFICATION_USER_TIMEOUT: float = float(os.getenv("NOTIFICATION_USER_TIMEOUT", "120"))
+    # Максимальна кількість вантажів в одному повідомленні-дайджесті (режим дайджесту вмикає користувач)
+    NOTIFICATION_DIGEST_MAX_CARGOS: int = int(os.getenv("NOTIFICATION_DIGEST_MAX_CARGOS", "10"))
+    # Скільки днів пам'ятати надіслані користувачу вантажі та як часто видаляти старші записи (секунди)
+    NOTIFICATION_SEEN_CARGO_TTL_DAYS: float = float(os.getenv("NOTIFICATION_SEEN_CARGO_TTL_DAYS", "7"))
+    NOTIFICATION_SEEN_CARGO_PRUNE_INTERVAL: float = float(os.getenv("NOTIFICATION_SEEN_CARGO_PRUNE_INTERVAL", "3600"))
+    # Скільки надісланих вантажів на користувача тримати в пам'яті (найстаріші витісняються; у БД вони лишаються до ttl)
+    NOTIFICATION_SEEN_CARGO_MAX_PER_USER: int = int(os.getenv("NOTIFICATION_SEEN_CARGO_MAX_PER_USER", "5000"))
+    # Розмір пакета bulk_create при записі змін тіку сповіщень у БД
+    NOTIFICATION_WRITE_BATCH_SIZE: int = int(os.getenv("NOTIFICATION_WRITE_BATCH_SIZE", "1000"))
+
+    # Кеш деталей вантажу (LardiOfferClient.get_offer)
+    LARDI_OFFER_CACHE_TTL: float = float(os.getenv("LARDI_OFFER_CACHE_TTL", "60"))
+    LARDI_OFFER_CACHE_MAX_ENTRIES: int = int(os.getenv("LARDI_OFFER_CACHE_MAX_ENTRIES", "1000"))
+
+    # Спільний ліміт запитів до Lardi (token bucket)
+    LARDI_RATE_LIMIT_PER_SECOND: float = float(os.getenv("LARDI_RATE_LIMIT_PER_SECOND", "5"))
+    LARDI_RATE_BURST: int = int(os.getenv("LARDI_RATE_BURST", "10"))
+
+    # Повтори запитів до Lardi (429, 5xx, таймаути) та circuit breaker
+    LARDI_MAX_RETRIES: int = int(os.getenv("LARDI_MAX_RETRIES", "3"))
+    LARDI_BACKOFF_BASE: float = float(os.getenv("LARDI_BACKOFF_BASE", "0.5"))
+    LARDI_BACKOFF_MAX: float = float(os.getenv("LARDI_BACKOFF_MAX", "30"))
+    LARDI_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("LARDI_BREAKER_FAILURE_THRESHOLD", "5"))
+    LARDI_BREAKER_RESET_TIMEOUT: float = float(os.getenv("LARDI_BREAKER_RESET_TIMEOUT", "60"))
+
+    # Мінімальний інтервал між оновленнями Lardi cookie (секунди)
+    LARDI_COOKIE_REFRESH_MIN_INTERVAL: float = float(os.getenv("LARDI_COOKIE_REFRESH_MIN_INTERVAL", "60"))
+
+    # Спосіб оновлення cookie: "http" (passport-форма без браузера, Selenium як запасний варіант) або "selenium"
+    LARDI_COOKIE_REFRESH_STRATEGY: str = os.getenv("LARDI_COOKIE_REFRESH_STRATEGY", "http").lower()
+    LARDI_PASSPORT_FORM_URL: str = os.getenv("LARDI_PASSPORT_FORM_URL", "")  # За замовчуванням LARDI_LOGIN_URL
+    LARDI_PASSPORT_SESSION_DELETE_URL: str = os.getenv("LARDI_PASSPORT_SESSION_DELETE_URL", "")
+    LARDI_HTTP_LOGIN_TIMEOUT: float = float(os.getenv("LARDI_HTTP_LOGIN_TIMEOUT", "10"))
+
+    # Вхід через Selenium в окремому процесі та жорсткий таймаут цього процесу (секунди)
+    LARDI_COOKIE_WORKER: bool = os.getenv("LARDI_COOKIE_WORKER", "true").lower() in ("1", "true", "yes")
+    LARDI_COOKIE_WORKER_TIMEOUT: float = float(os.getenv("LARDI_COOKIE_WORKER_TIMEOUT", "180"))
+
+    # Оновлення cookie за їх часом дії: за скільки секунд до завершення дії оновлювати,
+    # максимальний інтервал між оновленнями та список критичних cookie (через кому)
+    LARDI_COOKIE_REFRESH_AHEAD: float = float(os.getenv("LARDI_COOKIE_REFRESH_AHEAD", "600"))
+    LARDI_COOKIE_MAX_REFRESH_INTERVAL: float = float(os.getenv("LARDI_COOKIE_MAX_REFRESH_INTERVAL", "7200"))
+    LARDI_CRITICAL_COOKIES: list = [
+        name.strip() for name in os.getenv("LARDI_CRITICAL_COOKIES", "").split(",") if name.strip()
+    ]
+
+    # Пул сесій Lardi: додаткові облікові записи (JSON-список {"username": ..., "password": ..., "name": ...},
+    # розбирається і перевіряється в session_pool),
+    # стратегія розподілу запитів ("round_robin" або "least_loaded"), ліміт запитів на сесію,
+    # кількість збоїв поспіль до виключення сесії та інтервал спроб її відновлення (секунди)
+    LARDI_EXTRA_ACCOUNTS: str = os.getenv("LARDI_EXTRA_ACCOUNTS", "[]")
+    LARDI_SESSION_STRATEGY: str = os.getenv("LARDI_SESSION_STRATEGY", "round_robin").lower()
+    LARDI_SESSION_RATE_LIMIT_PER_SECOND: float = float(os.getenv("LARDI_SESSION_RATE_LIMIT_PER_SECOND", "5"))
+    LARDI_SESSION_RATE_BURST: int = int(os.getenv("LARDI_SESSION_RATE_BURST", "10"))
+    LARDI_SESSION_FAILURE_THRESHOLD: int = int(os.getenv("LARDI_SESSION_FAILURE_THRESHOLD", "3"))
+    LARDI_SESSION_RECOVERY_INTERVAL: float = float(os.getenv("LARDI_SESSION_RECOVERY_INTERVAL", "300"))
+
 
 env_config = EnvConfig()
 
@@ -76,6 +172,10 @@ class SettingsManager:
         "text_button_notifications_disable": "❌ Вимкнути сповіщення",
         "text_notifications_toggle_success_enabled": "✅ Сповіщення успішно увімкнено!",
         "text_notifications_toggle_success_disabled": "❌ Сповіщення успішно вимкнено!",
+        "text_button_digest_enabled": "📰 Дайджест: Увімкнено",
+        "text_button_digest_disabled": "📰 Дайджест: Вимкнено",
+        "text_digest_toggle_success_enabled": "📰 Нові вантажі надходитимуть одним повідомленням-дайджестом.",
+        "text_digest_toggle_success_disabled": "📰 Кожен новий вантаж надходитиме окремим повідомленням.",
 
         "text_notification_new_cargo": (
             "🚛 Новий вантаж\\! ID: *{cargo_id}*\n"
@@ -94,6 +194,13 @@ class SettingsManager:
             "{repeated}"
         ),
 
+        # Дайджест: кілька вантажів в одному повідомленні (MarkdownV2, значення вже екрановані)
+        "text_notification_digest_header": "🚛 Нові вантажі: *{count}*\n\n",
+        "text_notification_digest_line": (
+            "{index}\\. *{from_town}* \\({from_countrySign}\\) → *{to_town}* \\({to_countrySign}\\)\n"
+            "📦 {gruzName} \\| ⚖️ {gruzMass} \\| 💰 {payment} \\| 🕒 {dateFrom}\n\n"
+        ),
+
         "text_directions_menu": "Оберіть напрямок:",
         "text_select_country_from": "Оберіть країну відправлення:",
         "text_select_country_to": "Оберіть країну призначення",
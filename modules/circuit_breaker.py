@@ -0,0 +1,110 @@
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from modules.app_config import env_config
+
+logger = logging.getLogger(__name__)
+
+
+class LardiCircuitOpenError(aiohttp.ClientError):
+    """
+    Запит до Lardi не виконано, бо circuit breaker розімкнений.
+    Успадковується від aiohttp.ClientError, тож наявні обробники мережевих помилок
+    обробляють його як недоступність API.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker для Lardi-Trans API.
+
+    closed    - запити проходять, послідовні збої (429, 5xx, таймаути) рахуються;
+    open      - після failure_threshold збоїв поспіль запити відхиляються без звернення до API
+                протягом reset_timeout секунд;
+    half_open - після reset_timeout пропускається один пробний запит: успіх замикає breaker,
+                збій знову розмикає його.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_started_at: Optional[float] = None
+        self.total_failures = 0
+        self.total_rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_started_at = None
+            logger.info("Circuit breaker Lardi: half_open, пропускаємо пробний запит.")
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """True, якщо запити зараз відхиляються (пробний запит у half_open вважається дозволеним)."""
+        return self.state == self.OPEN
+
+    def before_request(self):
+        """Кидає LardiCircuitOpenError, якщо запит не можна виконувати."""
+        state = self.state
+        if state == self.CLOSED:
+            return
+        # Пробний запит, що так і не завершився (наприклад, скасований), не блокує breaker назавжди
+        if state == self.HALF_OPEN and (self._trial_started_at is None
+                                        or time.monotonic() - self._trial_started_at >= self.reset_timeout):
+            self._trial_started_at = time.monotonic()
+            return
+        self.total_rejected += 1
+        raise LardiCircuitOpenError("Lardi API тимчасово недоступний (circuit breaker розімкнений).")
+
+    def record_success(self):
+        if self._state != self.CLOSED:
+            logger.info("Circuit breaker Lardi: closed, API знову відповідає.")
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._trial_started_at = None
+
+    def record_failure(self):
+        self.total_failures += 1
+        self._consecutive_failures += 1
+        if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(
+                    f"Circuit breaker Lardi: open на {self.reset_timeout} с після "
+                    f"{self._consecutive_failures} збоїв поспіль."
+                )
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._trial_started_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Стан breaker-а для логів і моніторингу."""
+        state = self.state
+        return {
+            "state": state,
+            "consecutive_failures": self._consecutive_failures,
+            "total_failures": self.total_failures,
+            "total_rejected": self.total_rejected,
+            "times_opened": self.times_opened,
+            "retry_in": round(max(self.reset_timeout - (time.monotonic() - self._opened_at), 0), 1)
+            if state == self.OPEN else 0,
+        }
+
+
+lardi_circuit_breaker = CircuitBreaker(
+    failure_threshold=env_config.LARDI_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=env_config.LARDI_BREAKER_RESET_TIMEOUT,
+)
@@ -1,17 +1,29 @@
+import asyncio
 import json
 import os
 import logging
+import signal
+import subprocess
+import sys
 import time  # Для пауз
+from typing import Any, Dict, List, Optional
+
+import aiohttp
 import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, WebDriverException
+from asgiref.sync import sync_to_async
 
 from modules.app_config import env_config
+from modules.http_login import LardiHttpLogin, LardiInvalidCredentialsError
+from modules.http_session import lardi_http_session
 
 logger = logging.getLogger(__name__)
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 class CookieManager:
     """
@@ -19,15 +31,53 @@ class CookieManager:
     Використовує Selenium для автоматизованого входу та отримання cookie.
     """
 
-    def __init__(self, cookies_file='cookies.json'):
+    def __init__(self, cookies_file='cookies.json', username: Optional[str] = None, password: Optional[str] = None,
+                 chrome_profile_dir: Optional[str] = None):
         self.cookies_file = cookies_file
-        self.cookies = self._load_cookies()
+        # Cookie тримаються в пам'яті; файл перечитується лише коли змінюється його mtime/розмір
+        self.version = 0
+        self._file_signature = None
+        self._cookie_string = ""
+        self.cookies = {}
+        # Час завершення дії cookie (UNIX-час) зберігається поруч із файлом cookie
+        self.expiry_file = os.path.splitext(cookies_file)[0] + ".expiry.json"
+        self.cookie_expiry: Dict[str, float] = {}
+        self._reload_if_changed()
+        # Одночасно виконується не більше одного оновлення cookie (single-flight)
+        self.refresh_min_interval = env_config.LARDI_COOKIE_REFRESH_MIN_INTERVAL
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._last_refresh_at: Optional[float] = None
+        self._last_refresh_result = False
         # Змінений URL сторінки входу, як вказано користувачем
         self.login_url = env_config.LARDI_LOGIN_URL
-        self.username = env_config.LARDI_USERNAME
-        self.password = env_config.LARDI_PASSWORD
+        self.username = username or env_config.LARDI_USERNAME
+        self.password = password or env_config.LARDI_PASSWORD
+        # Кожен обліковий запис потребує окремого профілю Chrome
+        self.chrome_profile_dir = chrome_profile_dir or env_config.LARDI_CHROME_PROFILE_DIR
+
+        self.authenticated_page_url = f"{env_config.LARDI_BASE_URL}/log/search/gruz/"
 
-        self.authenticated_page_url = "https://lardi-trans.com/log/search/gruz/"
+        # "http" - вхід через passport-форму без браузера, Selenium лише як запасний варіант;
+        # "selenium" - завжди через браузер
+        self.refresh_strategy = env_config.LARDI_COOKIE_REFRESH_STRATEGY
+        self.http_login = LardiHttpLogin(
+            login_url=self.login_url,
+            authenticated_page_url=self.authenticated_page_url,
+            username=self.username,
+            password=self.password,
+            form_url=env_config.LARDI_PASSPORT_FORM_URL,
+            session_delete_url=env_config.LARDI_PASSPORT_SESSION_DELETE_URL,
+            timeout=env_config.LARDI_HTTP_LOGIN_TIMEOUT,
+        )
+        # Selenium запускається в окремому процесі з жорстким таймаутом
+        self.use_refresh_worker = env_config.LARDI_COOKIE_WORKER
+        self.refresh_worker_timeout = env_config.LARDI_COOKIE_WORKER_TIMEOUT
+        self.refresh_worker_command = [sys.executable, "-m", "modules.cookie_refresh_worker"]
+
+        # Планування оновлення за часом завершення дії критичних cookie
+        self.critical_cookies = set(env_config.LARDI_CRITICAL_COOKIES)
+        self.refresh_ahead = env_config.LARDI_COOKIE_REFRESH_AHEAD
+        self.max_refresh_interval = env_config.LARDI_COOKIE_MAX_REFRESH_INTERVAL
 
     def _load_cookies(self) -> dict:
         """Завантажує cookie з файлу JSON."""
@@ -46,6 +96,113 @@ class CookieManager:
         logger.info(f"Файл cookie {self.cookies_file} не знайдено. Почнемо з порожніх cookie.")
         return {}
 
+    def _get_file_signature(self):
+        """Повертає (mtime_ns, size) файлу cookie або None, якщо файлу немає."""
+        try:
+            stat = os.stat(self.cookies_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _set_cookies_in_memory(self, cookies: dict):
+        """Замінює cookie в пам'яті, збільшує версію та заздалегідь формує рядок заголовка."""
+        self.cookies = cookies
+        self._cookie_string = "; ".join([f"{key}={value}" for key, value in cookies.items()])
+        self.version += 1
+
+    def _reload_if_changed(self):
+        """Перечитує файл cookie, лише якщо він змінився з моменту останнього читання або запису."""
+        signature = self._get_file_signature()
+        if signature == self._file_signature and self.version:
+            return
+        self._file_signature = signature
+        self.cookie_expiry = self._load_expiry()
+        self._set_cookies_in_memory(self._load_cookies())
+
+    def _load_expiry(self) -> Dict[str, float]:
+        """Завантажує час завершення дії cookie; відсутній або пошкоджений файл означає "невідомо"."""
+        try:
+            with open(self.expiry_file, 'r', encoding='utf-8') as f:
+                return {name: float(expiry) for name, expiry in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except (ValueError, TypeError, AttributeError, OSError) as e:
+            logger.warning(f"Не вдалося завантажити час дії cookie з {self.expiry_file}: {e}")
+            return {}
+
+    def _store_new_cookies(self, browser_cookies: List[Dict[str, Any]]):
+        """
+        Зберігає cookie, отримані після входу, у форматі driver.get_cookies():
+        значення додаються до поточних cookie, а поле expiry - до часу завершення їх дії.
+        Cookie без expiry є сесійними, тож для них час завершення невідомий.
+        """
+        for cookie in browser_cookies:
+            self.cookies[cookie['name']] = cookie['value']
+            if cookie.get('expiry'):
+                self.cookie_expiry[cookie['name']] = float(cookie['expiry'])
+            else:
+                self.cookie_expiry.pop(cookie['name'], None)
+        try:
+            with open(self.expiry_file, 'w', encoding='utf-8') as f:
+                json.dump(self.cookie_expiry, f, indent=4)
+        except Exception as e:
+            logger.error(f"Не вдалося зберегти час дії cookie у {self.expiry_file}: {e}")
+        self._save_cookies()
+
+    def _is_critical(self, name: str) -> bool:
+        """
+        Критичні cookie визначають момент оновлення. Якщо LARDI_CRITICAL_COOKIES не задано,
+        критичними вважаються всі cookie, крім аналітичних (_ga, _gid, _fbp тощо, з префіксом '_').
+        """
+        if self.critical_cookies:
+            return name in self.critical_cookies
+        return not name.startswith('_')
+
+    def earliest_critical_expiry(self) -> Optional[float]:
+        """Найближчий час завершення дії критичного cookie (UNIX-час) або None, якщо він невідомий."""
+        self._reload_if_changed()
+        expiries = [
+            expiry for name, expiry in self.cookie_expiry.items()
+            if name in self.cookies and self._is_critical(name)
+        ]
+        return min(expiries) if expiries else None
+
+    def seconds_until_refresh(self) -> float:
+        """
+        Через скільки секунд варто оновити cookie: за refresh_ahead секунд до завершення дії
+        найближчого критичного cookie, але не рідше, ніж раз на max_refresh_interval,
+        і не частіше, ніж дозволяє refresh_min_interval.
+        """
+        expiry = self.earliest_critical_expiry()
+        if expiry is None:
+            return self.max_refresh_interval
+        delay = expiry - time.time() - self.refresh_ahead
+        return min(max(delay, self.refresh_min_interval), self.max_refresh_interval)
+
+    async def validate_cookies(self) -> bool:
+        """
+        Дешева перевірка, чи дійсні поточні cookie: критичні cookie ще не завершили дію,
+        а сторінка пошуку відкривається без перенаправлення на вхід.
+        """
+        if not self.get_cookie_string():
+            return False
+        expiry = self.earliest_critical_expiry()
+        if expiry is not None and expiry <= time.time():
+            logger.info("Критичні cookie Lardi-Trans вже завершили дію.")
+            return False
+        session = await lardi_http_session.get_session()
+        try:
+            async with session.get(
+                self.authenticated_page_url,
+                headers={"cookie": self.get_cookie_string()},
+                allow_redirects=False,
+                timeout=aiohttp.ClientTimeout(total=10),
+            ) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Не вдалося перевірити cookie Lardi-Trans: {e!r}")
+            return False
+
     def _save_cookies(self):
         """Зберігає поточні cookie у файл JSON."""
         try:
@@ -54,11 +211,166 @@ class CookieManager:
             logger.info(f"Cookie збережено у {self.cookies_file}")
         except Exception as e:
             logger.error(f"Не вдалося зберегти cookie у {self.cookies_file}: {e}")
+        # Власний запис не повинен спричиняти повторне читання файлу
+        self._file_signature = self._get_file_signature()
+        self._set_cookies_in_memory(self.cookies)
 
     def get_cookie_string(self) -> str:
-        """Повертає cookie у форматі рядка для заголовка 'Cookie'."""
-        self.cookies = self._load_cookies()
-        return "; ".join([f"{key}={value}" for key, value in self.cookies.items()])
+        """
+        Повертає cookie у форматі рядка для заголовка 'Cookie'.
+        Рядок формується один раз на версію cookie; файл перечитується лише якщо його змінили
+        (наприклад, інший екземпляр CookieManager після оновлення).
+        """
+        self._reload_if_changed()
+        return self._cookie_string
+
+    async def refresh_lardi_cookies_async(self, stale_version: Optional[int] = None) -> bool:
+        """
+        Асинхронне оновлення cookie з об'єднанням паралельних викликів.
+        Якщо оновлення вже виконується, виклик чекає на його результат замість запуску ще одного браузера.
+        stale_version - версія cookie, з якою запит отримав 401: якщо cookie вже оновлено після неї,
+        повторне оновлення не потрібне. Оновлення не запускаються частіше, ніж раз на refresh_min_interval секунд.
+        """
+        if self._refresh_task is not None:
+            return await asyncio.shield(self._refresh_task)
+
+        self._reload_if_changed()
+        if stale_version is not None and self.version != stale_version:
+            logger.info("Cookie вже оновлено іншим запитом. Повторне оновлення не потрібне.")
+            return True
+
+        if self._last_refresh_at is not None:
+            since_last = time.monotonic() - self._last_refresh_at
+            if since_last < self.refresh_min_interval:
+                logger.warning(
+                    f"Останнє оновлення cookie було {since_last:.0f} с тому "
+                    f"(мінімальний інтервал {self.refresh_min_interval} с). Нове оновлення не запускаємо."
+                )
+                return self._last_refresh_result
+
+        # Оновлення живе в окремій задачі, тож скасування одного з тих, хто чекає, не скасовує інших
+        self._refresh_task = asyncio.ensure_future(self._run_refresh())
+        return await asyncio.shield(self._refresh_task)
+
+    async def refresh_lardi_cookies_http(self) -> Optional[bool]:
+        """
+        Оновлює cookie входом по HTTP без браузера.
+        Повертає True при успіху, False для невірних облікових даних
+        і None, якщо вхід по HTTP не вдався і варто спробувати Selenium.
+        """
+        try:
+            new_cookies = await self.http_login.login()
+        except LardiInvalidCredentialsError as e:
+            logger.error(str(e))
+            return False
+        if not new_cookies:
+            return None
+        self._store_new_cookies(new_cookies)
+        logger.info("Cookie Lardi-Trans успішно оновлено входом по HTTP.")
+        return True
+
+    async def _refresh_cookies(self) -> bool:
+        """Оновлює cookie згідно з refresh_strategy: спочатку по HTTP, за потреби через Selenium."""
+        if self.refresh_strategy == "http":
+            result = await self.refresh_lardi_cookies_http()
+            if result is not None:
+                return result
+            logger.warning("Вхід по HTTP не вдався. Оновлюємо cookie через Selenium.")
+        if self.use_refresh_worker:
+            return await self.refresh_lardi_cookies_in_worker()
+        # Окремий потік, а не thread-sensitive виконавець, щоб браузер не блокував запити до БД
+        return await sync_to_async(self.refresh_lardi_cookies, thread_sensitive=False)()
+
+    @staticmethod
+    def _kill_worker(process: asyncio.subprocess.Process):
+        """
+        Примусово завершує процес оновлення разом із дочірніми процесами браузера:
+        на Windows - деревом процесів через taskkill /T, інакше - групою процесів (start_new_session).
+        """
+        if process.returncode is not None:
+            return
+        try:
+            if os.name == "nt":
+                # start_new_session і killpg на Windows не працюють: без /T Chrome лишився б запущеним
+                completed = subprocess.run(["taskkill", "/T", "/F", "/PID", str(process.pid)],
+                                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+                if completed.returncode != 0:
+                    process.kill()
+            elif hasattr(os, "killpg"):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except (ProcessLookupError, OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Не вдалося примусово завершити процес оновлення cookie (pid={process.pid}): {e!r}")
+
+    @staticmethod
+    def _parse_worker_output(stdout: bytes) -> Optional[List[Dict[str, Any]]]:
+        """
+        Розбирає відповідь процесу оновлення: останній непорожній рядок stdout - JSON {"cookies": [...]}.
+        Повертає список cookie або None, якщо процес не повернув cookie чи відповідь некоректна.
+        """
+        lines = [line for line in stdout.decode("utf-8", errors="replace").splitlines() if line.strip()]
+        if not lines:
+            return None
+        try:
+            cookies = json.loads(lines[-1]).get("cookies")
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Не вдалося розібрати відповідь процесу оновлення cookie: {e}")
+            return None
+        return cookies if isinstance(cookies, list) and cookies else None
+
+    async def refresh_lardi_cookies_in_worker(self) -> bool:
+        """
+        Виконує вхід через Selenium в окремому процесі (modules.cookie_refresh_worker)
+        і приймає cookie з його stdout. Якщо процес не вкладається в refresh_worker_timeout секунд,
+        він примусово завершується. Процес бота при цьому не блокується.
+        """
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [PROJECT_ROOT, env.get("PYTHONPATH")]))
+        # Процес входить від імені облікового запису цього CookieManager
+        env["LARDI_USERNAME"] = self.username
+        env["LARDI_PASSWORD"] = self.password
+        env["LARDI_CHROME_PROFILE_DIR"] = self.chrome_profile_dir
+        process = await asyncio.create_subprocess_exec(
+            *self.refresh_worker_command,
+            stdout=asyncio.subprocess.PIPE,
+            env=env,
+            start_new_session=True,  # Окрема група процесів, щоб завершити і Chrome
+        )
+        logger.info(f"Запущено процес оновлення cookie (pid={process.pid}).")
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=self.refresh_worker_timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                f"Процес оновлення cookie не завершився за {self.refresh_worker_timeout} с. Примусово завершуємо."
+            )
+            return False
+        finally:
+            self._kill_worker(process)
+            if process.returncode is None:
+                await process.wait()
+
+        new_cookies = self._parse_worker_output(stdout)
+        if not new_cookies:
+            logger.error(f"Процес оновлення cookie не повернув cookie (код завершення {process.returncode}).")
+            return False
+
+        self._store_new_cookies(new_cookies)
+        logger.info("Cookie Lardi-Trans успішно оновлено в окремому процесі.")
+        return True
+
+    async def _run_refresh(self) -> bool:
+        """Виконує одне оновлення cookie та запам'ятовує його час і результат."""
+        try:
+            result = await self._refresh_cookies()
+        except Exception as e:
+            logger.error(f"Помилка під час оновлення cookie: {e}")
+            result = False
+        finally:
+            self._last_refresh_at = time.monotonic()
+            self._refresh_task = None
+        self._last_refresh_result = bool(result)
+        return self._last_refresh_result
 
     def _handle_session_limit_modal(self, driver) -> bool:
         """
@@ -90,12 +402,24 @@ class CookieManager:
 
     def refresh_lardi_cookies(self) -> bool:
         """
-        Виконує вхід на Lardi-Trans за допомогою Selenium для отримання нових cookie.
+        Виконує вхід на Lardi-Trans за допомогою Selenium у поточному процесі та зберігає нові cookie.
         Повертає True, якщо оновлення успішне, False - якщо ні.
         """
+        new_cookies = self.login_with_selenium()
+        if not new_cookies:
+            return False
+        self._store_new_cookies(new_cookies)
+        return True
+
+    def login_with_selenium(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Виконує вхід на Lardi-Trans за допомогою Selenium і повертає cookie браузера у форматі
+        driver.get_cookies() (name, value, expiry, ...), або None, якщо вхід не вдався.
+        Нічого не зберігає - цим займається той, хто викликає.
+        """
         if not self.username or not self.password:
             logger.error("Логін або пароль Lardi-Trans не налаштовані в .env. Неможливо оновити cookie автоматично.")
-            return False
+            return None
 
         driver = None
         try:
@@ -109,7 +433,7 @@ class CookieManager:
             options.add_argument("--disable-infobars")
             options.add_argument("--disable-blink-features=AutomationControlled")
 
-            options.add_argument(r"--user-data-dir=C:\Users\artur\PycharmProjects\LardiTrans_Search\modules\profile")
+            options.add_argument(f"--user-data-dir={self.chrome_profile_dir}")
             logger.info("Запуск Undetected ChromeDriver...")
 
             driver = uc.Chrome(options=options)
@@ -130,15 +454,9 @@ class CookieManager:
             if self.login_url not in driver.current_url:
                 logger.info("Браузер, схоже, вже авторизований. Копіюємо cookie")
                 all_browser_cookies = driver.get_cookies()
-                new_cookies = {}
-                for cookie in all_browser_cookies:
-                    new_cookies[cookie['name']] = cookie['value']
-
-                if new_cookies:
-                    self.cookies.update(new_cookies)
-                    self._save_cookies()
-                    logger.info("Cookie Lardi-Trans успішно оновлено (перезавантажено з вже авторизованої сторінки).")
-                    return True
+                if all_browser_cookies:
+                    logger.info("Cookie Lardi-Trans отримано з вже авторизованої сторінки.")
+                    return all_browser_cookies
                 else:
                     logger.warning("Після перевірки авторизації не отримано нових cookie. Спроба авторизуватись.")
 
@@ -192,37 +510,31 @@ class CookieManager:
             if self.login_url in driver.current_url:
                 if "Неправильный логин или пароль" in driver.page_source or "Incorrect login or password" in driver.page_source:
                     logger.error("Вхід не вдався: невірний логін або пароль.")
-                    return False
+                    return None
                 logger.error("Вхід не вдався: залишилися на сторінці входу без явного повідомлення про помилку.")
-                input("СТОП: Вхід не вдався: залишилися на сторінці входу без явного повідомлення про помилку.")
-                return False
+                return None
 
             all_browser_cookies = driver.get_cookies()
-            new_cookies = {}
-            for cookie in all_browser_cookies:
-                new_cookies[cookie['name']] = cookie['value']
-
-            if new_cookies:
-                self.cookies.update(new_cookies)
-                self._save_cookies()
-                logger.info("Cookie Lardi-Trans успішно оновлено за допомогою Selenium.")
-                return True
+            if all_browser_cookies:
+                logger.info("Cookie Lardi-Trans успішно отримано за допомогою Selenium.")
+                return all_browser_cookies
             else:
                 logger.error("Після входу через Selenium не отримано нових cookie. Можливо, вхід не вдався.")
-                return False
+                return None
 
         except TimeoutException:
             logger.error("Таймаут очікування елементів або завантаження сторінки під час входу через Selenium.")
-            input("СТОП: Таймаут очікування елементів або завантаження сторінки під час входу через Selenium.")
-            return False
+            return None
         except WebDriverException as e:
             logger.error(f"Помилка WebDriver під час входу через Selenium: {e}")
-            return False
+            return None
         except Exception as e:
             logger.error(f"Непередбачена помилка під час оновлення cookie через Selenium: {e}")
-            return False
+            return None
         finally:
             if driver:
                 logger.info("Закриття браузера Selenium.")
                 driver.quit()
 
+
+lardi_cookie_manager = CookieManager()
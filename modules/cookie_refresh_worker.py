@@ -0,0 +1,38 @@
+"""
+Окремий процес для входу на Lardi-Trans через Selenium.
+
+Запускається з CookieManager командою `python -m modules.cookie_refresh_worker`.
+Результат передається батьківському процесу одним JSON-рядком у stdout:
+{"cookies": [{"name": ..., "value": ..., "expiry": ...}, ...]} у форматі driver.get_cookies()
+або {"cookies": null}, якщо вхід не вдався.
+Усе інше, що пишуть логи, Selenium чи chromedriver, іде у stderr.
+"""
+import json
+import logging
+import os
+import sys
+
+
+def main() -> int:
+    # Зберігаємо справжній stdout для результату, а все інше перенаправляємо у stderr,
+    # щоб сторонній вивід не зіпсував відповідь
+    result_stream = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO,
+        format="%(asctime)s - cookie-worker - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    from modules.cookie_manager import lardi_cookie_manager
+
+    cookies = lardi_cookie_manager.login_with_selenium()
+    result_stream.write(json.dumps({"cookies": cookies}, ensure_ascii=False))
+    result_stream.flush()
+    return 0 if cookies else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
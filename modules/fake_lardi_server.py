@@ -0,0 +1,331 @@
+"""
+Локальна заміна Lardi-Trans API для розробки, навантажувальних тестів і бенчмарків.
+
+Імітує ендпоінти, які використовують клієнти з modules.lardi_api_client:
+- POST /webapi/proposal/search/gruz/ - пошук з пагінацією, фільтрацією та сортуванням;
+- GET  /webapi/proposal/offer/gruz/{id}/awaiting/ - деталі вантажу;
+- GET  /webapi/geo/region-area-town/ - пошук міст і регіонів;
+- GET  /log/search/gruz/ - сторінка для перевірки cookie (CookieManager.validate_cookies).
+GET /_fake/stats повертає лічильники запитів та згенерованих помилок.
+
+Запуск: python -m modules.fake_lardi_server --port 8090 --cargos 2000 --latency 0.05 --error-429 0.02
+та LARDI_BASE_URL=http://127.0.0.1:8090 для бота.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from modules.filter_matcher import ProposalFacts, compile_filter
+from modules.json_codec import json_codec
+
+logger = logging.getLogger(__name__)
+
+# (countrySign, regionId, назва регіону, townId, назва міста)
+TOWNS: Tuple[Tuple[str, int, str, int, str], ...] = (
+    ("UA", 23, "Київська обл.", 1001, "Київ"),
+    ("UA", 14, "Львівська обл.", 2001, "Львів"),
+    ("UA", 16, "Одеська обл.", 3001, "Одеса"),
+    ("UA", 4, "Дніпропетровська обл.", 4001, "Дніпро"),
+    ("UA", 21, "Харківська обл.", 5001, "Харків"),
+    ("UA", 26, "Вінницька обл.", 6001, "Вінниця"),
+    ("UA", 8, "Запорізька обл.", 7001, "Запоріжжя"),
+    ("UA", 24, "Волинська обл.", 8001, "Луцьк"),
+    ("PL", 101, "Мазовецьке воєв.", 9001, "Варшава"),
+    ("PL", 102, "Малопольське воєв.", 9002, "Краків"),
+    ("PL", 103, "Люблінське воєв.", 9003, "Люблін"),
+    ("DE", 201, "Берлін", 9101, "Берлін"),
+    ("DE", 202, "Баварія", 9102, "Мюнхен"),
+    ("LT", 301, "Вільнюський повіт", 9201, "Вільнюс"),
+    ("RO", 401, "Бухарест", 9301, "Бухарест"),
+    ("MD", 501, "Кишинів", 9401, "Кишинів"),
+    ("CZ", 601, "Прага", 9501, "Прага"),
+)
+CARGO_NAMES = ("Зерно", "Будматеріали", "Металопрокат", "Продукти", "Меблі", "Добрива", "Тара", "Обладнання",
+               "Лісоматеріали", "Напої", "Папір", "Побутова техніка")
+LOAD_TYPES = ("top", "side", "back", "tail_lift", "tent_off")
+PAYMENT_FORMS = ((2, "Готівка"), (4, "Безготівковий"), (10, "Картка"), (8, "Комбінована"))
+BODY_TYPE_IDS = (1, 2, 3, 5, 8, 34)
+
+
+def _iso(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.000+00:00")
+
+
+class CargoGenerator:
+    """
+    Генератор правдоподібних вантажів у форматі відповіді пошуку Lardi.
+    З однаковим seed генерує однакову послідовність.
+    """
+
+    def __init__(self, seed: Optional[int] = None, start_id: int = 200000000):
+        self.random = random.Random(seed)
+        self._next_id = start_id
+
+    def _waypoint(self, town: Tuple[str, int, str, int, str]) -> Dict[str, Any]:
+        country, region_id, region, town_id, town_name = town
+        return {
+            "countrySign": country, "regionId": region_id, "region": region, "townId": town_id, "town": town_name,
+            "address": f"вул. {self.random.choice(('Шевченка', 'Промислова', 'Складська', 'Центральна'))}, "
+                       f"{self.random.randint(1, 120)}",
+        }
+
+    def proposal(self, created: datetime) -> Dict[str, Any]:
+        """Один вантаж, створений у момент created (UTC)."""
+        rng = self.random
+        self._next_id += rng.randint(1, 7)
+        source, target = rng.sample(TOWNS, 2)
+        mass = rng.choice((1.5, 5, 10, 20, 22))
+        date_from = (created + timedelta(days=rng.randint(0, 3))).replace(hour=0, minute=0, second=0, microsecond=0)
+        payment_value = rng.choice((None, rng.randrange(5000, 60000, 500)))
+        payment_forms = rng.sample(PAYMENT_FORMS, rng.randint(1, 2))
+        return {
+            "id": self._next_id,
+            "status": "ACTIVE",
+            "dateCreate": _iso(created),
+            "dateEdit": _iso(created),
+            "dateFrom": _iso(date_from),
+            "dateTo": _iso(date_from + timedelta(days=rng.randint(0, 5))),
+            "waypointListSource": [self._waypoint(source)],
+            "waypointListTarget": [self._waypoint(target)],
+            "gruzName": rng.choice(CARGO_NAMES),
+            "gruzMass": f"{mass:g} т",
+            "gruzVolume": f"{rng.choice((20, 40, 86, 92, 120))} м³",
+            "bodyTypeId": rng.choice(BODY_TYPE_IDS),
+            "loadTypes": rng.sample(LOAD_TYPES, rng.randint(1, 3)),
+            "payment": f"{payment_value} грн" if payment_value else "Запит ставки",
+            "paymentValue": payment_value,
+            "paymentForms": [{"id": form_id, "name": name} for form_id, name in payment_forms],
+            "distance": rng.randint(50, 1800) * 1000,
+            "repeated": rng.random() < 0.1,
+            "groupage": rng.random() < 0.2,
+            "photos": rng.random() < 0.3,
+        }
+
+    def batch(self, count: int, now: datetime, spread: timedelta) -> List[Dict[str, Any]]:
+        """count вантажів, створених рівномірно за період spread до now, від найстаріших до найновіших."""
+        step = spread / max(count, 1)
+        return [self.proposal(now - spread + step * (index + 1)) for index in range(count)]
+
+    @staticmethod
+    def offer(proposal: Dict[str, Any]) -> Dict[str, Any]:
+        """Відповідь /webapi/proposal/offer/gruz/{id}/awaiting/ для вантажу зі списку пошуку."""
+        cargo = dict(proposal)
+        cargo["waypointListSource"] = [_detail_waypoint(waypoint) for waypoint in proposal["waypointListSource"]]
+        cargo["waypointListTarget"] = [_detail_waypoint(waypoint) for waypoint in proposal["waypointListTarget"]]
+        cargo["gruzMass1"] = proposal["gruzMass"]
+        cargo["gruzVolume1"] = proposal["gruzVolume"]
+        cargo["proposalUser"] = {"contact": {
+            "face": "Диспетчер", "name": f"ТОВ Вантаж-{proposal['id'] % 1000}",
+            "phoneItem1": {"phone": f"+38067{proposal['id'] % 10000000:07d}"}, "phoneItem2": {},
+        }}
+        return {"cargo": cargo}
+
+
+def _detail_waypoint(waypoint: Dict[str, Any]) -> Dict[str, Any]:
+    detail = dict(waypoint)
+    detail["townName"] = waypoint["town"]
+    detail["townFullName"] = f"{waypoint['town']}, {waypoint['region']}, {waypoint['countrySign']}"
+    return detail
+
+
+class FakeLardiServer:
+    """
+    Фейковий Lardi-Trans API на aiohttp.
+
+    latency/jitter - затримка кожної відповіді API (секунди, jitter додається випадково від 0 до jitter);
+    error_rates - ймовірності помилок для /webapi/: {"401": ..., "429": ..., "5xx": ..., "timeout": ...};
+    timeout_delay - скільки "зависає" запит із помилкою timeout (має бути більше за таймаут клієнта);
+    new_per_minute - скільки нових вантажів з'являється щохвилини (для перевірки сповіщень);
+    require_cookie - відповідати 401 на запити без заголовка Cookie.
+    """
+
+    def __init__(self, cargos: int = 1000, seed: Optional[int] = None, latency: float = 0.0, jitter: float = 0.0,
+                 error_rates: Optional[Dict[str, float]] = None, timeout_delay: float = 60,
+                 retry_after: int = 1, new_per_minute: float = 0, require_cookie: bool = False):
+        self.generator = CargoGenerator(seed)
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rates = dict(error_rates or {})
+        self.timeout_delay = timeout_delay
+        self.retry_after = retry_after
+        self.new_per_minute = new_per_minute
+        self.require_cookie = require_cookie
+        self.stats = Counter()
+        # Вантажі від найстаріших до найновіших разом із розібраними для фільтрації фактами
+        self._proposals: List[Tuple[Dict[str, Any], ProposalFacts]] = []
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self.add_proposals(self.generator.batch(cargos, datetime.now(timezone.utc), timedelta(hours=24)))
+        self._last_arrival = time.monotonic()
+        self._runner: Optional[web.AppRunner] = None
+
+    def add_proposals(self, proposals: List[Dict[str, Any]]):
+        """Додає вантажі (від найстаріших до найновіших), наприклад підготовлені тестом."""
+        for proposal in proposals:
+            self._proposals.append((proposal, ProposalFacts(proposal)))
+            self._by_id[proposal["id"]] = proposal
+
+    def _generate_arrivals(self):
+        """Додає вантажі, що "з'явилися" з часу попереднього запиту, з темпом new_per_minute."""
+        if not self.new_per_minute:
+            return
+        now = time.monotonic()
+        count = int((now - self._last_arrival) * self.new_per_minute / 60)
+        if count:
+            self._last_arrival = now
+            self.add_proposals([self.generator.proposal(datetime.now(timezone.utc)) for _ in range(count)])
+
+    def _pick_error(self) -> Optional[str]:
+        roll = self.random.random()
+        for error in ("401", "429", "5xx", "timeout"):
+            roll -= self.error_rates.get(error, 0)
+            if roll < 0:
+                return error
+        return None
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        """Затримка, перевірка cookie та ін'єкція помилок для ендпоінтів /webapi/."""
+        if not request.path.startswith("/webapi/"):
+            return await handler(request)
+        self.stats["requests"] += 1
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.require_cookie and not request.headers.get("Cookie"):
+            self.stats["401"] += 1
+            return web.json_response({"error": "Unauthorized"}, status=401)
+
+        error = self._pick_error()
+        if error is None:
+            return await handler(request)
+        self.stats[error] += 1
+        if error == "401":
+            return web.json_response({"error": "Unauthorized"}, status=401)
+        if error == "429":
+            return web.json_response({"error": "Too Many Requests"}, status=429,
+                                     headers={"Retry-After": str(self.retry_after)})
+        if error == "timeout":
+            await asyncio.sleep(self.timeout_delay)
+            return web.json_response({"error": "Gateway Timeout"}, status=504)
+        return web.json_response({"error": "Server Error"}, status=self.random.choice((500, 502, 503)))
+
+    async def search(self, request: web.Request) -> web.Response:
+        payload = json_codec.loads(await request.read()) or {}
+        self._generate_arrivals()
+        page = max(int(payload.get("page") or 1), 1)
+        size = max(int(payload.get("size") or 20), 1)
+        compiled = compile_filter(payload.get("filter") or {})
+        matched = [proposal for proposal, facts in self._proposals if compiled.matches_facts(facts)]
+        if payload.get("sortingDirection", "DESC").upper() != "ASC":
+            matched.reverse()
+        start = (page - 1) * size
+        return web.json_response({"result": {
+            "proposals": matched[start:start + size],
+            "paginator": {"page": page, "size": size, "totalSize": len(matched),
+                          "totalPages": -(-len(matched) // size)},
+        }}, dumps=json_codec.dumps)
+
+    async def offer(self, request: web.Request) -> web.Response:
+        proposal = self._by_id.get(int(request.match_info["offer_id"]))
+        if proposal is None:
+            return web.json_response({"error": "Not Found"}, status=404)
+        return web.json_response(self.generator.offer(proposal), dumps=json_codec.dumps)
+
+    async def geo(self, request: web.Request) -> web.Response:
+        query = request.query.get("query", "").strip().lower()
+        sign = request.query.get("sign", "UA").upper()
+        results, regions = [], set()
+        for country, region_id, region, town_id, town in TOWNS:
+            if country != sign:
+                continue
+            if query in region.lower() and region_id not in regions:
+                regions.add(region_id)
+                results.append({"id": region_id, "type": "REGION", "name": region,
+                                "fullName": f"{region}, {country}", "countrySign": country})
+            if query in town.lower():
+                results.append({"id": town_id, "type": "TOWN", "name": town, "regionId": region_id,
+                                "fullName": f"{town}, {region}, {country}", "countrySign": country})
+        return web.json_response(results, dumps=json_codec.dumps)
+
+    async def authenticated_page(self, request: web.Request) -> web.Response:
+        return web.Response(text="<html><body>search</body></html>", content_type="text/html")
+
+    async def stats_handler(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.stats, "cargos": len(self._proposals)})
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/webapi/proposal/search/gruz/", self.search)
+        app.router.add_get("/webapi/proposal/offer/gruz/{offer_id:\\d+}/awaiting/", self.offer)
+        app.router.add_get("/webapi/geo/region-area-town/", self.geo)
+        app.router.add_get("/log/search/gruz/", self.authenticated_page)
+        app.router.add_get("/_fake/stats", self.stats_handler)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8090) -> str:
+        """Запускає сервер і повертає його базовий URL (для LARDI_BASE_URL). port=0 - вільний порт."""
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        base_url = f"http://{host}:{port}"
+        logger.info(f"Фейковий Lardi API запущено на {base_url} ({len(self._proposals)} вантажів).")
+        return base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальна заміна Lardi-Trans API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--cargos", type=int, default=1000, help="Кількість вантажів за останні 24 години")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=0.0, help="Затримка відповіді, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Випадкова додаткова затримка до, с")
+    parser.add_argument("--error-401", type=float, default=0.0, help="Ймовірність 401")
+    parser.add_argument("--error-429", type=float, default=0.0, help="Ймовірність 429")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="Ймовірність 500/502/503")
+    parser.add_argument("--error-timeout", type=float, default=0.0, help="Ймовірність зависання запиту")
+    parser.add_argument("--timeout-delay", type=float, default=60.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--new-per-minute", type=float, default=0.0, help="Нових вантажів щохвилини")
+    parser.add_argument("--require-cookie", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeLardiServer(
+        cargos=args.cargos, seed=args.seed, latency=args.latency, jitter=args.jitter,
+        error_rates={"401": args.error_401, "429": args.error_429, "5xx": args.error_5xx,
+                     "timeout": args.error_timeout},
+        timeout_delay=args.timeout_delay, retry_after=args.retry_after,
+        new_per_minute=args.new_per_minute, require_cookie=args.require_cookie,
+    )
+
+    async def run():
+        await server.start(args.host, args.port)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Ключі вантажу, з яких беруться числові параметри (перший знайдений має пріоритет).
+# У списку пошуку Lardi маса/об'єм часто приходять рядком на кшталт "20 т", тому рядки теж парсяться.
+_NUMERIC_FIELDS = {
+    "mass": ("gruzMass1", "gruzMass"),
+    "volume": ("gruzVolume1", "gruzVolume"),
+    "length": ("sizeLength", "length"),
+    "width": ("sizeWidth", "width"),
+    "height": ("sizeHeight", "height"),
+}
+
+# Числові діапазони фільтра: поле -> (ключ нижньої межі, ключ верхньої межі)
+_RANGE_KEYS = {
+    "mass": ("mass1", "mass2"),
+    "volume": ("volume1", "volume2"),
+    "length": ("length1", "length2"),
+    "width": ("width1", "width2"),
+    "height": ("height1", "height2"),
+}
+
+# Коди типів завантаження, якими оперує фільтр (див. get_load_types_filter_keyboard).
+# Відповідність цих кодів значенню loadTypes у відповіді пошуку Lardi не перевірена на записаних
+# відповідях, тому фільтр з типами завантаження вважається неточним (див. CompiledFilter.exact),
+# а значення вантажу з іншого словника (наприклад, локалізовані назви) не відкидають вантаж.
+LOAD_TYPE_CODES = frozenset(("top", "side", "back", "tent_off", "beam_off", "rack_off", "gate_off", "tail_lift"))
+
+# Булеві опції, які можна перевірити за даними вантажу: опція -> ключі у фільтрі
+_LOCAL_FLAGS = {
+    "only_with_stavka": ("only_with_stavka", "onlyWithStavka"),
+    "only_new": ("only_new", "onlyNew"),
+    "only_actual": ("only_actual", "onlyActual"),
+    "groupage": ("groupage", "groupage"),
+    "photos": ("photos", "photos"),
+}
+
+# Опції, які Lardi рахує на своєму боці (партнери, тип компанії, релевантність тощо).
+# Якщо хоч одна з них увімкнена, локальний результат є лише наближенням.
+_REMOTE_ONLY_FLAGS = (
+    ("only_relevant", "onlyRelevant"),
+    ("only_shippers", "onlyShippers"),
+    ("only_carrier", "onlyCarrier"),
+    ("only_expedition", "onlyExpedition"),
+    ("only_partners", "onlyPartners"),
+)
+_REMOTE_ONLY_VALUES = (
+    "dateFromISO", "dateToISO", "partnerGroups", "cargos", "cargoPackagingIds", "excludeCargos",
+    "cargoBodyTypeProperties", "paymentValue", "companyRefId", "companyName",
+    "includeDocuments", "excludeDocuments", "adr",
+)
+
+_NUMBER_RE = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def _get(filters: dict, snake_key: str, camel_key: str, default=None):
+    """Повертає значення фільтра незалежно від того, в якому форматі ключів він збережений."""
+    if snake_key in filters:
+        return filters[snake_key]
+    return filters.get(camel_key, default)
+
+
+def _to_number(value) -> Optional[float]:
+    """Перетворює число або рядок на кшталт '20 т' / '1,5' на float. Повертає None, якщо числа немає."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.search(str(value))
+    if not match:
+        return None
+    return float(match.group().replace(",", "."))
+
+
+def _id_set(values) -> frozenset:
+    """Нормалізує список ID або рядків до frozenset рядків у нижньому регістрі."""
+    if not values:
+        return frozenset()
+    if isinstance(values, (str, int)):
+        values = [values]
+    result = set()
+    for value in values:
+        if isinstance(value, dict):
+            value = value.get("id", value.get("value"))
+        if value is None:
+            continue
+        result.add(str(value).strip().lower())
+    return frozenset(result)
+
+
+def _place_key(place: dict) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Повертає (countrySign, regionId, townId) для рядка напрямку або точки маршруту."""
+    country = place.get("countrySign")
+    region = place.get("regionId") or place.get("areaId")
+    town = place.get("townId")
+    return (
+        country.upper() if country else None,
+        str(region) if region is not None else None,
+        str(town) if town is not None else None,
+    )
+
+
+def _parse_direction(direction) -> Tuple[Tuple[Optional[str], Optional[str], Optional[str]], ...]:
+    """
+    Перетворює directionFrom/directionTo на кортеж рядків (countrySign, regionId, townId).
+    Підтримує як dict, так і JSON-рядок, як це зберігається в LardiSearchFilter.
+    Порожній результат означає "будь-який напрямок".
+    """
+    if isinstance(direction, str):
+        try:
+            direction = json.loads(direction)
+        except json.JSONDecodeError:
+            return ((direction.upper(), None, None),) if len(direction) == 2 and direction.isalpha() else ()
+    if isinstance(direction, list):
+        rows = []
+        for item in direction:
+            if isinstance(item, dict) and isinstance(item.get("directionRows"), list):
+                rows.extend(item["directionRows"])
+            elif isinstance(item, str):
+                rows.append({"countrySign": item})
+    elif isinstance(direction, dict):
+        rows = direction.get("directionRows") or []
+    else:
+        rows = []
+
+    return tuple(_place_key(row) for row in rows if isinstance(row, dict))
+
+
+class ProposalFacts:
+    """
+    Попередньо розібрані з вантажу дані, потрібні для перевірки фільтрів.
+    Обчислюються один раз на вантаж і використовуються всіма скомпільованими фільтрами.
+    """
+    __slots__ = ("sources", "targets", "numbers", "load_types", "payment_form_ids",
+                 "body_type_ids", "distance_km", "flags")
+
+    def __init__(self, proposal: Dict[str, Any]):
+        self.sources = self._waypoints(proposal.get("waypointListSource"))
+        self.targets = self._waypoints(proposal.get("waypointListTarget"))
+        self.numbers = {}
+        for field, keys in _NUMERIC_FIELDS.items():
+            for key in keys:
+                number = _to_number(proposal.get(key))
+                if number is not None:
+                    self.numbers[field] = number
+                    break
+
+        self.load_types = self._load_types(proposal.get("loadTypes"))
+        self.payment_form_ids = _id_set(proposal.get("paymentForms")) or None
+        body_types = proposal.get("bodyTypeIds") or proposal.get("bodyTypeId") or proposal.get("bodyType")
+        self.body_type_ids = _id_set(body_types) or None
+
+        distance = _to_number(proposal.get("distance"))
+        self.distance_km = distance / 1000 if distance is not None else None
+
+        payment_value = proposal.get("paymentValue")
+        payment = proposal.get("payment")
+        if payment_value is not None:
+            with_stavka = bool(_to_number(payment_value))
+        elif payment is not None:
+            with_stavka = _to_number(payment) is not None
+        else:
+            with_stavka = None
+        self.flags = {
+            "only_with_stavka": with_stavka,
+            "only_new": proposal.get("new", proposal.get("isNew")),
+            "only_actual": proposal.get("actual", proposal.get("isActual")),
+            "groupage": proposal.get("groupage"),
+            "photos": proposal.get("photos", proposal.get("hasPhotos")),
+        }
+
+    @staticmethod
+    def _load_types(load_types) -> Optional[frozenset]:
+        """
+        Коди типів завантаження вантажу або None, якщо їх немає чи хоч одне значення не з LOAD_TYPE_CODES:
+        тоді критерій не перевіряється, щоб не відкинути вантаж через інший словник значень.
+        """
+        if isinstance(load_types, str):
+            load_types = [part for part in re.split(r"[,;]\s*", load_types) if part]
+        codes = _id_set(load_types)
+        return codes if codes and codes <= LOAD_TYPE_CODES else None
+
+    @staticmethod
+    def _waypoints(waypoints) -> Tuple[Tuple[Optional[str], Optional[str], Optional[str]], ...]:
+        return tuple(_place_key(waypoint) for waypoint in waypoints or [] if isinstance(waypoint, dict))
+
+
+def facts_for(proposal, facts_by_id: Optional[Dict[Any, ProposalFacts]] = None) -> Optional[ProposalFacts]:
+    """
+    Факти вантажу для перевірки фільтрів: для сирого JSON обчислюються одразу, для розібраного
+    вантажу (Proposal) беруться з facts_by_id, обчислених при отриманні. None, якщо фактів немає.
+    """
+    if isinstance(proposal, dict):
+        return ProposalFacts(proposal)
+    return facts_by_id.get(getattr(proposal, "id", None)) if facts_by_id else None
+
+
+class CompiledFilter:
+    """
+    Фільтр LardiSearchFilter, скомпільований у швидкий предикат для вантажів з /webapi/proposal/search/gruz/.
+
+    Якщо вантаж не містить даних для певного критерію, критерій вважається виконаним:
+    Lardi сам віддає у списку лише частину полів, і краще надіслати зайвий вантаж, ніж втратити потрібний.
+    Атрибут exact дорівнює False, якщо фільтр містить умови, які можна перевірити лише на боці Lardi.
+    """
+    __slots__ = ("key", "from_rows", "to_rows", "ranges", "load_types", "payment_form_ids",
+                 "body_type_ids", "distance_from", "distance_to", "flags", "exact")
+
+    def __init__(self, filters: dict, key: Any = None):
+        self.key = key
+        self.from_rows = _parse_direction(_get(filters, "direction_from", "directionFrom"))
+        self.to_rows = _parse_direction(_get(filters, "direction_to", "directionTo"))
+
+        self.ranges = []
+        for field, (low_key, high_key) in _RANGE_KEYS.items():
+            low, high = _to_number(filters.get(low_key)), _to_number(filters.get(high_key))
+            if low is not None or high is not None:
+                self.ranges.append((field, low, high))
+        self.ranges = tuple(self.ranges)
+
+        self.load_types = _id_set(_get(filters, "load_types", "loadTypes"))
+        self.payment_form_ids = _id_set(_get(filters, "payment_form_ids", "paymentFormIds"))
+        self.body_type_ids = _id_set(_get(filters, "body_type_ids", "bodyTypeIds"))
+        self.distance_from = _to_number(_get(filters, "distance_km_from", "distanceKmFrom"))
+        self.distance_to = _to_number(_get(filters, "distance_km_to", "distanceKmTo"))
+        self.flags = tuple(flag for flag, keys in _LOCAL_FLAGS.items() if _get(filters, *keys))
+
+        # Типи завантаження робять фільтр неточним, доки словник loadTypes не звірено з відповідями Lardi
+        self.exact = not any(_get(filters, *keys) for keys in _REMOTE_ONLY_FLAGS) \
+            and not any(filters.get(key) not in (None, [], "") for key in _REMOTE_ONLY_VALUES) \
+            and not self.load_types
+
+    @staticmethod
+    def _direction_matches(rows, waypoints) -> bool:
+        if not rows or not waypoints:
+            return True
+        for country, region, town in waypoints:
+            for row_country, row_region, row_town in rows:
+                if row_country and country and row_country != country:
+                    continue
+                if row_region and region and row_region != region:
+                    continue
+                if row_town and town and row_town != town:
+                    continue
+                return True
+        return False
+
+    def matches_facts(self, facts: ProposalFacts) -> bool:
+        """Перевіряє попередньо розібраний вантаж."""
+        if not self._direction_matches(self.from_rows, facts.sources):
+            return False
+        if not self._direction_matches(self.to_rows, facts.targets):
+            return False
+
+        for field, low, high in self.ranges:
+            value = facts.numbers.get(field)
+            if value is None:
+                continue
+            if low is not None and value < low:
+                return False
+            if high is not None and value > high:
+                return False
+
+        if self.load_types and facts.load_types is not None and not (self.load_types & facts.load_types):
+            return False
+        if self.payment_form_ids and facts.payment_form_ids is not None \
+                and not (self.payment_form_ids & facts.payment_form_ids):
+            return False
+        if self.body_type_ids and facts.body_type_ids is not None and not (self.body_type_ids & facts.body_type_ids):
+            return False
+
+        if facts.distance_km is not None:
+            if self.distance_from is not None and facts.distance_km < self.distance_from:
+                return False
+            if self.distance_to is not None and facts.distance_km > self.distance_to:
+                return False
+
+        for flag in self.flags:
+            if facts.flags.get(flag) is False:
+                return False
+        return True
+
+    def matches(self, proposal: Dict[str, Any]) -> bool:
+        """Перевіряє сирий dict вантажу."""
+        return self.matches_facts(facts_for(proposal))
+
+    __call__ = matches
+
+
+def compile_filter(filters: dict, key: Any = None) -> CompiledFilter:
+    """
+    Компілює фільтри у форматі Lardi API (default_filters або user_filter_to_dict) у предикат.
+    """
+    return CompiledFilter(filters, key=key)
+
+
+def compile_search_filter(lardi_filter_obj, key: Any = None) -> CompiledFilter:
+    """
+    Компілює об'єкт LardiSearchFilter у предикат.
+    """
+    from modules.utils import user_filter_to_dict
+
+    return CompiledFilter(user_filter_to_dict(lardi_filter_obj), key=key)
+
+
+def match_batch(compiled_filters: Iterable[CompiledFilter], proposals: Iterable[Any],
+                facts_by_id: Optional[Dict[Any, ProposalFacts]] = None) -> Dict[Any, List[Any]]:
+    """
+    Перевіряє багато скомпільованих фільтрів проти багатьох вантажів (сирий JSON або Proposal
+    з фактами у facts_by_id). Кожен вантаж розбирається один раз. Повертає {key фільтра: [вантажі, що підійшли]}
+    зі збереженням порядку вантажів. Вантажі без фактів пропускаються.
+    """
+    compiled_filters = list(compiled_filters)
+    matched = {compiled.key: [] for compiled in compiled_filters}
+    for proposal in proposals:
+        facts = facts_for(proposal, facts_by_id)
+        if facts is None:
+            continue
+        for compiled in compiled_filters:
+            if compiled.matches_facts(facts):
+                matched[compiled.key].append(proposal)
+    return matched
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from modules.filter_matcher import CompiledFilter, ProposalFacts, compile_filter, facts_for
+from modules.proposal import Proposal
+
+logger = logging.getLogger(__name__)
+
+# Ключ індексу підписок: (країна завантаження, країна вивантаження). None у другій позиції означає "будь-яка".
+SubscriptionKey = Tuple[str, Optional[str]]
+
+
+class SubscriptionIndex:
+    """
+    Індекс підписок користувачів для режиму "firehose".
+    Замість окремого пошуку на кожен фільтр бот опитує кілька широких запитів
+    (нові вантажі за країною завантаження), а індекс розподіляє отримані вантажі
+    між користувачами, чиї фільтри їм відповідають.
+    """
+
+    def __init__(self):
+        self._index: Dict[SubscriptionKey, List[Tuple[Any, CompiledFilter]]] = {}
+        # Країна завантаження -> найстаріший notification_time серед підписників
+        self.origin_countries: Dict[str, datetime] = {}
+        # Користувачі, чиї фільтри не можна обслужити з firehose (будь-яка країна завантаження,
+        # типи завантаження або опції, які перевіряє лише Lardi). Для них виконується звичайний пошук за фільтром.
+        self.fallback_users: List[Any] = []
+        self.subscribers: List[Any] = []
+        # UserProfile.id -> країни завантаження з фільтра підписника
+        self.subscriber_countries: Dict[int, Set[str]] = {}
+
+    @classmethod
+    def build(cls, user_profiles: List[Any], filters_by_user: Dict[int, dict]) -> "SubscriptionIndex":
+        """Будує індекс для всіх активних користувачів."""
+        index = cls()
+        for user_profile in user_profiles:
+            index.add(user_profile, filters_by_user[user_profile.id])
+        return index
+
+    def add(self, user_profile, filters: dict):
+        """Додає підписку користувача до індексу."""
+        compiled = compile_filter(filters, key=user_profile.id)
+        from_countries = {country for country, _, _ in compiled.from_rows}
+        # Словник loadTypes у відповідях Lardi не звірено з кодами фільтра: якби вантаж не підійшов
+        # через інший словник, тік однаково зсунув би notification_time, і вантаж було б втрачено
+        if not compiled.exact or compiled.load_types or not from_countries or None in from_countries:
+            self.fallback_users.append(user_profile)
+            return
+
+        to_countries = {country for country, _, _ in compiled.to_rows} or {None}
+        for from_country in from_countries:
+            for to_country in to_countries:
+                self._index.setdefault((from_country, to_country), []).append((user_profile, compiled))
+            since = self.origin_countries.get(from_country)
+            if since is None or user_profile.notification_time < since:
+                self.origin_countries[from_country] = user_profile.notification_time
+        self.subscribers.append(user_profile)
+        self.subscriber_countries[user_profile.id] = from_countries
+
+    def route(self, proposals: List[Any],
+              facts_by_id: Optional[Dict[Any, ProposalFacts]] = None) -> Dict[int, List[Any]]:
+        """
+        Розподіляє вантажі (сирий JSON або Proposal з фактами у facts_by_id) між підписниками.
+        Повертає {UserProfile.id: [вантажі]} зі збереженням порядку вантажів.
+        Кожен кандидат остаточно перевіряється скомпільованим фільтром.
+        """
+        routed: Dict[int, List[Any]] = {}
+        for proposal in proposals:
+            facts = facts_for(proposal, facts_by_id)
+            if facts is None:
+                logger.warning(f"Firehose: немає даних для перевірки фільтрів вантажу {getattr(proposal, 'id', None)}.")
+                continue
+            from_countries = {country for country, _, _ in facts.sources if country}
+            to_countries = {country for country, _, _ in facts.targets if country} | {None}
+
+            seen_users = set()
+            for from_country in from_countries:
+                for to_country in to_countries:
+                    for user_profile, compiled in self._index.get((from_country, to_country), ()):
+                        if user_profile.id in seen_users:
+                            continue
+                        seen_users.add(user_profile.id)
+                        if compiled.matches_facts(facts):
+                            routed.setdefault(user_profile.id, []).append(proposal)
+        return routed
+
+
+def firehose_filters(base_filters: dict, country_sign: str) -> dict:
+    """
+    Повертає широкий фільтр "усі вантажі з країни country_sign" на основі фільтрів за замовчуванням.
+    """
+    filters = dict(base_filters)
+    filters["directionFrom"] = {"directionRows": [{"countrySign": country_sign}]}
+    filters["directionTo"] = {"directionRows": []}
+    filters["paymentFormIds"] = []
+    return filters
+
+
+async def poll_firehose(client, index: SubscriptionIndex) -> Dict[int, List[Proposal]]:
+    """
+    Опитує firehose-запити для всіх країн завантаження з індексу та розподіляє нові вантажі
+    між підписниками. client - екземпляр LardiNotificationClient.
+    Підписники, для чиєї країни запит не вдався, не потрапляють у результат: їхній notification_time
+    не змінюється, і пропущені вантажі буде знайдено в наступному тіку.
+    """
+    countries = list(index.origin_countries.items())
+    if not countries:
+        return {}
+
+    # Дані для перевірки фільтрів обчислюються при отриманні і живуть лише до кінця розподілу
+    facts_by_id: Dict[Any, ProposalFacts] = {}
+
+    async def fetch_country(country_sign: str, since: datetime) -> Optional[List[Proposal]]:
+        """Нові вантажі країни або None, якщо запит не вдався."""
+        try:
+            return await client.get_new_offers_for_filters(
+                firehose_filters(client.default_filters(), country_sign),
+                since,
+                facts_by_id
+            )
+        except Exception as e:
+            logger.error(f"Помилка firehose-запиту для країни {country_sign}: {e}")
+            return None
+
+    results = await asyncio.gather(*(fetch_country(country, since) for country, since in countries))
+    failed_countries = {country for (country, _), result in zip(countries, results) if result is None}
+
+    proposals = []
+    seen_ids = set()
+    for country_proposals in results:
+        for proposal in country_proposals or ():
+            if proposal.id in seen_ids:
+                continue
+            seen_ids.add(proposal.id)
+            proposals.append(proposal)
+
+    routed = index.route(proposals, facts_by_id)
+    for user_profile in index.subscribers:
+        if index.subscriber_countries[user_profile.id] & failed_countries:
+            routed.pop(user_profile.id, None)
+        else:
+            # Підписники без нових вантажів теж обслуговані в цьому тіку
+            routed.setdefault(user_profile.id, [])
+    logger.info(
+        f"Firehose: {len(countries)} запитів ({len(failed_countries)} з помилкою), {len(proposals)} нових вантажів, "
+        f"обслуговано {len(routed)} з {len(index.subscribers)} підписників."
+    )
+    return routed
@@ -30,6 +30,7 @@ from modules.keyboards import (
 )
 from modules.fsm_states import LardiForm, FilterForm
 from modules.lardi_api_client import LardiClient, LardiOfferClient, LardiGeoClient
+from modules.seen_cargo_store import seen_cargo_store
 
 from modules.utils import date_format, add_line, user_filter_to_dict, boolean_options_names, ALL_COUNTRIES_FOR_SELECTION, COUNTRIES_PER_PAGE, escape_markdown_v2
 from datetime import datetime, timezone, timedelta
@@ -72,11 +73,15 @@ async def _get_or_create_lardi_filter(telegram_id: int) -> LardiSearchFilter:
 
 
 @sync_to_async
-def update_user_notification_status(user_profile: UserProfile, status: bool):
+def _save_user_notification_status(user_profile: UserProfile, status: bool):
     user_profile.notification_status = status
     user_profile.notification_time = datetime.now(timezone.utc) if status else None
-    user_profile.cargo_skip = []
-    user_profile.save(update_fields=['notification_status', 'notification_time', 'cargo_skip'])
+    user_profile.save(update_fields=['notification_status', 'notification_time'])
+
+
+async def update_user_notification_status(user_profile: UserProfile, status: bool):
+    await _save_user_notification_status(user_profile, status)
+    await seen_cargo_store.forget_user(user_profile.id)
 
 
 @sync_to_async
@@ -170,11 +175,43 @@ async def cb_notification_settings(callback: CallbackQuery):
     )
     await callback.message.edit_text(
         status_text,
-        reply_markup=get_notification_settings_keyboard(user_profile.notification_status)
+        reply_markup=get_notification_settings_keyboard(user_profile.notification_status,
+                                                        user_profile.notification_digest)
     )
     await callback.answer()
 
 
+@sync_to_async
+def update_user_notification_digest(user_profile: UserProfile, enabled: bool):
+    user_profile.notification_digest = enabled
+    user_profile.save(update_fields=['extra_data'])
+
+
+@router.callback_query(F.data == "toggle_notification_digest")
+async def cb_toggle_notification_digest(callback: CallbackQuery):
+    """
+    Перемикає режим дайджесту: кілька нових вантажів в одному повідомленні замість окремих.
+    """
+    user_profile = await get_user_profile(callback.from_user.id)
+    if not user_profile:
+        await callback.message.answer(settings_manager.get("text_error_user_not_found"))
+        await callback.answer()
+        return
+
+    digest_enabled = not user_profile.notification_digest
+    await update_user_notification_digest(user_profile, digest_enabled)
+
+    try:
+        await callback.message.edit_reply_markup(
+            reply_markup=get_notification_settings_keyboard(user_profile.notification_status, digest_enabled)
+        )
+    except TelegramBadRequest:
+        pass
+    await callback.answer(settings_manager.get(
+        "text_digest_toggle_success_enabled" if digest_enabled else "text_digest_toggle_success_disabled"
+    ))
+
+
 @router.callback_query(F.data == "toggle_notifications")
 async def cb_toggle_notifications(callback: CallbackQuery):
     user_profile = await get_user_profile(callback.from_user.id)
@@ -989,7 +1026,12 @@ async def process_town_search_query(message: Message, state: FSMContext):
 
     await message.answer("Шукаю міста за вашим запитом...")
 
-    geo_data = await lardi_geo_client.get_geo_data(query=user_query, sign=country_sign)
+    try:
+        geo_data = await lardi_geo_client.get_geo_data(query=user_query, sign=country_sign)
+    except Exception as e:
+        logger.error(f"Помилка при запиті геоданих для запиту '{user_query}': {e!r}")
+        await message.answer("❌ Не вдалося виконати пошук міст. Спробуйте пізніше.")
+        return
 
     towns_results = [item for item in geo_data if item.get('type') == 'TOWN']
 
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import re
+import time
+from email.utils import parsedate_to_datetime
+from http.cookies import Morsel
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+INVALID_CREDENTIALS_MARKERS = ("Неправильный логин или пароль", "Incorrect login or password", "Неправильний логін або пароль")
+SESSION_LIMIT_MARKER = "passport--limit-modal"
+
+_HIDDEN_INPUT_RE = re.compile(r"<input\b[^>]*\btype=[\"']hidden[\"'][^>]*>", re.IGNORECASE)
+_ATTR_RE = re.compile(r"\b(name|value)=[\"']([^\"']*)[\"']", re.IGNORECASE)
+_SESSION_ID_RE = re.compile(r"\bdata-session-id=[\"']([^\"']+)[\"']", re.IGNORECASE)
+
+
+class LardiInvalidCredentialsError(Exception):
+    """Lardi відхилив логін або пароль. Повторний вхід (зокрема через Selenium) не допоможе."""
+
+
+class LardiHttpLogin:
+    """
+    Вхід на Lardi-Trans через passport-форму напряму по HTTP, без браузера:
+    1. GET сторінки входу (початкові cookie та приховані поля форми, наприклад CSRF-токен);
+    2. POST форми з логіном і паролем;
+    3. якщо досягнуто ліміту сесій - видалення найстарішої сесії та повторний POST;
+    4. перевірка входу запитом до сторінки, доступної лише авторизованим користувачам.
+    Повертає отримані cookie у тому ж форматі, що й driver.get_cookies() у Selenium (name, value, expiry).
+    """
+
+    def __init__(self, login_url: str, authenticated_page_url: str, username: str, password: str,
+                 form_url: str = "", session_delete_url: str = "", timeout: float = 10):
+        self.login_url = login_url
+        self.authenticated_page_url = authenticated_page_url
+        self.username = username
+        self.password = password
+        # Адреса, на яку відправляється форма; за замовчуванням форма відправляється на сторінку входу
+        self.form_url = form_url or login_url
+        self.session_delete_url = session_delete_url
+        self.timeout = timeout
+
+    @staticmethod
+    def _hidden_fields(html: str) -> Dict[str, str]:
+        """Повертає приховані поля форми (name -> value) зі сторінки входу."""
+        fields = {}
+        for tag in _HIDDEN_INPUT_RE.findall(html):
+            attrs = {key.lower(): value for key, value in _ATTR_RE.findall(tag)}
+            if attrs.get("name"):
+                fields[attrs["name"]] = attrs.get("value", "")
+        return fields
+
+    @staticmethod
+    def _limited_session_ids(body: Any) -> Optional[List[str]]:
+        """
+        Повертає ID активних сесій, якщо відповідь повідомляє про ліміт сесій, інакше None.
+        Підтримує JSON-відповідь ({"sessions": [{"id": ...}]}) та HTML з модальним вікном ліміту.
+        """
+        if isinstance(body, dict):
+            sessions = body.get("sessions")
+            if sessions or body.get("status") == "SESSION_LIMIT":
+                return [str(session.get("id")) for session in sessions or [] if isinstance(session, dict)]
+            return None
+        if isinstance(body, str) and SESSION_LIMIT_MARKER in body:
+            return _SESSION_ID_RE.findall(body)
+        return None
+
+    @staticmethod
+    def _morsel_to_cookie(morsel: Morsel) -> Dict[str, Any]:
+        """Перетворює cookie з aiohttp у формат Selenium; expiry - UNIX-час або відсутній для сесійних cookie."""
+        cookie = {"name": morsel.key, "value": morsel.value}
+        try:
+            if morsel["max-age"]:
+                cookie["expiry"] = int(time.time() + int(morsel["max-age"]))
+            elif morsel["expires"]:
+                cookie["expiry"] = int(parsedate_to_datetime(morsel["expires"]).timestamp())
+        except (TypeError, ValueError):
+            pass
+        return cookie
+
+    @staticmethod
+    async def _read_body(response: aiohttp.ClientResponse) -> Any:
+        if "json" in (response.content_type or ""):
+            return await response.json(content_type=None)
+        return await response.text()
+
+    async def _submit_form(self, session: aiohttp.ClientSession, hidden_fields: Dict[str, str]) -> Any:
+        form = dict(hidden_fields)
+        form.update({"login": self.username, "password": self.password, "remember": "true"})
+        async with session.post(self.form_url, data=form) as response:
+            body = await self._read_body(response)
+            text = body if isinstance(body, str) else str(body)
+            if response.status == 401 or any(marker in text for marker in INVALID_CREDENTIALS_MARKERS):
+                raise LardiInvalidCredentialsError("Вхід не вдався: невірний логін або пароль.")
+            response.raise_for_status()
+            return body
+
+    async def _delete_session(self, session: aiohttp.ClientSession, session_id: str):
+        async with session.post(self.session_delete_url, data={"sessionId": session_id}) as response:
+            response.raise_for_status()
+        logger.warning(f"Досягнуто ліміту сесій Lardi. Видалено сесію {session_id}.")
+
+    async def _is_authenticated(self, session: aiohttp.ClientSession) -> bool:
+        async with session.get(self.authenticated_page_url) as response:
+            return response.status < 400 and self.login_url not in str(response.url)
+
+    async def login(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Виконує вхід і повертає нові cookie, або None, якщо вхід по HTTP не вдався
+        (мережева помилка, незнайома відповідь, ліміт сесій без адреси видалення).
+        Для невірних облікових даних кидає LardiInvalidCredentialsError.
+        """
+        if not self.login_url or not self.username or not self.password:
+            logger.error("URL входу, логін або пароль Lardi-Trans не налаштовані. Вхід по HTTP неможливий.")
+            return None
+
+        # unsafe=True: приймати cookie і від адрес-IP (локальні стенди, проксі)
+        cookie_jar = aiohttp.CookieJar(unsafe=True)
+        async with aiohttp.ClientSession(cookie_jar=cookie_jar,
+                                         timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            try:
+                async with session.get(self.login_url) as response:
+                    response.raise_for_status()
+                    hidden_fields = self._hidden_fields(await response.text())
+
+                body = await self._submit_form(session, hidden_fields)
+                session_ids = self._limited_session_ids(body)
+                if session_ids is not None:
+                    if not session_ids or not self.session_delete_url:
+                        logger.warning("Досягнуто ліміту сесій Lardi, але видалити сесію по HTTP неможливо.")
+                        return None
+                    await self._delete_session(session, session_ids[0])
+                    body = await self._submit_form(session, hidden_fields)
+                    if self._limited_session_ids(body) is not None:
+                        logger.warning("Ліміт сесій Lardi залишився після видалення сесії.")
+                        return None
+
+                if not await self._is_authenticated(session):
+                    logger.warning("Після входу по HTTP сторінка пошуку перенаправляє на вхід.")
+                    return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Помилка входу на Lardi-Trans по HTTP: {e!r}")
+                return None
+
+            cookies = [self._morsel_to_cookie(morsel) for morsel in session.cookie_jar]
+        if not cookies:
+            logger.warning("Вхід по HTTP не повернув жодного cookie.")
+            return None
+        return cookies
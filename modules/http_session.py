@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Optional, Any, Dict
+
+import aiohttp
+
+from modules.app_config import env_config
+from modules.circuit_breaker import lardi_circuit_breaker
+from modules.json_codec import json_codec
+from modules.rate_governor import RateGovernor, RequestPriority, lardi_rate_governor
+
+logger = logging.getLogger(__name__)
+
+# Ліміт запитів сесії Lardi, від імені якої виконується поточний запит (див. modules.session_pool)
+current_session_governor: ContextVar[Optional[RateGovernor]] = ContextVar("current_session_governor", default=None)
+
+
+class LardiHttpSession:
+    """
+    Спільна довгоживуча aiohttp-сесія з keep-alive та обмеженим пулом з'єднань.
+    Використовується всіма клієнтами Lardi-Trans, щоб не відкривати нове TCP+TLS
+    з'єднання і не переходити в окремий потік на кожен запит.
+    """
+
+    def __init__(self, limit: int = 20, limit_per_host: int = 10, timeout: float = 30):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Створює сесію, якщо вона ще не створена або вже закрита."""
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    keepalive_timeout=60,
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                )
+                logger.info(f"Створено HTTP-сесію Lardi (limit={self.limit}, limit_per_host={self.limit_per_host}).")
+        return self._session
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Повертає активну сесію. Якщо start() ще не викликано, створює її ліниво."""
+        if self._session is None or self._session.closed:
+            return await self.start()
+        return self._session
+
+    async def close(self):
+        """Закриває сесію та всі з'єднання пулу."""
+        async with self._lock:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+                logger.info("HTTP-сесію Lardi закрито.")
+            self._session = None
+
+    async def request_json(self, method: str, url: str, *, headers: Dict[str, str],
+                           json: Optional[Any] = None, params: Optional[Dict[str, Any]] = None,
+                           timeout: Optional[float] = None,
+                           priority: RequestPriority = RequestPriority.INTERACTIVE) -> Any:
+        """
+        Виконує запит і повертає декодоване JSON-тіло відповіді.
+        Тіло запиту кодується, а відповідь декодується спільним json_codec.
+        Перед запитом чекає на токен ліміту поточної сесії Lardi (якщо запит виконується в межах сесії пулу)
+        та спільного лімітера lardi_rate_governor з указаним пріоритетом.
+        Результат кожного запиту враховується lardi_circuit_breaker; якщо breaker розімкнений,
+        кидає LardiCircuitOpenError без звернення до API.
+        Для статусів 4xx/5xx кидає aiohttp.ClientResponseError.
+        """
+        session_governor = current_session_governor.get()
+        if session_governor is not None:
+            await session_governor.acquire(priority)
+        await lardi_rate_governor.acquire(priority)
+        lardi_circuit_breaker.before_request()
+        session = await self.get_session()
+        request_kwargs = {"headers": headers, "params": params}
+        if json is not None:
+            request_kwargs["data"] = json_codec.dumps_bytes(json)
+            request_kwargs["headers"] = {**headers, "content-type": "application/json"}
+        if timeout:
+            request_kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        try:
+            async with session.request(method, url, **request_kwargs) as response:
+                if response.status == 429 or response.status >= 500:
+                    lardi_circuit_breaker.record_failure()
+                else:
+                    lardi_circuit_breaker.record_success()
+                response.raise_for_status()
+                return json_codec.loads(await response.read())
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            lardi_circuit_breaker.record_failure()
+            raise
+
+
+lardi_http_session = LardiHttpSession(
+    limit=env_config.LARDI_HTTP_POOL_LIMIT,
+    limit_per_host=env_config.LARDI_HTTP_POOL_LIMIT_PER_HOST,
+    timeout=env_config.LARDI_HTTP_TIMEOUT,
+)
@@ -0,0 +1,84 @@
+import json
+import logging
+from typing import Any, Union
+
+from modules.app_config import env_config
+
+try:
+    import orjson
+except ImportError:  # orjson - необов'язкова залежність
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+class JsonCodec:
+    """
+    Спільний JSON-кодек для запитів до Lardi, відповідей Web App та ключів кешу.
+    Використовує orjson, якщо його встановлено (і не вимкнено LARDI_JSON_BACKEND=json),
+    інакше - стандартний модуль json. Обидва бекенди дають компактний UTF-8 без екранування не-ASCII.
+    """
+
+    def __init__(self, backend: str = "auto"):
+        if backend in ("auto", "orjson") and orjson is not None:
+            self.backend = "orjson"
+        else:
+            if backend == "orjson":
+                logger.warning("LARDI_JSON_BACKEND=orjson, але orjson не встановлено. Використовується json.")
+            self.backend = "json"
+
+    def dumps_bytes(self, obj: Any, sort_keys: bool = False) -> bytes:
+        if self.backend == "orjson":
+            option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+            return orjson.dumps(obj, default=str, option=option)
+        return self.dumps(obj, sort_keys=sort_keys).encode("utf-8")
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> str:
+        if self.backend == "orjson":
+            return self.dumps_bytes(obj, sort_keys=sort_keys).decode("utf-8")
+        return json.dumps(obj, sort_keys=sort_keys, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """Декодує JSON; порожнє тіло повертає None (як aiohttp response.json())."""
+        if not data or not data.strip():
+            return None
+        if self.backend == "orjson":
+            return orjson.loads(data)
+        return json.loads(data)
+
+    def canonical_filters(self, filters: dict) -> dict:
+        """
+        Канонічна форма фільтрів у форматі Lardi API: прибрано ключі зі значеннями "без обмеження"
+        (None, False, порожні рядки та списки), списки відсортовано.
+        Однакові за змістом фільтри дають однаковий словник - і однаковий payload та ключ кешу.
+        """
+        return {
+            key: _canonical_value(value)
+            for key, value in sorted(filters.items())
+            if not _is_neutral(value)
+        }
+
+    def canonical_dumps(self, obj: Any) -> str:
+        """Детермінований JSON (відсортовані ключі) для хешів та ключів кешу."""
+        return self.dumps(obj, sort_keys=True)
+
+
+def _is_neutral(value: Any) -> bool:
+    """Значення фільтра, що означає "без обмеження" і не змінює результат пошуку Lardi."""
+    return value is None or value is False or (isinstance(value, (str, list, tuple, dict)) and not value)
+
+
+def _canonical_value(value: Any) -> Any:
+    """Рекурсивно сортує списки; словники всередині списків порівнюються за їхнім канонічним JSON."""
+    if isinstance(value, dict):
+        return {key: _canonical_value(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        items = [_canonical_value(item) for item in value]
+        try:
+            return sorted(items)
+        except TypeError:
+            return sorted(items, key=lambda item: json.dumps(item, sort_keys=True, default=str))
+    return value
+
+
+json_codec = JsonCodec(env_config.LARDI_JSON_BACKEND)
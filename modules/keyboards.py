@@ -332,7 +332,22 @@ def get_cargo_details_webapp_keyboard(cargo_id: int) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_notification_settings_keyboard(notifications_enabled: bool) -> InlineKeyboardMarkup:
+def get_cargo_digest_keyboard(cargo_ids: List[int], per_row: int = 5) -> InlineKeyboardMarkup:
+    """
+    Клавіатура дайджесту: кнопка Web App з деталями для кожного вантажу (за номером у дайджесті).
+    """
+    builder = InlineKeyboardBuilder()
+    buttons = [
+        InlineKeyboardButton(text=f"{index}", web_app=WebAppInfo(url=f"{env_config.WEBAPP_BASE_URL}.html?id={cargo_id}"))
+        for index, cargo_id in enumerate(cargo_ids, 1)
+    ]
+    for start in range(0, len(buttons), per_row):
+        builder.row(*buttons[start:start + per_row])
+    builder.row(InlineKeyboardButton(text="⬅️ Назад в головне меню", callback_data="start_menu"))
+    return builder.as_markup()
+
+
+def get_notification_settings_keyboard(notifications_enabled: bool, digest_enabled: bool = False) -> InlineKeyboardMarkup:
     """
     Клавіатура для налаштувань сповіщень.
     """
@@ -345,5 +360,11 @@ def get_notification_settings_keyboard(notifications_enabled: bool) -> InlineKey
     builder.row(
         InlineKeyboardButton(text=button_text, callback_data="toggle_notifications")
     )
+    digest_text = settings_manager.get(
+        "text_button_digest_enabled" if digest_enabled else "text_button_digest_disabled"
+    )
+    builder.row(
+        InlineKeyboardButton(text=digest_text, callback_data="toggle_notification_digest")
+    )
     builder.row(get_back_to_main_menu_button().inline_keyboard[0][0])
     return builder.as_markup()
\ No newline at end of file
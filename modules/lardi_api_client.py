@@ -1,14 +1,26 @@
+import asyncio
+import random
+from email.utils import parsedate_to_datetime
+from contextlib import aclosing
 from functools import wraps
 
-import requests
+import aiohttp
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
 from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
 
-from modules.cookie_manager import CookieManager
-from typing import Optional, Dict, Any, List
+from modules.app_config import env_config
+from modules.circuit_breaker import LardiCircuitOpenError
+from modules.filter_matcher import ProposalFacts
+from modules.http_session import lardi_http_session
+from modules.json_codec import json_codec
+from modules.proposal import Proposal
+from modules.rate_governor import RequestPriority
+from modules.session_pool import LardiSession, lardi_session_pool
+from modules.ttl_cache import AsyncTTLCache
+from typing import Optional, Dict, Any, List, AsyncIterator
 
 from modules.utils import user_filter_to_dict
 
@@ -16,53 +28,111 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-_cookie_manager = CookieManager()
+MAX_SEARCH_PAGES = 100  # Верхня межа кількості сторінок для одного пошуку
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Статуси, що вказують на проблему конкретної сесії (облікового запису), а не всього Lardi
+SESSION_FAILURE_STATUSES = {403, 429}
+
+
+def _retry_delay(attempt: int, error: Optional[Exception] = None) -> float:
+    """
+    Затримка перед повторною спробою: Retry-After з відповіді, якщо він є,
+    інакше експоненційна затримка з повним jitter-ом.
+    """
+    headers = getattr(error, "headers", None)
+    retry_after = headers.get("Retry-After") if headers else None
+    if retry_after:
+        try:
+            return min(float(retry_after), env_config.LARDI_BACKOFF_MAX)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                return min(max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0), env_config.LARDI_BACKOFF_MAX)
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(env_config.LARDI_BACKOFF_MAX, env_config.LARDI_BACKOFF_BASE * 2 ** attempt))
 
 
 def lardi_api_retry_on_401(func):
     """
-    Декоратор для автоматичної обробки 401 помилок та повторної спроби запиту
-    після оновлення cookie.
+    Декоратор стійкості запитів до Lardi API:
+    - кожна спроба виконується через сесію з lardi_session_pool; заголовки з cookie саме цієї сесії
+      передаються в метод аргументом headers (спільний стан клієнта не змінюється, тож паралельні
+      запити через різні сесії не змішують cookie);
+    - 401: оновлює cookie сесії і повторює запит один раз; якщо оновлення не вдалося,
+      сесія виключається з ротації, а запит повторюється через іншу справну сесію;
+    - 429, 5xx, таймаути та мережеві помилки: повторює до LARDI_MAX_RETRIES разів
+      з експоненційною затримкою та jitter-ом, враховуючи Retry-After;
+    - якщо circuit breaker розімкнений (Lardi деградував), одразу кидає LardiCircuitOpenError без повторів.
+    Декорувати слід лише методи, що самі виконують один запит: обгортка над уже декорованим методом
+    орендувала б другу сесію, а її record_success скидав би збої, враховані для сесії, що виконала запит.
     """
 
     @wraps(func)
     async def wrapper(self, *args, **kwargs):
-        max_retries = 1  # Одна спроба після 401
-        for attempt in range(max_retries + 1):
-            try:
-                # Оновлюємо заголовки перед кожною спробою
-                self._update_headers_with_cookies()
-                # Перетворюємо синхронний виклик на асинхронний, якщо функція сама по собі синхронна
-                if not hasattr(func, '__wrapped__') and not hasattr(func,
-                                                                    '__name__') and func.__module__ == 'builtins':  # heuristic for detecting if it's a plain function not wrapped by sync_to_async
-                    return await sync_to_async(func)(self, *args, **kwargs)
-                else:
-                    return await func(self, *args, **kwargs)
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 401 and attempt < max_retries:
-                    logger.warning("Отримано 401 Unauthorized. Спроба оновити cookie та повторити запит...")
-                    # refresh_lardi_cookies є синхронним, тому обгортаємо його
-                    refresh_success = await sync_to_async(_cookie_manager.refresh_lardi_cookies)()
-                    if refresh_success:
-                        logger.info("Cookie успішно оновлено. Повторюємо запит.")
-                        # Важливо: _update_headers_with_cookies() буде викликано на початку наступної ітерації
-                        continue  # Повторюємо цикл
+        max_retries = env_config.LARDI_MAX_RETRIES
+        cookies_refreshed = False
+        attempt = 0
+        while True:
+            # Кожна спроба виконується від імені однієї із сесій пулу: її cookie та її ліміт запитів
+            with lardi_session_pool.lease() as lardi_session:
+                cookie_manager = lardi_session.cookie_manager
+                try:
+                    # Заголовки будуються для кожної спроби з cookie орендованої сесії
+                    cookies_version = cookie_manager.version
+                    headers = self._headers_with_cookies(lardi_session)
+                    # Перетворюємо синхронний виклик на асинхронний, якщо функція сама по собі синхронна
+                    if not hasattr(func, '__wrapped__') and not hasattr(func,
+                                                                        '__name__') and func.__module__ == 'builtins':  # heuristic for detecting if it's a plain function not wrapped by sync_to_async
+                        result = await sync_to_async(func)(self, *args, headers=headers, **kwargs)
                     else:
+                        result = await func(self, *args, headers=headers, **kwargs)
+                    lardi_session_pool.record_success(lardi_session)
+                    return result
+                except LardiCircuitOpenError:
+                    raise  # Lardi недоступний: не повторюємо і не засмічуємо лог
+                except aiohttp.ClientResponseError as e:
+                    if e.status == 401 and not cookies_refreshed:
+                        cookies_refreshed = True
+                        logger.warning(
+                            f"Отримано 401 Unauthorized (сесія '{lardi_session.name}'). "
+                            f"Спроба оновити cookie та повторити запит..."
+                        )
+                        # Паралельні 401 чекають на одне спільне оновлення cookie
+                        refresh_success = await cookie_manager.refresh_lardi_cookies_async(cookies_version)
+                        if refresh_success:
+                            logger.info("Cookie успішно оновлено. Повторюємо запит.")
+                            # Важливо: заголовки з новими cookie будуються на початку наступної ітерації
+                            continue  # Повторюємо цикл
+                        lardi_session_pool.evict(lardi_session, "не вдалося оновити cookie після 401")
+                        if lardi_session_pool.healthy_sessions():
+                            logger.warning("Не вдалося оновити cookie. Повторюємо запит через іншу сесію.")
+                            continue
                         logger.error("Не вдалося оновити cookie. Відмова від повторної спроби.")
                         raise  # Прокидаємо оригінальну помилку 401, якщо оновлення не вдалося
-                else:
-                    logger.error(f"HTTP помилка {e.response.status_code} після {attempt + 1} спроб: {e}")
-                    raise  # Прокидаємо інші HTTP помилки або 401 після вичерпання спроб
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Мережева помилка після {attempt + 1} спроб: {e}")
-                raise  # Прокидаємо мережеві помилки
-            except Exception as e:
-                logger.error(f"Невідома помилка після {attempt + 1} спроб: {e}")
-                raise  # Прокидаємо інші невідомі помилки
-        # Цей рядок ніколи не повинен бути досягнутий, якщо помилка прокинута,
-        # але на випадок, якщо щось піде не так і цикл завершиться без повернення.
-        logger.error("Неочікуване завершення декоратора без повернення або прокидання помилки.")
-        raise Exception("Невідома помилка в API запиті після всіх спроб.")
+                    if e.status in SESSION_FAILURE_STATUSES:
+                        lardi_session_pool.record_failure(lardi_session, f"HTTP {e.status}")
+                    if e.status in RETRYABLE_STATUSES and attempt < max_retries:
+                        delay = _retry_delay(attempt, e)
+                        attempt += 1
+                        logger.warning(f"HTTP помилка {e.status}. Повтор {attempt}/{max_retries} через {delay:.1f} с.")
+                    else:
+                        logger.error(f"HTTP помилка {e.status} після {attempt + 1} спроб: {e}")
+                        raise  # Прокидаємо інші HTTP помилки або помилки після вичерпання спроб
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt < max_retries:
+                        delay = _retry_delay(attempt)
+                        attempt += 1
+                        logger.warning(f"Мережева помилка: {e!r}. Повтор {attempt}/{max_retries} через {delay:.1f} с.")
+                    else:
+                        logger.error(f"Мережева помилка після {attempt + 1} спроб: {e!r}")
+                        raise  # Прокидаємо мережеві помилки
+                except Exception as e:
+                    logger.error(f"Невідома помилка після {attempt + 1} спроб: {e}")
+                    raise  # Прокидаємо інші невідомі помилки
+            # Пауза перед повтором - поза орендою: сесія не рахується зайнятою, поки запит лише чекає
+            await asyncio.sleep(delay)
 
     return wrapper
 
@@ -72,28 +142,39 @@ class LardiOfferClient:
     Клієнт для отримання інформації про конкретний вантаж з Lardi-Trans.
     """
 
+    priority = RequestPriority.INTERACTIVE
+
     def __init__(self):
-        self.base_url = "https://lardi-trans.com/webapi/proposal/offer/gruz/"
-        self._update_headers_with_cookies()  # Оновлюємо заголовки при ініціалізації
+        self.base_url = f"{env_config.LARDI_BASE_URL}/webapi/proposal/offer/gruz/"
 
-    def _update_headers_with_cookies(self):
-        """Оновлює заголовки HTTP з поточними cookie від CookieManager."""
-        self.headers = {
+    def _headers_with_cookies(self, lardi_session: LardiSession) -> Dict[str, str]:
+        """Заголовки HTTP для одного запиту з cookie сесії, яка його виконує."""
+        return {
             "accept": "application/json, text/plain, */*",
             "content-type": "application/json",
             "user-agent": "Mozilla/5.0",
-            "referer": "https://lardi-trans.com/log/search/gruz/",
-            "origin": "https://lardi-trans.com",
-            "cookie": _cookie_manager.get_cookie_string()  # Беремо cookie з менеджера
+            "referer": f"{env_config.LARDI_BASE_URL}/log/search/gruz/",
+            "origin": env_config.LARDI_BASE_URL,
+            "cookie": lardi_session.cookie_manager.get_cookie_string()  # Беремо cookie з менеджера сесії
         }
 
-    @lardi_api_retry_on_401
+    # Кеш спільний для всіх екземплярів: бот і Web App проксі відкривають ті самі вантажі
+    cache = AsyncTTLCache(max_entries=env_config.LARDI_OFFER_CACHE_MAX_ENTRIES, ttl=env_config.LARDI_OFFER_CACHE_TTL)
+
     async def get_offer(self, offer_id: int) -> Optional[dict]:
-        """Отримати інформацію про вантаж за ID."""
+        """
+        Отримати інформацію про вантаж за ID.
+        Відповіді кешуються на LARDI_OFFER_CACHE_TTL секунд; паралельні запити одного ID
+        використовують одне завантаження.
+        """
+        return await self.cache.get_or_fetch(offer_id, lambda: self._fetch_offer(offer_id))
+
+    @lardi_api_retry_on_401
+    async def _fetch_offer(self, offer_id: int, *, headers: Dict[str, str]) -> Optional[dict]:
+        """Завантажує інформацію про вантаж з Lardi в обхід кешу."""
         url = f"{self.base_url}{offer_id}/awaiting/?currentId={offer_id}"
-        response = await sync_to_async(requests.get)(url, headers=self.headers, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        return await lardi_http_session.request_json("GET", url, headers=headers, timeout=10,
+                                                     priority=self.priority)
 
 
 class LardiClient:
@@ -101,23 +182,26 @@ class LardiClient:
     Клієнт для пошуку вантажів та управління фільтрами на Lardi-Trans.
     """
 
+    priority = RequestPriority.INTERACTIVE
+
     def __init__(self):
-        self.url = "https://lardi-trans.com/webapi/proposal/search/gruz/"
-        self._update_headers_with_cookies()  # Оновлюємо заголовки при ініціалізації
+        self.url = f"{env_config.LARDI_BASE_URL}/webapi/proposal/search/gruz/"
         self.page = 1
         self.page_size = 20  # 20 це стандарт для Lardi
         self.sort_by_country = False
         self.filters = self.default_filters()
+        self.concurrent_pages = env_config.LARDI_CONCURRENT_PAGES
+        self.page_concurrency = env_config.LARDI_PAGE_CONCURRENCY
 
-    def _update_headers_with_cookies(self):
-        """Оновлює заголовки HTTP з поточними cookie від CookieManager."""
-        self.headers = {
+    def _headers_with_cookies(self, lardi_session: LardiSession) -> Dict[str, str]:
+        """Заголовки HTTP для одного запиту з cookie сесії, яка його виконує."""
+        return {
             "accept": "application/json, text/plain, */*",
             "content-type": "application/json",
-            "origin": "https://lardi-trans.com",
-            "referer": "https://lardi-trans.com/log/search/gruz/",
+            "origin": env_config.LARDI_BASE_URL,
+            "referer": f"{env_config.LARDI_BASE_URL}/log/search/gruz/",
             "user-agent": "Mozilla/5.0",
-            "cookie": _cookie_manager.get_cookie_string(),
+            "cookie": lardi_session.cookie_manager.get_cookie_string(),
         }
 
     def default_filters(self) -> dict:
@@ -168,42 +252,53 @@ class LardiClient:
             "adr": None,
         }
 
+    @staticmethod
+    def compact_filters(filters: dict) -> dict:
+        """
+        Фільтри для тіла запиту: канонічна форма (без значень "без обмеження", зі відсортованими списками),
+        якщо LARDI_COMPACT_FILTERS увімкнено, інакше фільтри без змін.
+        """
+        if env_config.LARDI_COMPACT_FILTERS and isinstance(filters, dict):
+            return json_codec.canonical_filters(filters)
+        return filters
+
+    def search_payload(self, filters: dict, page: int, page_size: int,
+                       sort: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Тіло запиту пошуку для однієї сторінки."""
+        payload = {
+            "page": page,
+            "size": page_size,
+            "sortByCountryFirst": self.sort_by_country,
+            "filter": self.compact_filters(filters),
+        }
+        if sort:
+            payload.update(sort)
+        return payload
+
     def set_filter(self, key: str, value):
         """Оновити або додати фільтр."""
         self.filters[key] = value
 
     @lardi_api_retry_on_401
-    async def load_data(self) -> Optional[dict]:
+    async def load_data(self, *, headers: Dict[str, str]) -> Optional[dict]:
         """
         Завантажує дані за поточними фільтрами.
         Реалізовано механізм повторної спроби у разі 401 помилки.
         """
-        payload = {
-            "page": self.page,
-            "size": self.page_size,
-            "sortByCountryFirst": self.sort_by_country,
-            "filter": self.filters,
-        }
+        payload = self.search_payload(self.filters, self.page, self.page_size)
 
-        response = await sync_to_async(requests.post)(self.url, headers=self.headers, json=payload)
-        response.raise_for_status()
-        return response.json()
+        return await lardi_http_session.request_json("POST", self.url, headers=headers, json=payload,
+                                                     priority=self.priority)
 
     @lardi_api_retry_on_401
-    async def get_proposals(self, filters) -> Optional[dict]:
+    async def get_proposals(self, filters, *, headers: Dict[str, str]) -> Optional[dict]:
         """
         Завантажує дані за фільтрами користувача.
         """
-        payload = {
-            "page": self.page,
-            "size": self.page_size,
-            "sortByCountryFirst": self.sort_by_country,
-            "filter": filters,
-        }
+        payload = self.search_payload(filters, self.page, self.page_size)
 
-        response = await sync_to_async(requests.post)(self.url, headers=self.headers, json=payload)
-        response.raise_for_status()
-        return response.json()
+        return await lardi_http_session.request_json("POST", self.url, headers=headers, json=payload,
+                                                     priority=self.priority)
 
     @sync_to_async
     def _get_filter_object_for_user(self, user_id: int):
@@ -221,71 +316,162 @@ class LardiClient:
             return None
 
     @lardi_api_retry_on_401
-    async def get_offers(self, user_telegram_id: int) -> Optional[List[Dict[str, Any]]]:
+    async def get_offers(self, user_telegram_id: int, *, headers: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
         """
         Асинхронно отримує список вантажів з Lardi-Trans API, використовуючи фільтри
         з бази даних для конкретного користувача, або дефолтні.
         """
         lardi_filter_obj = await self._get_filter_object_for_user(user_telegram_id)
         if lardi_filter_obj:
-            payload = user_filter_to_dict(lardi_filter_obj)
+            payload = self.compact_filters(user_filter_to_dict(lardi_filter_obj))
             logger.info(f"Використання фільтрів з БД для користувача {user_telegram_id}.")
         else:
-            payload = self.default_filters()
+            payload = self.compact_filters(self.default_filters())
             logger.info(f"Фільтри не знайдено для користувача {user_telegram_id}. Використано фільтри за замовчуванням.")
 
-        response = await sync_to_async(requests.post)(self.url, headers=self.headers, json=payload)
-        response.raise_for_status()
-        data = response.json()
+        data = await lardi_http_session.request_json("POST", self.url, headers=headers, json=payload,
+                                                     priority=self.priority)
         return data.get("proposals", [])
 
-    @lardi_api_retry_on_401
-    async def get_all_offers(self, user_telegram_id: int) -> list:
+    async def _get_user_filters(self, user_telegram_id: int) -> dict:
         """
-        Асинхронно отримує всі вантажі з Lardi-Trans API, використовуючи фільтри
-        з бази даних для конкретного користувача, або дефолтні.
+        Повертає фільтри користувача з БД у форматі Lardi API, або дефолтні, якщо їх немає.
         """
         lardi_filter_obj = await self._get_filter_object_for_user(user_telegram_id)
         if lardi_filter_obj:
-            filters = user_filter_to_dict(lardi_filter_obj)
             logger.info(f"Використання фільтрів з БД для користувача {user_telegram_id}.")
-        else:
-            filters = self.default_filters()
-            logger.info(f"Фільтри не знайдено для користувача {user_telegram_id}. Використано фільтри за замовчуванням.")
+            return user_filter_to_dict(lardi_filter_obj)
+        logger.info(f"Фільтри не знайдено для користувача {user_telegram_id}. Використано фільтри за замовчуванням.")
+        return self.default_filters()
 
-        all_proposals = []
-        page = 1
-        page_size = 20
-        total_pages = 0
+    @lardi_api_retry_on_401
+    async def _post_search(self, payload: dict, *, headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Один запит пошуку з повторами при 401/429/5xx/таймаутах."""
+        return await lardi_http_session.request_json("POST", self.url, headers=headers, json=payload,
+                                                     priority=self.priority)
 
-        for i in range(0, 100):
-            payload = {
-                "page": page,
-                "size": page_size,
-                "sortByCountryFirst": self.sort_by_country,
-                "filter": filters,
-            }
+    async def _fetch_page(self, filters: dict, page: int, page_size: int,
+                          sort: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Завантажує одну сторінку пошуку. Якщо сторінку не вдалося отримати навіть після повторів,
+        помилка логується і прокидається далі.
+        :param sort: Додаткові параметри сортування, що додаються до payload.
+        """
+        payload = self.search_payload(filters, page, page_size, sort=sort)
+        try:
+            return await self._post_search(payload)
+        except LardiCircuitOpenError:
+            logger.warning(f"LardiAPI - WARNING - Сторінку {page} пропущено: circuit breaker розімкнений.")
+            raise
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"LardiAPI - ERROR - Сторінка {page}: {e.status}: {e}")
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"LardiAPI - ERROR - Сторінка {page}: {e!r}")
+            raise
+
+    @staticmethod
+    def _extract_proposals(data: Optional[Dict[str, Any]], page: int) -> List[Dict[str, Any]]:
+        """Дістає список вантажів зі сторінки відповіді, відкидаючи некоректні записи."""
+        proposals = (data or {}).get("result", {}).get("proposals", [])
+        logger.info(f"LardiAPI - INFO - Сторінка {page}: отримано {len(proposals)} вантажів")
+        if not isinstance(proposals, list):
+            logger.warning(f"LardiAPI - WARNING - proposals не є списком: {proposals}")
+            return []
+        return [p for p in proposals if isinstance(p, dict)]
+
+    @staticmethod
+    def _extract_total_pages(data: Optional[Dict[str, Any]], page_size: int) -> Optional[int]:
+        """
+        Визначає кількість сторінок з відповіді Lardi.
+        Повертає None, якщо відповідь не містить ні кількості сторінок, ні загальної кількості вантажів.
+        """
+        result = (data or {}).get("result", {})
+        if not isinstance(result, dict):
+            return None
+        paginator = result.get("paginator") if isinstance(result.get("paginator"), dict) else {}
+        for source in (paginator, result):
+            for key in ("totalPages", "pages", "pageCount"):
+                if isinstance(source.get(key), int):
+                    return source[key]
+            for key in ("totalSize", "totalCount", "total", "count"):
+                if isinstance(source.get(key), int):
+                    return -(-source[key] // page_size)
+        return None
+
+    async def iter_offer_pages(self, filters: dict, page_size: int = 20,
+                               sort: Optional[Dict[str, Any]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Асинхронний генератор сторінок пошуку: повертає вантажі сторінка за сторінкою,
+        щойно сторінку отримано, тож у пам'яті одночасно тримається лише одна сторінка.
+        Зупиняється на першій неповній сторінці або після MAX_SEARCH_PAGES сторінок.
+        Помилка завантаження сторінки прокидається: результати не повні, і викликач
+        не повинен вважати, що вантажів більше немає.
+        """
+        for page in range(1, MAX_SEARCH_PAGES + 1):
+            data = await self._fetch_page(filters, page, page_size, sort=sort)
+            proposals = self._extract_proposals(data, page)
+            if proposals:
+                yield proposals
+            if len(proposals) < page_size:
+                return
+
+    async def get_all_offers(self, user_telegram_id: int, concurrent: Optional[bool] = None) -> list:
+        """
+        Асинхронно отримує всі вантажі з Lardi-Trans API, використовуючи фільтри
+        з бази даних для конкретного користувача, або дефолтні.
+        """
+        filters = await self._get_user_filters(user_telegram_id)
+        return await self.get_all_offers_for_filters(filters, concurrent=concurrent)
 
+    async def get_all_offers_for_filters(self, filters: dict, concurrent: Optional[bool] = None) -> list:
+        """
+        Отримує всі вантажі за готовими фільтрами.
+
+        У конкурентному режимі (concurrent=True або self.concurrent_pages) спершу завантажується
+        перша сторінка, а решта сторінок, кількість яких повідомив Lardi, завантажується паралельно
+        з обмеженням self.page_concurrency. Якщо кількість сторінок невідома, сторінки
+        завантажуються послідовно до першої неповної сторінки (див. iter_offer_pages).
+        Помилка будь-якої сторінки скасовує решту запитів і прокидається далі.
+        Пошук нових вантажів для сповіщень завжди гортає сторінки послідовно (див. iter_new_offers_for_filters).
+        """
+        if concurrent is None:
+            concurrent = self.concurrent_pages
+        page_size = self.page_size
+
+        first_page = await self._fetch_page(filters, 1, page_size)
+        all_proposals = self._extract_proposals(first_page, 1)
+        total_pages = 1
+        last_page = self._extract_total_pages(first_page, page_size) if concurrent else None
+
+        if len(all_proposals) >= page_size and last_page is not None:
+            last_page = min(last_page, MAX_SEARCH_PAGES)
+            semaphore = asyncio.Semaphore(self.page_concurrency)
+
+            async def fetch_with_limit(page_number: int) -> Optional[Dict[str, Any]]:
+                async with semaphore:
+                    return await self._fetch_page(filters, page_number, page_size)
+
+            tasks = [asyncio.ensure_future(fetch_with_limit(page)) for page in range(2, last_page + 1)]
             try:
-                response = await sync_to_async(requests.post)(self.url, headers=self.headers, json=payload)
-                response.raise_for_status()
-                data = response.json()
-                proposals = data.get("result", {}).get("proposals", [])
-                logger.info(f"LardiAPI - INFO - Сторінка {page}: отримано {len(proposals)} вантажів")
-                if not isinstance(proposals, list):
-                    logger.warning(f"LardiAPI - WARNING - proposals не є списком: {proposals}")
-                    proposals = []
-                all_proposals.extend([p for p in proposals if isinstance(p, dict)])
+                pages_data = await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+            # Зливаємо сторінки по порядку і зупиняємось на першій неповній сторінці, як і в послідовному режимі
+            for page_number, data in enumerate(pages_data, start=2):
+                proposals = self._extract_proposals(data, page_number)
+                all_proposals.extend(proposals)
+                total_pages += 1
+                if len(proposals) < page_size:
+                    break
+        elif len(all_proposals) >= page_size:
+            for page in range(2, MAX_SEARCH_PAGES + 1):
+                proposals = self._extract_proposals(await self._fetch_page(filters, page, page_size), page)
+                all_proposals.extend(proposals)
                 total_pages += 1
-                if not proposals or len(proposals) < page_size:
+                if len(proposals) < page_size:
                     break
-                page += 1
-            except requests.exceptions.HTTPError as e:
-                logger.error(f"LardiAPI - ERROR - {e.response.status_code}: {e}")
-                break
-            except requests.exceptions.RequestException as e:
-                logger.error(f"LardiAPI - ERROR - {e}")
-                break
 
         logger.info(f"LardiAPI - INFO - Завершено. Всього сторінок: {total_pages}. Всього вантажів: {len(all_proposals)}")
         return all_proposals
@@ -296,91 +482,145 @@ class LardiNotificationClient(LardiClient):
     Клієнт для Lardi-Trans API, спеціалізований на пошуку нових вантажів для сповіщень.
     """
 
-    async def get_new_offers(self, user_telegram_id: int, last_notification_time: datetime) -> List[Dict[str, Any]]:
+    # Фонове опитування поступається місцем діям користувачів у спільному лімітері запитів
+    priority = RequestPriority.BACKGROUND
+
+    # Сортування "найновіші першими" для інкрементального отримання вантажів
+    NEWEST_FIRST_SORT = {"sortingField": "dateCreate", "sortingDirection": "DESC"}
+
+    def __init__(self):
+        super().__init__()
+        self.watermark_overlap = timedelta(seconds=env_config.LARDI_WATERMARK_OVERLAP_SECONDS)
+
+    @staticmethod
+    def offers_created_after(offers: List[Proposal], since: datetime) -> List[Proposal]:
+        """
+        Повертає вантажі, створені після since. Вантажі без коректної dateCreate відкидаються.
+        """
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return [offer for offer in offers if offer.date_create is not None and offer.date_create.utc > since]
+
+    async def get_new_offers(self, user_telegram_id: int, last_notification_time: datetime) -> List[Proposal]:
         """
         Отримує список нових вантажів, створених після last_notification_time,
         з використанням фільтрів користувача.
         """
-        all_offers = await self.get_all_offers(user_telegram_id)
-        if not all_offers:
-            return []
+        filters = await self._get_user_filters(user_telegram_id)
+        return await self.get_new_offers_for_filters(filters, last_notification_time)
 
+    async def get_new_offers_for_filters(self, filters: dict, last_notification_time: datetime,
+                                         facts: Optional[Dict[Any, ProposalFacts]] = None) -> List[Proposal]:
+        """
+        Отримує список нових вантажів, створених після last_notification_time, за готовими фільтрами.
+        Див. iter_new_offers_for_filters.
+        """
         new_offers = []
-        for offer in all_offers:
-            if not isinstance(offer, dict):
-                logger.warning(f"OFFER - WARNING - Пропущено некоректний запис (не dict): {offer}")
-                continue
-            created_at_str = offer.get('dateCreate')
-            if created_at_str:
-                try:
-                    if '.' in created_at_str and '+' in created_at_str:
-                        dt_object = datetime.strptime(created_at_str, '%Y-%m-%dT%H:%M:%S.%f%z')
-                    elif '.' in created_at_str:
-                        dt_object = datetime.strptime(created_at_str, '%Y-%m-%dT%H:%M:%S.%f')
-                        dt_object = dt_object.replace(tzinfo=timezone.utc)  # Припускаємо UTC, якщо немає зони
-                    elif '+' in created_at_str:
-                        dt_object = datetime.strptime(created_at_str, '%Y-%m-%dT%H:%M:%S%z')
-                    else:
-                        dt_object = datetime.strptime(created_at_str, '%Y-%m-%dT%H:%M:%S')
-                        dt_object = dt_object.replace(tzinfo=timezone.utc)  # Припускаємо UTC, якщо немає зони
-
-                    # Приведення last_notification_time до UTC, якщо воно не має tzinfo
-                    if last_notification_time.tzinfo is None:
-                        last_notification_time = last_notification_time.replace(tzinfo=timezone.utc)
-                    if dt_object.tzinfo is not None and dt_object.tzinfo.utcoffset(dt_object) is not None:
-                        dt_object = dt_object.astimezone(timezone.utc)
-                    else:
-                        dt_object = dt_object.replace(tzinfo=timezone.utc)
+        async with aclosing(self.iter_new_offers_for_filters(filters, last_notification_time, facts)) as pages:
+            async for page_offers in pages:
+                new_offers.extend(page_offers)
+        return new_offers
 
-                    if dt_object > last_notification_time:
-                        new_offers.append(offer)
-                except ValueError as e:
-                    logger.error(f"Помилка парсингу дати '{created_at_str}: {e}'")
-            else:
-                logger.warning(f"Вантаж {offer.get('id')} не має поля 'createDate'.")
+    async def iter_new_offers_for_filters(self, filters: dict, last_notification_time: datetime,
+                                          facts: Optional[Dict[Any, ProposalFacts]] = None
+                                          ) -> AsyncIterator[List[Proposal]]:
+        """
+        Асинхронний генератор нових вантажів (створених після last_notification_time) за готовими фільтрами.
+        Повертає нові вантажі кожної сторінки, щойно сторінку отримано, у вигляді Proposal:
+        кожен вантаж розбирається один раз тут, і далі сирий JSON не зберігається.
+        Якщо передано словник facts, у нього за ID вантажу записуються дані для локальної перевірки
+        фільтрів (ProposalFacts) - лише для тих, кому вони потрібні (firehose).
+
+        Сторінки запитуються від найновіших до найстаріших. Пагінація зупиняється, щойно
+        найстаріший вантаж на сторінці старший за last_notification_time мінус
+        self.watermark_overlap, тож зазвичай достатньо однієї сторінки.
+        Сортування Lardi перевіряється на кожній сторінці: якщо вантажі на сторінці не йдуть
+        від новіших до старіших, рання зупинка вимикається і пагінація йде до останньої сторінки.
+        """
+        # Приведення last_notification_time до UTC, якщо воно не має tzinfo
+        if last_notification_time.tzinfo is None:
+            last_notification_time = last_notification_time.replace(tzinfo=timezone.utc)
+        stop_before = last_notification_time - self.watermark_overlap
+
+        seen_ids = set()
+        pages_fetched = 0
+        newest_first = True
+        async with aclosing(self.iter_offer_pages(filters, self.page_size, sort=self.NEWEST_FIRST_SORT)) as pages:
+            async for proposals in pages:
+                pages_fetched += 1
+                new_offers = []
+                oldest_on_page = None
+                previous_created_at = None
+                for offer in proposals:
+                    created_at_str = offer.get('dateCreate')
+                    if not created_at_str:
+                        logger.warning(f"Вантаж {offer.get('id')} не має поля 'createDate'.")
+                        continue
+                    proposal = Proposal(offer)
+                    if proposal.date_create is None:
+                        logger.error(f"Помилка парсингу дати '{created_at_str}'")
+                        continue
+                    dt_object = proposal.date_create.utc
+
+                    if newest_first and previous_created_at is not None and dt_object > previous_created_at:
+                        newest_first = False
+                        logger.warning(
+                            f"LardiAPI - WARNING - Сторінка {pages_fetched} не відсортована за dateCreate від новіших "
+                            f"до старіших (вантаж {proposal.id}). Рання зупинка пагінації вимкнена."
+                        )
+                    previous_created_at = dt_object
+                    if oldest_on_page is None or dt_object < oldest_on_page:
+                        oldest_on_page = dt_object
+                    # Під час пагінації нові вантажі зсувають сторінки, тож один вантаж може прийти двічі
+                    if dt_object > last_notification_time and proposal.id not in seen_ids:
+                        seen_ids.add(proposal.id)
+                        new_offers.append(proposal)
+                        if facts is not None:
+                            facts[proposal.id] = ProposalFacts(offer)
+
+                if new_offers:
+                    yield new_offers
+                if newest_first and oldest_on_page is not None and oldest_on_page < stop_before:
+                    break
 
-        return new_offers
+        logger.info(f"LardiAPI - INFO - Знайдено нових вантажів: {len(seen_ids)} (сторінок: {pages_fetched}).")
 
 
 class LardiGeoClient:
 
+    priority = RequestPriority.INTERACTIVE
+
     def __init__(self):
-        self.url = "https://lardi-trans.com/webapi/geo/region-area-town/"
-        self._update_headers_with_cookies()
+        self.url = f"{env_config.LARDI_BASE_URL}/webapi/geo/region-area-town/"
 
-    def _update_headers_with_cookies(self):
-        """Оновлює заголовки HTTP з поточними cookie від CookieManager."""
-        self.headers = {
+    def _headers_with_cookies(self, lardi_session: LardiSession) -> Dict[str, str]:
+        """Заголовки HTTP для одного запиту з cookie сесії, яка його виконує."""
+        return {
             "accept": "application/json, text/plain, */*",
             "content-type": "application/json",
             "user-agent": "Mozilla/5.0",
-            "referer": "https://lardi-trans.com/log/search/gruz/wf2i640-4iwt2i640-",
-            "origin": "https://lardi-trans.com",
-            "cookie": _cookie_manager.get_cookie_string()
+            "referer": f"{env_config.LARDI_BASE_URL}/log/search/gruz/wf2i640-4iwt2i640-",
+            "origin": env_config.LARDI_BASE_URL,
+            "cookie": lardi_session.cookie_manager.get_cookie_string()
         }
 
     @lardi_api_retry_on_401
-    async def get_geo_data(self, query: str, sign: Optional[str] = None) -> List[Dict[str, Any]]:
+    async def get_geo_data(self, query: str, sign: Optional[str] = None, *,
+                           headers: Dict[str, str]) -> List[Dict[str, Any]]:
         """
         Отримує Географічні дані (регіон, місто) з LardiTrans API
         :param query: Пошуковий запит (Назва міста або регіону).
         :param sign: Необов'язковий параметр для фільтрації за ознакою (наприклад, "UA").
+        :param headers: Заголовки з cookie сесії запиту (передає lardi_api_retry_on_401).
         :return: Список словників з географічним даними.
         """
         params = {
             "query": query,
             'sign': sign if sign else "UA"
         }
-        try:
-            response = requests.get(self.url, headers=self.headers, params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout:
-            logger.error(f"Таймаут запиту при отриманні геоданих для запиту '{query}.'")
-            return []
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Помилка при запиті геоданих для запиту '{query}.'\n Exception: {e}")
-            return []
+        # Помилки не перехоплюються тут, щоб lardi_api_retry_on_401 міг оновити cookie і повторити запит
+        return await lardi_http_session.request_json("GET", self.url, headers=headers, params=params,
+                                                     priority=self.priority)
 
 
 lardi_notification_client = LardiNotificationClient()
@@ -0,0 +1,59 @@
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional
+
+DISPLAY_FORMAT = '%d.%m.%y %H:%M'  # Коротка дата
+
+# Дробова частина секунд довша за 6 цифр (наносекунди) не підтримується fromisoformat у Python < 3.11
+_LONG_FRACTION_RE = re.compile(r"(\.\d{6})\d+")
+
+
+class LardiTimestamp:
+    """
+    Розібрана дата з Lardi.
+    utc     - aware datetime у UTC для порівнянь (дати без зони вважаються UTC);
+    local   - datetime у тій зоні, в якій її повернув Lardi;
+    display - готовий рядок для повідомлень ('01.06.25 10:00', час як у Lardi).
+    Екземпляри незмінні та спільні для однакових рядків (див. parse_lardi_timestamp).
+    """
+    __slots__ = ("utc", "local", "display")
+
+    def __init__(self, local: datetime):
+        if local.tzinfo is None or local.tzinfo.utcoffset(local) is None:
+            local = local.replace(tzinfo=timezone.utc)
+        self.local = local
+        self.utc = local.astimezone(timezone.utc)
+        self.display = local.strftime(DISPLAY_FORMAT)
+
+    def __repr__(self) -> str:
+        return f"LardiTimestamp({self.local.isoformat()})"
+
+
+@lru_cache(maxsize=4096)
+def parse_lardi_timestamp(value: Optional[str]) -> Optional[LardiTimestamp]:
+    """
+    Парсить ISO-дату з Lardi ('2025-06-01T10:00:00', з мілісекундами, 'Z' або зсувом зони).
+    Результати кешуються: у пошуку багато вантажів з однаковими датами (dateFrom, dateTo тощо).
+    Повертає None для порожніх або некоректних значень.
+    """
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        return LardiTimestamp(datetime.fromisoformat(value))
+    except ValueError:
+        pass
+    # Запасний шлях для форматів, які fromisoformat старших версій Python не приймає
+    normalized = _LONG_FRACTION_RE.sub(r"\1", value.strip())
+    if normalized.endswith(("Z", "z")):
+        normalized = normalized[:-1] + "+00:00"
+    try:
+        return LardiTimestamp(datetime.fromisoformat(normalized))
+    except ValueError:
+        return None
+
+
+def display_lardi_date(value, default: str = "-") -> str:
+    """Коротка дата для повідомлень з рядка Lardi або LardiTimestamp; default, якщо дати немає."""
+    timestamp = value if isinstance(value, LardiTimestamp) else parse_lardi_timestamp(value)
+    return timestamp.display if timestamp else default
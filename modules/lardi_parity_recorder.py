@@ -0,0 +1,81 @@
+"""
+Записує відповіді пошуку Lardi-Trans для звірки локального matcher-а з фільтрацією Lardi
+(filters/tests.py, LardiParityTests).
+
+Спершу виконується широкий пошук (фільтри за замовчуванням або --broad), потім вужчі пошуки з --searches.
+У файл записуються вантажі широкого пошуку як є (сирий JSON Lardi) та ID вантажів кожного вужчого пошуку.
+Тест перевіряє, що локальний matcher відбирає з широкого пошуку ті самі вантажі, які повернув Lardi.
+
+Запуск (потрібні дійсні cookie Lardi, як для бота):
+python -m modules.lardi_parity_recorder --searches searches.json
+де searches.json - список {"name": "load_type_top", "filter": {"loadTypes": ["top"]}};
+"filter" доповнює фільтри широкого пошуку.
+"""
+import os
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lardiweb.settings')
+django.setup()
+
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+
+from modules.http_session import lardi_http_session
+from modules.lardi_api_client import LardiClient
+
+logger = logging.getLogger(__name__)
+
+RECORDINGS_DIR = Path(__file__).resolve().parent.parent / "filters" / "fixtures" / "lardi_recorded"
+
+
+async def record(broad_filters: dict, searches: list) -> dict:
+    """Виконує широкий і вужчі пошуки та повертає запис для LardiParityTests."""
+    client = LardiClient()
+    recorded_at = datetime.now(timezone.utc).isoformat()
+    try:
+        proposals = await client.get_all_offers_for_filters(broad_filters, concurrent=False)
+        recorded = []
+        for search in searches:
+            filters = {**broad_filters, **search["filter"]}
+            offers = await client.get_all_offers_for_filters(filters, concurrent=False)
+            recorded.append({"name": search["name"], "filter": filters, "ids": [offer.get("id") for offer in offers]})
+    finally:
+        await lardi_http_session.close()
+    return {
+        "recorded_at": recorded_at,
+        "broad": {"filter": broad_filters, "proposals": proposals},
+        "searches": recorded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запис відповідей пошуку Lardi-Trans для звірки matcher-а.")
+    parser.add_argument("--searches", required=True, help="JSON-файл зі списком вужчих пошуків")
+    parser.add_argument("--broad", default=None, help="JSON-файл з фільтрами широкого пошуку")
+    parser.add_argument("--output", default=None, help="Файл запису (за замовчуванням у filters/fixtures/lardi_recorded/)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.searches, encoding="utf-8") as f:
+        searches = json.load(f)
+    if args.broad:
+        with open(args.broad, encoding="utf-8") as f:
+            broad_filters = json.load(f)
+    else:
+        broad_filters = LardiClient().default_filters()
+
+    recording = asyncio.run(record(broad_filters, searches))
+    output = Path(args.output) if args.output else \
+        RECORDINGS_DIR / f"{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(recording, f, ensure_ascii=False, indent=1)
+    logger.info(f"Записано {len(recording['broad']['proposals'])} вантажів і {len(searches)} пошуків у {output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 import os
 import django
-import requests
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lardiweb.settings')
 django.setup()
@@ -18,9 +17,12 @@ from asgiref.sync import sync_to_async
 from modules.app_config import env_config
 from modules.handlers import user_handlers, admin_handlers, payment_handlers
 from modules.web_server import webapp_handler, cargo_details_proxy_api
-from modules.cookie_manager import CookieManager
-from modules.handlers.user_handlers import lardi_client
+from modules.cookie_manager import CookieManager, lardi_cookie_manager
 from modules.lardi_api_client import LardiGeoClient
+from modules.http_session import lardi_http_session
+from modules.session_pool import lardi_session_pool
+from modules.telegram_sender import telegram_send_queue
+from modules.notification_write_buffer import notification_write_buffer
 
 from django.utils import timezone
 from users.models import UserProfile
@@ -33,21 +35,26 @@ logger = logging.getLogger(__name__)
 
 async def refresh_cookies_periodically(cookie_manager_instance: CookieManager):
     """
-    Фонове завдання для періодичного оновлення Lardi-Trans cookie.
+    Фонове завдання для оновлення Lardi-Trans cookie незадовго до завершення дії критичних cookie.
     """
-    # Перше оновлення при старті
-    logger.info("Performing initial Lardi-Trans cookie refresh...")
-    success = await sync_to_async(cookie_manager_instance.refresh_lardi_cookies)()
-    if success:
-        logger.info("Initial Lardi-Trans cookies refreshed successfully.")
+    # При старті оновлюємо cookie лише якщо поточні вже недійсні
+    if await cookie_manager_instance.validate_cookies():
+        logger.info("Lardi-Trans cookies are still valid. Skipping initial refresh.")
     else:
-        logger.warning("Failed to perform initial Lardi-Trans cookie refresh.")
+        logger.info("Performing initial Lardi-Trans cookie refresh...")
+        success = await cookie_manager_instance.refresh_lardi_cookies_async()
+        if success:
+            logger.info("Initial Lardi-Trans cookies refreshed successfully.")
+        else:
+            logger.warning("Failed to perform initial Lardi-Trans cookie refresh.")
 
-    # Періодичні оновлення
+    # Оновлення за розкладом, що залежить від часу дії cookie
     while True:
-        await asyncio.sleep(2 * 3600) # Чекати 2 години (2 * 60 хвилин * 60 секунд)
-        logger.info("Attempting to refresh Lardi-Trans cookies periodically...")
-        success = await sync_to_async(cookie_manager_instance.refresh_lardi_cookies)()
+        delay = cookie_manager_instance.seconds_until_refresh()
+        logger.info(f"Next Lardi-Trans cookie refresh in {delay / 60:.1f} min.")
+        await asyncio.sleep(delay)
+        logger.info("Attempting to refresh Lardi-Trans cookies before they expire...")
+        success = await cookie_manager_instance.refresh_lardi_cookies_async()
         if success:
             logger.info("Lardi-Trans cookies refreshed successfully.")
         else:
@@ -71,7 +78,10 @@ async def main() -> None:
     if not env_config.LARDI_USERNAME or not env_config.LARDI_PASSWORD:
         logger.warning("LARDI_USERNAME or LARDI_PASSWORD is not configured in .env. LARDI functionality may not work.")
 
-    cookie_manager = CookieManager()
+    cookie_manager = lardi_cookie_manager
+
+    # Спільний пул HTTP-з'єднань для всіх клієнтів Lardi
+    await lardi_http_session.start()
 
     # Ініціалізація бота
     bot = Bot(token=env_config.TELEGRAM_BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
@@ -108,13 +118,24 @@ async def main() -> None:
     web_server_task = asyncio.create_task(web_site.start())
     logger.info("Web server started on http://0.0.0.0:8080")
 
+    # Воркери черги відправки повідомлень Telegram
+    telegram_send_queue.start(bot)
+
     # Запускаємо фонову задачу для перевірки сповіщень
-    notification_task = asyncio.create_task(notification_checker(bot))
+    notification_task = asyncio.create_task(notification_checker())
     logger.info("Запущено фонову задачу перевірки сповіщень.")
 
     # todo - тут потрібно буде зняти коментарій
     cookie_refresh_task = asyncio.create_task(refresh_cookies_periodically(cookie_manager))
-    logger.info("Запущено фонову задачу оновлення Lardi-Trans cookie.")
+    # Додаткові облікові записи пулу сесій оновлюють cookie за власним розкладом
+    extra_cookie_refresh_tasks = [
+        asyncio.create_task(refresh_cookies_periodically(session.cookie_manager))
+        for session in lardi_session_pool.sessions
+        if session.cookie_manager is not cookie_manager
+    ]
+    logger.info(
+        f"Запущено фонову задачу оновлення Lardi-Trans cookie для {len(extra_cookie_refresh_tasks) + 1} сесій."
+    )
 
     # try:
     #     get_client = LardiGeoClient()
@@ -126,16 +147,18 @@ async def main() -> None:
 
     # Запускаємо бота
     logger.info("Бот запущено!")
-    await dp.start_polling(bot)
-
-    await web_server_task
-    await notification_task
-
     try:
-        await lardi_client.get_proposals(filters=lardi_client.default_filter)
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 401:
-            await cookie_refresh_task
+        await dp.start_polling(bot)
+        await web_server_task
+    finally:
+        # Спершу зупиняємо тік сповіщень, щоб він не додавав повідомлень у чергу і записів у буфер під час зупинки
+        background_tasks = [notification_task, cookie_refresh_task, *extra_cookie_refresh_tasks]
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await telegram_send_queue.stop()
+        await notification_write_buffer.flush()
+        await lardi_http_session.close()
 
 if __name__ == "__main__":
 
@@ -0,0 +1,84 @@
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from modules.app_config import env_config
+from users.models import SeenCargo, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationWriteBuffer:
+    """
+    Записи тіку сповіщень у БД, відкладені до кінця тіку.
+    Обробка користувачів лише додає зміни в буфер (без звернень до БД), а flush записує їх
+    в одній транзакції: нові SeenCargo - одним bulk_create, notification_time - одним UPDATE
+    на кожне значення часу (зазвичай одне на тік). Так кількість запитів за тік не залежить
+    від кількості користувачів і вантажів, а спільний потік sync_to_async не зайнятий записами.
+    Якщо запис не вдався, зміни повертаються в буфер і записуються наступним flush.
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+        self._seen: Dict[Tuple[int, int], datetime] = {}  # (UserProfile.id, cargo_id) -> seen_at
+        self._notification_times: Dict[int, datetime] = {}  # UserProfile.id -> notification_time
+
+    def add_seen_cargos(self, user_id: int, cargo_ids: Iterable[int], seen_at: datetime):
+        for cargo_id in cargo_ids:
+            self._seen.setdefault((user_id, cargo_id), seen_at)
+
+    def set_notification_time(self, user_id: int, time_to_set: datetime):
+        self._notification_times[user_id] = time_to_set
+
+    def discard_user(self, user_id: int):
+        """Прибирає незаписані зміни користувача (наприклад, після вимкнення сповіщень)."""
+        self._notification_times.pop(user_id, None)
+        for key in [key for key in self._seen if key[0] == user_id]:
+            del self._seen[key]
+
+    def __len__(self) -> int:
+        return len(self._seen) + len(self._notification_times)
+
+    @sync_to_async
+    def _write(self, seen: Dict[Tuple[int, int], datetime], notification_times: Dict[int, datetime]):
+        user_ids_by_time: Dict[datetime, List[int]] = {}
+        for user_id, time_to_set in notification_times.items():
+            user_ids_by_time.setdefault(time_to_set, []).append(user_id)
+        with transaction.atomic():
+            SeenCargo.objects.bulk_create(
+                [SeenCargo(user_id=user_id, cargo_id=cargo_id, seen_at=seen_at)
+                 for (user_id, cargo_id), seen_at in seen.items()],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+            for time_to_set, user_ids in user_ids_by_time.items():
+                # notification_status=True: не зсуваємо час користувачам, які вимкнули сповіщення під час тіку
+                UserProfile.objects.filter(id__in=user_ids, notification_status=True) \
+                    .update(notification_time=time_to_set)
+
+    async def flush(self):
+        """Записує всі накопичені зміни в БД."""
+        if not self:
+            return
+        seen, self._seen = self._seen, {}
+        notification_times, self._notification_times = self._notification_times, {}
+        try:
+            await self._write(seen, notification_times)
+        except Exception:
+            # Нові зміни, додані під час запису, мають пріоритет над поверненими
+            for key, seen_at in seen.items():
+                self._seen.setdefault(key, seen_at)
+            for user_id, time_to_set in notification_times.items():
+                self._notification_times.setdefault(user_id, time_to_set)
+            raise
+        logger.info(f"Записано в БД: {len(seen)} надісланих вантажів, "
+                    f"notification_time для {len(notification_times)} користувачів.")
+
+    def stats(self) -> Dict[str, int]:
+        return {"seen_cargos": len(self._seen), "notification_times": len(self._notification_times)}
+
+
+notification_write_buffer = NotificationWriteBuffer(batch_size=env_config.NOTIFICATION_WRITE_BATCH_SIZE)
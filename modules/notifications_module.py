@@ -1,23 +1,35 @@
 import asyncio
 import logging
-from typing import List, Dict, Any
+import time
+from contextlib import aclosing
+from typing import Awaitable, Callable, List, Dict, Tuple
 import re
 
 from django.utils import timezone
 
-from aiogram import Bot
 from aiogram.enums import ParseMode
 from asgiref.sync import sync_to_async
 
 from users.models import UserProfile
+from filters.models import LardiSearchFilter
 from modules.lardi_api_client import lardi_notification_client
-from modules.keyboards import get_cargo_details_webapp_keyboard
-from modules.app_config import settings_manager
-from modules.utils import date_format
+from modules.keyboards import get_cargo_details_webapp_keyboard, get_cargo_digest_keyboard
+from modules.app_config import settings_manager, env_config
+from modules.firehose import SubscriptionIndex, poll_firehose
+from modules.rate_governor import lardi_rate_governor
+from modules.circuit_breaker import lardi_circuit_breaker
+from modules.notification_write_buffer import notification_write_buffer
+from modules.seen_cargo_store import seen_cargo_store
+from modules.session_pool import lardi_session_pool
+from modules.telegram_sender import telegram_send_queue
+from modules.lardi_dates import display_lardi_date
+from modules.proposal import Proposal
+from modules.utils import user_filter_to_dict, filter_fingerprint
 
 logger = logging.getLogger(__name__)
 
 NOTIFICATION_CHECK_INTERVAL = 30  # 5 хвилин у секундах
+TELEGRAM_MESSAGE_LIMIT = 4096  # Максимальна довжина тексту повідомлення Telegram
 
 
 def escape_markdown_v2(text: str) -> str:
@@ -30,66 +42,121 @@ def escape_markdown_v2(text: str) -> str:
     return re.sub(r'([%s])' % re.escape(escape_chars), r'\\\1', text)
 
 
-async def send_cargo_notification(bot: Bot, user_profile: UserProfile, cargo: Dict[str, Any]):
+def cargo_message_parts(cargo: Proposal) -> Dict[str, str]:
+    """Поля вантажу для шаблонів повідомлень, екрановані для MarkdownV2."""
+    source, target = cargo.source, cargo.target
+    message_parts = {
+        "cargo_id": str(cargo.id),
+        "dateFrom": display_lardi_date(cargo.date_from),
+        "dateTo": display_lardi_date(cargo.date_to),
+        "dateCreate": display_lardi_date(cargo.date_create),
+        "dateEdit": display_lardi_date(cargo.date_edit),
+
+        "from_town": source.town,
+        "from_region": source.region,
+        "from_countrySign": source.country_sign,
+        "from_address": source.address,
+
+        "to_town": target.town,
+        "to_region": target.region,
+        "to_countrySign": target.country_sign,
+        "to_address": target.address,
+
+        "loadTypes": str(cargo.load_types if cargo.load_types is not None else "-"),
+        "gruzName": str(cargo.gruz_name if cargo.gruz_name is not None else "-"),
+        "gruzMass": str(cargo.mass if cargo.mass is not None else "-"),
+        "gruzVolume": str(cargo.volume if cargo.volume is not None else "-"),
+        "payment": str(cargo.payment if cargo.payment is not None else "-"),
+        "paymentForms": ", ".join(cargo.payment_forms),
+        "distance": cargo.distance_km or '—',
+        "repeated": "🔁 Повторюваний" if cargo.repeated else "",
+    }
+    return {k: escape_markdown_v2(v) for k, v in message_parts.items()}
+
+
+def _telegram_length(text: str) -> int:
+    """Довжина тексту так, як її рахує Telegram (у UTF-16 одиницях: емодзі займають дві)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def build_cargo_digests(cargos: List[Proposal], max_cargos: int = 10) -> List[Tuple[str, List[int]]]:
+    """
+    Пакує вантажі в повідомлення-дайджести: не більше max_cargos вантажів і TELEGRAM_MESSAGE_LIMIT символів
+    на повідомлення. Повертає список (текст MarkdownV2, ID вантажів у порядку рядків).
+    """
+    header_template = settings_manager.get("text_notification_digest_header")
+    line_template = settings_manager.get("text_notification_digest_line")
+    digests = []
+    lines: List[str] = []
+    cargo_ids: List[int] = []
+
+    def flush():
+        if lines:
+            digests.append((header_template.format(count=len(lines)) + "".join(lines), list(cargo_ids)))
+            lines.clear()
+            cargo_ids.clear()
+
+    for cargo in cargos:
+        parts = cargo_message_parts(cargo)
+        line = line_template.format(index=len(lines) + 1, **parts)
+        length = _telegram_length(header_template.format(count=len(lines) + 1)) \
+            + sum(map(_telegram_length, lines)) + _telegram_length(line)
+        if lines and (len(lines) >= max_cargos or length > TELEGRAM_MESSAGE_LIMIT):
+            flush()
+            line = line_template.format(index=1, **parts)
+        lines.append(line)
+        cargo_ids.append(cargo.id)
+    flush()
+    return digests
+
+
+async def send_cargo_digest(user_profile: UserProfile, cargos: List[Proposal]):
+    """
+    Надсилає користувачу кілька нових вантажів стислими рядками в одному або кількох повідомленнях
+    з кнопкою Web App для кожного вантажу.
+    """
+    reserved_ids = await seen_cargo_store.reserve(user_profile.id, [cargo.id for cargo in cargos if cargo.id])
+    if not reserved_ids:
+        return
+    reserved = set(reserved_ids)
+    cargos = [cargo for cargo in cargos if cargo.id in reserved]
+
+    try:
+        digests = build_cargo_digests(cargos, env_config.NOTIFICATION_DIGEST_MAX_CARGOS)
+    except KeyError as e:
+        logger.error(f"Помилка форматування шаблону дайджесту. Відсутня змінна {e}.")
+        seen_cargo_store.settle(user_profile.id, reserved_ids, delivered=False)
+        return
+    for message_text, cargo_ids in digests:
+        sent = telegram_send_queue.enqueue(
+            user_profile.telegram_id,
+            message_text,
+            description=f"дайджест з {len(cargo_ids)} вантажів користувачу {user_profile.user.username}",
+            reply_markup=get_cargo_digest_keyboard(cargo_ids),
+            parse_mode="MarkdownV2",
+        )
+        # Вантажі вважаються надісланими лише після доставки повідомлення
+        seen_cargo_store.settle_when_sent(user_profile.id, cargo_ids, sent)
+
+
+async def send_cargo_notification(user_profile: UserProfile, cargo: Proposal):
     """
     Надсилає користувачу повідомлення про новий вантаж.
     """
-    if not isinstance(cargo, dict):
-        logger.error(f"CARGO IS NOT DICT! {cargo}")
+    if not isinstance(cargo, Proposal):
+        logger.error(f"CARGO IS NOT PROPOSAL! {cargo}")
         return
-    cargo_id = cargo.get("id")
+    cargo_id = cargo.id
     if not cargo_id:
         logger.error(f"Відсутній ID вантажу для сповіщення користувача {user_profile.user.username}")
         return
 
-    # Перевіряємо, чи вантаж вже був пропущений користувачем
-    cargo_skip_list = user_profile.cargo_skip if user_profile.cargo_skip else []
-    if cargo_id in cargo_skip_list:
+    # Перевіряємо, чи вантаж вже був надісланий користувачу
+    if not await seen_cargo_store.reserve(user_profile.id, [cargo_id]):
         logger.info(f"Вантаж {cargo_id} вже був надісланий або пропущений для {user_profile.user.username}. Пропускаємо.")
         return
 
-    # Оновлюємо cargo_skip, щоб не надсилати цей вантаж знову
-    @sync_to_async
-    def update_cargo_skip(user_profile_obj, cargo_id_to_add):
-        if user_profile_obj.cargo_skip is None:
-            user_profile_obj.cargo_skip = []
-        if cargo_id_to_add not in user_profile_obj.cargo_skip:
-            user_profile_obj.cargo_skip.append(cargo_id_to_add)
-            user_profile_obj.save(update_fields=['cargo_skip'])
-            logger.info(f"Додано {cargo_id_to_add} до cargo_skip для {user_profile_obj.user.username}")
-
-    await update_cargo_skip(user_profile, cargo_id)
-
-    from_address = str(cargo.get("waypointListSource", [{}])[0].get("address", "-"))
-    to_address = str(cargo.get("waypointListTarget", [{}])[0].get("address", "-"))
-    message_parts = {
-        "cargo_id": str(cargo_id),
-        "dateFrom": str(date_format(cargo.get("dateFrom", "-"))),
-        "dateTo": str(date_format(cargo.get("dateTo", "-"))),
-        "dateCreate": str(date_format(cargo.get("dateCreate", "-"))),
-        "dateEdit": str(date_format(cargo.get("dateEdit", "-"))),
-
-        "from_town": str(cargo.get("waypointListTarget", [{}])[0].get("town", "-")),
-        "from_region": str(cargo.get("waypointListTarget", [{}])[0].get("region", "-")),
-        "from_countrySign": str(cargo.get("waypointListTarget", [{}])[0].get("countrySign", "-")),
-        "from_address": from_address if not None else "Пусто",
-
-        "to_town": str(cargo.get("waypointListTarget", [{}])[0].get("town", "-")),
-        "to_region": str(cargo.get("waypointListTarget", [{}])[0].get("region", "-")),
-        "to_countrySign": str(cargo.get("waypointListTarget", [{}])[0].get("countrySign", "-")),
-        "to_address": to_address if not None else "Пусто",
-
-        "loadTypes": str(cargo.get("loadTypes", "-")),
-        "gruzName": str(cargo.get("gruzName", "-")),
-        "gruzMass": str(cargo.get("gruzMass", "-")),
-        "gruzVolume": str(cargo.get("gruzVolume", "-")),
-        "payment": str(cargo.get("payment", "-")),
-        "paymentForms": ", ".join(pf.get("name", "") for pf in cargo.get("paymentForms", [])),
-        "distance": round(cargo.get("distance", 0) / 1000) if cargo.get("distance") else '—',
-        "repeated": "🔁 Повторюваний" if cargo.get("repeated") else "",
-    }
-
-    escaped_message_parts = {k: escape_markdown_v2(v) for k, v in message_parts.items()}
+    escaped_message_parts = cargo_message_parts(cargo)
 
     template = settings_manager.get("text_notification_new_cargo")
 
@@ -100,25 +167,24 @@ async def send_cargo_notification(bot: Bot, user_profile: UserProfile, cargo: Di
     except KeyError as e:
         logger.error(
             f"Помилка форматування шаблону 'text_notification_new_cargo'. Відсутня змінна {e} у даних вантажу або escape_markdown_v2: {cargo}. Шаблон: {template}")
-        return await bot.send_message(
-            chat_id=user_profile.telegram_id,
-            text="Не вдалось сформувати повідомлення про новий вантаж.",
+        seen_cargo_store.settle(user_profile.id, [cargo_id], delivered=False)
+        telegram_send_queue.enqueue(
+            user_profile.telegram_id,
+            "Не вдалось сформувати повідомлення про новий вантаж.",
             parse_mode=ParseMode.HTML,
         )
+        return
 
-    try:
-        await bot.send_message(
-            chat_id=user_profile.telegram_id,
-            text=message_text,
-            reply_markup=get_cargo_details_webapp_keyboard(cargo_id),
-            parse_mode="MarkdownV2"
-        )
-        logger.info(f"Надіслано сповіщення про вантаж {cargo_id} користувачу {user_profile.user.username}")
-    except Exception as e:
-        logger.error(
-            f"Не вдалося надіслати сповіщення користувачу {user_profile.user.username} (ID: {user_profile.telegram_id}): {e}\n"
-            f"Текст повідомлення: {message_text}"
-        )
+    # Відправка йде через чергу з лімітами Telegram, пошук вантажів на неї не чекає.
+    # Вантаж вважається надісланим лише після доставки повідомлення.
+    sent = telegram_send_queue.enqueue(
+        user_profile.telegram_id,
+        message_text,
+        description=f"сповіщення про вантаж {cargo_id} користувачу {user_profile.user.username}",
+        reply_markup=get_cargo_details_webapp_keyboard(cargo_id),
+        parse_mode="MarkdownV2",
+    )
+    seen_cargo_store.settle_when_sent(user_profile.id, [cargo_id], sent)
 
 
 @sync_to_async
@@ -126,57 +192,196 @@ def get_active_notification_users() -> List[UserProfile]:
     """
     Повертає список UserProfile, у яких увімкнено сповіщення.
     """
-    return list(UserProfile.objects.select_related("user").filter(
+    return list(UserProfile.objects.select_related("user").defer("cargo_skip").filter(
         notification_status=True,
         notification_time__isnull=False
     ))
 
 
-async def notification_checker(bot: Bot):
+@sync_to_async
+def get_users_search_filters(user_profiles: List[UserProfile]) -> Dict[int, dict]:
+    """
+    Повертає фільтри Lardi для кожного UserProfile.id одним запитом до БД.
+    Користувачам без збереженого фільтра підставляються фільтри за замовчуванням.
+    """
+    filters_by_profile = {
+        lardi_filter.user_id: user_filter_to_dict(lardi_filter)
+        for lardi_filter in LardiSearchFilter.objects.filter(user__in=user_profiles)
+    }
+    return {
+        user_profile.id: filters_by_profile.get(user_profile.id) or lardi_notification_client.default_filters()
+        for user_profile in user_profiles
+    }
+
+
+def group_users_by_filter(user_profiles: List[UserProfile],
+                          filters_by_user: Dict[int, dict]) -> Dict[str, List[UserProfile]]:
+    """
+    Групує користувачів за хешем їхніх фільтрів, щоб виконувати один пошук на групу.
+    """
+    groups: Dict[str, List[UserProfile]] = {}
+    for user_profile in user_profiles:
+        fingerprint = filter_fingerprint(filters_by_user[user_profile.id])
+        groups.setdefault(fingerprint, []).append(user_profile)
+    return groups
+
+
+def update_user_notification_time(user_prof_obj, time_to_set):
+    """Зсуває notification_time користувача; у БД зміна потрапляє з notification_write_buffer.flush() в кінці тіку."""
+    user_prof_obj.notification_time = time_to_set
+    notification_write_buffer.set_notification_time(user_prof_obj.id, time_to_set)
+
+
+async def send_new_cargos(user_profile: UserProfile, candidate_cargos: List[Proposal]):
+    """
+    Надсилає користувачу вантажі з candidate_cargos, новіші за його notification_time.
+    """
+    try:
+        new_cargos = lardi_notification_client.offers_created_after(
+            candidate_cargos,
+            user_profile.notification_time
+        )
+
+        if new_cargos:
+            logger.info(f"Знайдено {len(new_cargos)} нових вантажів для {user_profile.user.username}.")
+            if user_profile.notification_digest and len(new_cargos) > 1:
+                await send_cargo_digest(user_profile, new_cargos)
+            else:
+                for cargo in new_cargos:
+                    await send_cargo_notification(user_profile, cargo)
+
+    except Exception as e:
+        logger.error(f"Помилка при перевірці сповіщень для користувача {user_profile.user.username}: {e}")
+
+
+async def run_isolated(semaphore: asyncio.Semaphore, description: str, work: Callable[[], Awaitable]) -> bool:
+    """
+    Виконує обробку одного користувача або групи в тіку сповіщень: не більше NOTIFICATION_CONCURRENCY
+    одночасно і не довше NOTIFICATION_USER_TIMEOUT секунд. Помилка чи таймаут не зачіпають інших
+    користувачів. Повертає True, якщо обробка завершилась вчасно.
+    """
+    async with semaphore:
+        try:
+            await asyncio.wait_for(work(), timeout=env_config.NOTIFICATION_USER_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"Обробка {description} перевищила {env_config.NOTIFICATION_USER_TIMEOUT} с і була перервана.")
+        except Exception as e:
+            logger.error(f"Помилка обробки {description}: {e}", exc_info=True)
+        return False
+
+
+async def notify_user(user_profile: UserProfile, candidate_cargos: List[Proposal], time_to_set):
+    """
+    Надсилає користувачу вантажі, новіші за його notification_time, та зсуває notification_time.
+    """
+    logger.info(f"user_id={user_profile.id}, telegram_id={user_profile.telegram_id}")  # Не чіпаємо user.username тут
+    await send_new_cargos(user_profile, candidate_cargos)
+    update_user_notification_time(user_profile, time_to_set)
+
+
+async def notify_filter_groups(user_profiles: List[UserProfile], filters_by_user: Dict[int, dict], time_to_set):
+    """
+    Виконує один пошук на кожен унікальний фільтр і надсилає вантажі користувачам групи
+    сторінка за сторінкою, щойно сторінку отримано, після чого зсуває їхній notification_time.
+    Групи обробляються паралельно (див. run_isolated). Групи, пошук для яких не виконувався
+    (circuit breaker), завершився помилкою або не встиг завершитися, зберігають свій notification_time.
+    """
+    user_groups = group_users_by_filter(user_profiles, filters_by_user)
+    logger.info(f"Унікальних фільтрів: {len(user_groups)} для {len(user_profiles)} користувачів.")
+
+    semaphore = asyncio.Semaphore(env_config.NOTIFICATION_CONCURRENCY)
+    await asyncio.gather(*(
+        run_isolated(semaphore, f"фільтра {fingerprint}",
+                     lambda group=group: notify_filter_group(group, filters_by_user[group[0].id], time_to_set))
+        for fingerprint, group in user_groups.items()
+    ))
+
+
+async def notify_filter_group(group: List[UserProfile], filters: dict, time_to_set):
+    """Один пошук для групи користувачів з однаковим фільтром."""
+    if lardi_circuit_breaker.is_open:
+        logger.warning("Lardi API деградував посеред тіку, пошук для групи пропущено.")
+        return
+    # Шукаємо від найстарішого watermark у групі, далі відсіюємо для кожного користувача окремо
+    group_since = min(u.notification_time for u in group)
+    try:
+        async with aclosing(lardi_notification_client.iter_new_offers_for_filters(filters, group_since)) as pages:
+            async for page_cargos in pages:
+                for user_profile in group:
+                    await send_new_cargos(user_profile, page_cargos)
+    except Exception as e:
+        # Пагінація не завершилась: вантажі з неотриманих сторінок знайдемо в наступному тіку
+        logger.error(f"Помилка при пошуку вантажів для фільтра {filter_fingerprint(filters)}: {e}. "
+                     f"notification_time групи не змінюється.")
+        return
+    for user_profile in group:
+        update_user_notification_time(user_profile, time_to_set)
+
+
+async def notification_checker():
     """
     Основна функція, яка періодично перевіряє наявність нових вантажів
     для всіх користувачів з увімкненими сповіщеннями.
+
+    У режимі NOTIFICATION_MODE="firehose" бот опитує широкі запити за країнами завантаження
+    і розподіляє вантажі через SubscriptionIndex; решта користувачів (і всі в режимі "per_filter")
+    обслуговуються одним пошуком на кожен унікальний фільтр.
     """
     while True:
         try:
-            logger.info("Запуск періодичної перевірки вантажів для сповіщень...")
-            users_to_notify = await get_active_notification_users()
-            logger.info(f"Користувачі для сповіщень (id): {[u.id for u in users_to_notify]}")
+            if lardi_circuit_breaker.is_open:
+                logger.warning(f"Lardi API деградував, пропускаємо тік сповіщень: {lardi_circuit_breaker.stats()}")
+                await asyncio.sleep(NOTIFICATION_CHECK_INTERVAL)
+                continue
 
-            for user_profile in users_to_notify:
-                logger.info(f"user_id={user_profile.id}, telegram_id={user_profile.telegram_id}")  # Не чіпаємо user.username тут
-                last_notification_time = user_profile.notification_time
-                if not last_notification_time:
+            logger.info("Запуск періодичної перевірки вантажів для сповіщень...")
+            tick_started_monotonic = time.monotonic()
+            # Час початку тіку стає новим notification_time, щоб не загубити вантажі,
+            # створені поки тік обробляється
+            tick_started_at = timezone.now()
+            users_to_notify = []
+            for user_profile in await get_active_notification_users():
+                if not user_profile.notification_time:
                     logger.warning(f"Користувач {user_profile.user.username} має увімкнені сповіщення, але відсутній notification_time. Пропускаємо.")
                     continue
+                users_to_notify.append(user_profile)
+            logger.info(f"Користувачі для сповіщень (id): {[u.id for u in users_to_notify]}")
 
-                try:
-                    # Отримуємо нові вантажі для користувача, використовуючи його фільтри
-                    new_cargos = await lardi_notification_client.get_new_offers(
-                        user_profile.telegram_id,
-                        last_notification_time
-                    )
-
-                    if new_cargos:
-                        logger.info(f"Знайдено {len(new_cargos)} нових вантажів для {user_profile.user.username}.")
-                        for cargo in new_cargos:
-                            await asyncio.sleep(0.5)
-                            await send_cargo_notification(bot, user_profile, cargo)
-                    else:
-                        logger.info(f"Не знайдено нових вантажів для {user_profile.user.username}.")
-
-
-                except Exception as e:
-                    logger.error(f"Помилка при перевірці сповіщень для користувача {user_profile.user.username}: {e}")
-
-                @sync_to_async
-                def update_user_notification_time(user_prof_obj, time_to_set):
-                    user_prof_obj.notification_time = time_to_set
-                    user_prof_obj.save(update_fields=["notification_time"])
-                    local_time_for_log = timezone.localtime(time_to_set)
-                    logger.info(f"Оновлено notification_time до {local_time_for_log} для користувача {user_prof_obj.user.username}.")
-
-                await update_user_notification_time(user_profile, timezone.now())
+            filters_by_user = await get_users_search_filters(users_to_notify)
+            # Надіслані вантажі всіх користувачів тіку - одним запитом, далі перевірки йдуть у пам'яті
+            await seen_cargo_store.preload([user_profile.id for user_profile in users_to_notify])
+
+            if env_config.NOTIFICATION_MODE == "firehose":
+                subscription_index = SubscriptionIndex.build(users_to_notify, filters_by_user)
+                cargos_by_user = await poll_firehose(lardi_notification_client, subscription_index)
+                per_filter_users = subscription_index.fallback_users
+                semaphore = asyncio.Semaphore(env_config.NOTIFICATION_CONCURRENCY)
+                # Користувачі, для яких пошук не виконувався (circuit breaker), зберігають свій watermark
+                await asyncio.gather(*(
+                    run_isolated(semaphore, f"користувача {user_profile.id}",
+                                 lambda user_profile=user_profile: notify_user(
+                                     user_profile, cargos_by_user[user_profile.id], tick_started_at))
+                    for user_profile in subscription_index.subscribers
+                    if user_profile.id in cargos_by_user
+                ))
+            else:
+                per_filter_users = users_to_notify
+
+            if per_filter_users:
+                await notify_filter_groups(per_filter_users, filters_by_user, tick_started_at)
+
+            # Усі записи тіку (надіслані вантажі та notification_time) - однією транзакцією
+            await notification_write_buffer.flush()
+
+            logger.info(f"Тік сповіщень для {len(users_to_notify)} користувачів тривав "
+                        f"{time.monotonic() - tick_started_monotonic:.1f} с.")
+            logger.info(f"Лімітер запитів Lardi: {lardi_rate_governor.stats()}")
+            logger.info(f"Circuit breaker Lardi: {lardi_circuit_breaker.stats()}")
+            logger.info(f"Сесії Lardi: {lardi_session_pool.stats()}")
+            logger.info(f"Черга відправки Telegram: {telegram_send_queue.stats()}")
+            logger.info(f"Надіслані вантажі в пам'яті: {seen_cargo_store.stats()}")
+            await seen_cargo_store.prune()
 
         except Exception as e:
             logger.error(f"FATAL ERROR in notification_checker: {e}", exc_info=True)
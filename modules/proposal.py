@@ -0,0 +1,65 @@
+from typing import Any, Dict, Optional, Tuple
+
+from modules.lardi_dates import LardiTimestamp, parse_lardi_timestamp
+
+
+class Waypoint:
+    """Точка маршруту вантажу: лише поля, які показує бот."""
+    __slots__ = ("town", "region", "country_sign", "address")
+
+    def __init__(self, town: str = "-", region: str = "-", country_sign: str = "-", address: str = "-"):
+        self.town = town
+        self.region = region
+        self.country_sign = country_sign
+        self.address = address
+
+    @classmethod
+    def from_list(cls, waypoints) -> "Waypoint":
+        """Перша точка зі списку waypointListSource / waypointListTarget."""
+        waypoint = waypoints[0] if isinstance(waypoints, list) and waypoints and isinstance(waypoints[0], dict) else {}
+        return cls(
+            town=str(waypoint.get("town", "-")),
+            region=str(waypoint.get("region", "-")),
+            country_sign=str(waypoint.get("countrySign", "-")),
+            address=str(waypoint.get("address", "-")),
+        )
+
+
+class Proposal:
+    """
+    Вантаж з пошуку Lardi, розібраний один раз при отриманні.
+    Містить лише поля, які використовують сповіщення, замість повного JSON вантажу.
+    Дані для перевірки фільтрів (filter_matcher.ProposalFacts) обчислюються окремо і лише там,
+    де вантажі перевіряються локально (firehose), щоб не тримати їх у кожному вантажі.
+    """
+    __slots__ = ("id", "date_create", "date_edit", "date_from", "date_to", "source", "target",
+                 "gruz_name", "mass", "volume", "load_types", "payment", "payment_forms",
+                 "distance", "repeated")
+
+    def __init__(self, data: Dict[str, Any]):
+        self.id = data.get("id")
+        # Дати - спільні LardiTimestamp (UTC для порівнянь та готовий рядок для показу)
+        self.date_create: Optional[LardiTimestamp] = parse_lardi_timestamp(data.get("dateCreate"))
+        self.date_edit: Optional[LardiTimestamp] = parse_lardi_timestamp(data.get("dateEdit"))
+        self.date_from: Optional[LardiTimestamp] = parse_lardi_timestamp(data.get("dateFrom"))
+        self.date_to: Optional[LardiTimestamp] = parse_lardi_timestamp(data.get("dateTo"))
+        self.source = Waypoint.from_list(data.get("waypointListSource"))
+        self.target = Waypoint.from_list(data.get("waypointListTarget"))
+        self.gruz_name = data.get("gruzName")
+        self.mass = data.get("gruzMass")
+        self.volume = data.get("gruzVolume")
+        self.load_types = data.get("loadTypes")
+        self.payment = data.get("payment")
+        self.payment_forms: Tuple[str, ...] = tuple(
+            str(payment_form.get("name", "")) for payment_form in data.get("paymentForms") or []
+            if isinstance(payment_form, dict)
+        )
+        self.distance = data.get("distance")
+        self.repeated = bool(data.get("repeated"))
+
+    @property
+    def distance_km(self) -> Optional[int]:
+        return round(self.distance / 1000) if isinstance(self.distance, (int, float)) and self.distance else None
+
+    def __repr__(self) -> str:
+        return f"Proposal(id={self.id!r}, date_create={self.date_create!r})"
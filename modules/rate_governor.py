@@ -0,0 +1,125 @@
+import asyncio
+import enum
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from modules.app_config import env_config
+
+logger = logging.getLogger(__name__)
+
+
+class RequestPriority(enum.IntEnum):
+    """Класи пріоритету для RateGovernor. Менше значення обслуговується раніше."""
+    INTERACTIVE = 0  # Дії користувача: пошук, деталі вантажу, Web App, геопошук
+    BACKGROUND = 1  # Фонове опитування для сповіщень
+
+
+class RateGovernor:
+    """
+    Token bucket з пріоритетною чергою очікувачів.
+    Обмежує середню швидкість дій (rate на секунду) з допустимим сплеском burst.
+    Коли токенів немає, виклики acquire стають у чергу, і інтерактивні отримують токен
+    раніше за фонові, незалежно від порядку надходження.
+    Обмежує запити до Lardi-Trans (lardi_rate_governor, ліміти сесій пулу) та відправку повідомлень Telegram.
+    """
+
+    def __init__(self, rate: float = 5, burst: int = 10):
+        if rate <= 0:
+            raise ValueError(f"Швидкість RateGovernor має бути додатною, отримано rate={rate}.")
+        if burst < 1:
+            raise ValueError(f"Сплеск RateGovernor має бути не менше 1, отримано burst={burst}.")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._waiters: List[tuple] = []  # heap: (priority, seq, future)
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._acquired = {priority: 0 for priority in RequestPriority}
+        self._total_wait = {priority: 0.0 for priority in RequestPriority}
+        self._max_wait = {priority: 0.0 for priority in RequestPriority}
+
+    def _refill(self):
+        now = time.monotonic()
+        # Під час паузи (див. pause) _updated_at у майбутньому, і токени не накопичуються
+        if now > self._updated_at:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+    def pause(self, seconds: float):
+        """Не видає токенів найближчі seconds секунд, наприклад, коли сервіс попросив зачекати (flood wait)."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+        self._updated_at = max(self._updated_at, time.monotonic() + seconds)
+
+    def _record(self, priority: RequestPriority, waited: float):
+        self._acquired[priority] += 1
+        self._total_wait[priority] += waited
+        if waited > self._max_wait[priority]:
+            self._max_wait[priority] = waited
+
+    def _dispatch(self):
+        """Видає токени очікувачам у порядку пріоритету та планує наступне пробудження."""
+        self._timer = None
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # Очікувач скасований
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        if self._waiters:
+            delay = max(self._updated_at - time.monotonic(), 0) + max((1 - self._tokens) / self.rate, 0)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    async def acquire(self, priority: RequestPriority = RequestPriority.INTERACTIVE):
+        """Чекає на токен для однієї дії (запиту чи повідомлення)."""
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            self._record(priority, 0.0)
+            return
+
+        started_at = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), future))
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._tokens += 1  # Токен уже видано, але запит не відбудеться - повертаємо його
+            raise
+        self._record(priority, time.monotonic() - started_at)
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Кількість запитів у черзі для кожного класу пріоритету."""
+        depth = {priority.name.lower(): 0 for priority in RequestPriority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth[RequestPriority(priority).name.lower()] += 1
+        return depth
+
+    def stats(self) -> Dict[str, Any]:
+        """Глибина черги та статистика очікування для логів і моніторингу."""
+        self._refill()
+        return {
+            "tokens": round(self._tokens, 2),
+            "queue_depth": self.queue_depth(),
+            "acquired": {p.name.lower(): self._acquired[p] for p in RequestPriority},
+            "avg_wait": {
+                p.name.lower(): round(self._total_wait[p] / self._acquired[p], 3) if self._acquired[p] else 0.0
+                for p in RequestPriority
+            },
+            "max_wait": {p.name.lower(): round(self._max_wait[p], 3) for p in RequestPriority},
+        }
+
+
+lardi_rate_governor = RateGovernor(
+    rate=env_config.LARDI_RATE_LIMIT_PER_SECOND,
+    burst=env_config.LARDI_RATE_BURST,
+)
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from modules.app_config import env_config
+from modules.notification_write_buffer import NotificationWriteBuffer, notification_write_buffer
+from users.models import SeenCargo
+
+logger = logging.getLogger(__name__)
+
+
+class SeenCargoStore:
+    """
+    Надіслані користувачам вантажі: таблиця SeenCargo (user, cargo_id, seen_at) та її копія в пам'яті.
+    Записи користувача завантажуються з БД один раз (preload на початку тіку), після чого перевірка
+    "вже надсилали?" не звертається до БД. Вантаж резервується (reserve) перед відправкою, а після доставки
+    потрапляє в NotificationWriteBuffer і записується одним bulk_create з наступним flush.
+    Записи старші за ttl видаляються з БД і пам'яті не частіше ніж раз на prune_interval секунд.
+    Між очищеннями пам'ять обмежена: у кожного користувача не більше max_per_user записів, застарілі
+    та найстаріші понад ліміт витісняються під час додавання нових.
+    """
+
+    def __init__(self, ttl: timedelta, prune_interval: float = 3600, max_per_user: int = 5000,
+                 write_buffer: NotificationWriteBuffer = notification_write_buffer):
+        self.ttl = ttl
+        self.max_per_user = max_per_user
+        self.write_buffer = write_buffer
+        self.prune_interval = prune_interval
+        self._seen: Dict[int, Dict[int, datetime]] = {}  # UserProfile.id -> {cargo_id: seen_at}, від найстаріших
+        self._last_prune = 0.0
+
+    def _cutoff(self) -> datetime:
+        return timezone.now() - self.ttl
+
+    @sync_to_async
+    def _load(self, user_ids: List[int]) -> Dict[int, Dict[int, datetime]]:
+        loaded = {user_id: {} for user_id in user_ids}
+        rows = SeenCargo.objects.filter(user_id__in=user_ids, seen_at__gte=self._cutoff()) \
+            .order_by("seen_at").values_list("user_id", "cargo_id", "seen_at")
+        for user_id, cargo_id, seen_at in rows:
+            loaded[user_id][cargo_id] = seen_at
+        return loaded
+
+    async def preload(self, user_ids: Iterable[int]):
+        """Одним запитом завантажує записи користувачів, яких ще немає в пам'яті."""
+        missing = [user_id for user_id in set(user_ids) if user_id not in self._seen]
+        if missing:
+            for user_id, seen in (await self._load(missing)).items():
+                self._trim(seen)
+                self._seen.setdefault(user_id, seen)
+
+    def _trim(self, seen: Dict[int, datetime]):
+        """Витісняє з початку (найстаріші) записи, старші за ttl або понад max_per_user."""
+        cutoff = self._cutoff()
+        while seen:
+            cargo_id, seen_at = next(iter(seen.items()))
+            if seen_at >= cutoff and len(seen) <= self.max_per_user:
+                break
+            del seen[cargo_id]
+
+    async def filter_unseen(self, user_id: int, cargo_ids: Iterable[int]) -> List[int]:
+        """Повертає ID вантажів, про які користувача ще не сповіщали, зі збереженням порядку."""
+        await self.preload([user_id])
+        seen = self._seen[user_id]
+        return [cargo_id for cargo_id in cargo_ids if cargo_id not in seen]
+
+    async def reserve(self, user_id: int, cargo_ids: Iterable[int]) -> List[int]:
+        """
+        Позначає в пам'яті ще не надіслані вантажі як такі, що надсилаються, і повертає їхні ID зі збереженням
+        порядку. Повторний виклик для тих самих вантажів повертає порожній список, тож вантаж не потрапить
+        у чергу відправки двічі. Результат відправки фіксує settle: у БД потрапляють лише доставлені вантажі.
+        """
+        await self.preload([user_id])
+        seen = self._seen[user_id]
+        now = timezone.now()
+        new_ids = [cargo_id for cargo_id in dict.fromkeys(cargo_ids) if cargo_id not in seen]
+        for cargo_id in new_ids:
+            seen[cargo_id] = now
+        self._trim(seen)
+        return new_ids
+
+    def settle(self, user_id: int, cargo_ids: List[int], delivered: bool):
+        """
+        Доставлені вантажі записуються в БД з наступним write_buffer.flush(), недоставлені знову вважаються
+        не надісланими. Вантажі користувача, якого тим часом забули (forget_user), не записуються.
+        """
+        seen = self._seen.get(user_id, {})
+        if not delivered:
+            for cargo_id in cargo_ids:
+                seen.pop(cargo_id, None)
+            return
+        delivered_ids = [cargo_id for cargo_id in cargo_ids if cargo_id in seen]
+        if delivered_ids:
+            self.write_buffer.add_seen_cargos(user_id, delivered_ids, timezone.now())
+
+    def settle_when_sent(self, user_id: int, cargo_ids: List[int], sent: asyncio.Future):
+        """Викликає settle, щойно future з черги відправки (TelegramSendQueue.enqueue) завершиться."""
+        sent.add_done_callback(
+            lambda future: self.settle(user_id, cargo_ids, not future.cancelled() and future.exception() is None)
+        )
+
+    @sync_to_async
+    def _delete_user(self, user_id: int):
+        SeenCargo.objects.filter(user_id=user_id).delete()
+
+    async def forget_user(self, user_id: int):
+        """Очищує надіслані вантажі користувача (при увімкненні/вимкненні сповіщень)."""
+        self._seen.pop(user_id, None)
+        self.write_buffer.discard_user(user_id)
+        await self._delete_user(user_id)
+
+    @sync_to_async
+    def _delete_expired(self, cutoff: datetime) -> int:
+        deleted, _ = SeenCargo.objects.filter(seen_at__lt=cutoff).delete()
+        return deleted
+
+    async def prune(self, force: bool = False):
+        """Видаляє записи старші за ttl, якщо з попереднього очищення минуло prune_interval секунд."""
+        if not force and time.monotonic() - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = time.monotonic()
+        cutoff = self._cutoff()
+        for user_id, seen in list(self._seen.items()):
+            seen = {cargo_id: seen_at for cargo_id, seen_at in seen.items() if seen_at >= cutoff}
+            if seen:
+                self._seen[user_id] = seen
+            else:
+                # Буде завантажено з БД знову, якщо користувач повернеться
+                del self._seen[user_id]
+        deleted = await self._delete_expired(cutoff)
+        if deleted:
+            logger.info(f"Видалено {deleted} застарілих записів про надіслані вантажі.")
+
+    def stats(self) -> Dict[str, int]:
+        return {"users": len(self._seen), "cargos": sum(len(seen) for seen in self._seen.values())}
+
+
+seen_cargo_store = SeenCargoStore(
+    ttl=timedelta(days=env_config.NOTIFICATION_SEEN_CARGO_TTL_DAYS),
+    prune_interval=env_config.NOTIFICATION_SEEN_CARGO_PRUNE_INTERVAL,
+    max_per_user=env_config.NOTIFICATION_SEEN_CARGO_MAX_PER_USER,
+)
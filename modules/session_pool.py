@@ -0,0 +1,198 @@
+import asyncio
+import itertools
+import json
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from modules.app_config import env_config
+from modules.cookie_manager import CookieManager, lardi_cookie_manager
+from modules.http_session import current_session_governor
+from modules.rate_governor import RateGovernor
+
+logger = logging.getLogger(__name__)
+
+# Сесія пулу, від імені якої виконується поточний запит до Lardi
+current_lardi_session: ContextVar[Optional["LardiSession"]] = ContextVar("current_lardi_session", default=None)
+
+
+class LardiSession:
+    """
+    Одна авторизована сесія Lardi-Trans (окремий обліковий запис і набір cookie)
+    з власним лімітом запитів і станом справності.
+    """
+
+    def __init__(self, name: str, cookie_manager: CookieManager, rate: float, burst: int):
+        self.name = name
+        self.cookie_manager = cookie_manager
+        self.governor = RateGovernor(rate=rate, burst=burst)
+        self.healthy = True
+        self.in_flight = 0
+        self.total_requests = 0
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.last_error: Optional[str] = None
+        self._recovery_task: Optional[asyncio.Task] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "queue_depth": self.governor.queue_depth(),
+            "last_error": self.last_error,
+        }
+
+
+class LardiSessionPool:
+    """
+    Пул сесій Lardi-Trans. Кожна спроба запиту отримує сесію з пулу (по черзі або найменш завантажену),
+    і її cookie та ліміт запитів використовуються для цього запиту.
+    Сесія, що постійно отримує 401/403/429, виключається з ротації та відновлюється у фоні:
+    cookie оновлюються, і після успішної перевірки сесія повертається до пулу.
+    """
+
+    ROUND_ROBIN = "round_robin"
+    LEAST_LOADED = "least_loaded"
+
+    def __init__(self, sessions: List[LardiSession], strategy: str = ROUND_ROBIN,
+                 failure_threshold: int = 3, recovery_interval: float = 300):
+        self.sessions = sessions
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.recovery_interval = recovery_interval
+        self._counter = itertools.count()
+
+    def healthy_sessions(self) -> List[LardiSession]:
+        return [session for session in self.sessions if session.healthy]
+
+    def pick(self) -> LardiSession:
+        """
+        Обирає сесію для наступного запиту. Якщо справних сесій немає, обирає з усіх,
+        щоб запити не зупинялися повністю (недоступність самого Lardi обробляє circuit breaker).
+        """
+        candidates = self.healthy_sessions() or self.sessions
+        offset = next(self._counter) % len(candidates)
+        if self.strategy == self.LEAST_LOADED:
+            # Серед однаково завантажених сесій обираємо по черзі
+            rotated = candidates[offset:] + candidates[:offset]
+            return min(rotated, key=lambda session: session.in_flight)
+        return candidates[offset]
+
+    def current(self) -> LardiSession:
+        """Сесія поточного запиту; поза lease() - перша сесія пулу (основний обліковий запис)."""
+        return current_lardi_session.get() or self.sessions[0]
+
+    @contextmanager
+    def lease(self) -> Iterator[LardiSession]:
+        """Закріплює сесію пулу за поточним запитом: її cookie та її ліміт запитів."""
+        session = self.pick()
+        session.in_flight += 1
+        session.total_requests += 1
+        session_token = current_lardi_session.set(session)
+        governor_token = current_session_governor.set(session.governor)
+        try:
+            yield session
+        finally:
+            session.in_flight -= 1
+            current_session_governor.reset(governor_token)
+            current_lardi_session.reset(session_token)
+
+    def record_success(self, session: LardiSession):
+        session.consecutive_failures = 0
+
+    def record_failure(self, session: LardiSession, reason: str):
+        """Враховує збій, спричинений саме сесією (403, 429). Після failure_threshold збоїв поспіль сесія виключається."""
+        session.consecutive_failures += 1
+        session.total_failures += 1
+        session.last_error = reason
+        if session.consecutive_failures >= self.failure_threshold:
+            self.evict(session, reason, refresh_cookies=False)
+
+    def evict(self, session: LardiSession, reason: str, refresh_cookies: bool = True):
+        """Виключає сесію з ротації та запускає її відновлення у фоні."""
+        session.last_error = reason
+        if not session.healthy:
+            return
+        session.healthy = False
+        logger.warning(f"Сесію Lardi '{session.name}' виключено з ротації: {reason}")
+        session._recovery_task = asyncio.ensure_future(self._recover(session, refresh_cookies))
+
+    async def _recover(self, session: LardiSession, refresh_cookies: bool):
+        """
+        Повертає сесію до ротації, щойно її cookie знову дійсні.
+        Після 401 cookie одразу оновлюються; після 403/429 сесія спершу "відпочиває" recovery_interval секунд.
+        """
+        try:
+            while not session.healthy:
+                if not refresh_cookies:
+                    await asyncio.sleep(self.recovery_interval)
+                    refresh_cookies = not await session.cookie_manager.validate_cookies()
+                    if not refresh_cookies:
+                        break
+                    continue
+                if await session.cookie_manager.refresh_lardi_cookies_async() \
+                        and await session.cookie_manager.validate_cookies():
+                    break
+                logger.warning(
+                    f"Не вдалося відновити сесію Lardi '{session.name}'. Наступна спроба через {self.recovery_interval} с."
+                )
+                await asyncio.sleep(self.recovery_interval)
+            session.healthy = True
+            session.consecutive_failures = 0
+            logger.info(f"Сесію Lardi '{session.name}' повернуто до ротації.")
+        finally:
+            session._recovery_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Стан сесій пулу для логів і моніторингу."""
+        return {session.name: session.stats() for session in self.sessions}
+
+
+def parse_extra_accounts(raw: str) -> List[Dict[str, str]]:
+    """
+    Розбирає LARDI_EXTRA_ACCOUNTS: JSON-список {"username": ..., "password": ..., "name": ...}, де name необов'язковий.
+    Кидає ValueError із зазначенням проблемного запису, якщо JSON некоректний або запис не має потрібних ключів.
+    """
+    try:
+        accounts = json.loads(raw or "[]")
+    except ValueError as e:
+        raise ValueError(f"LARDI_EXTRA_ACCOUNTS не є коректним JSON: {e}") from None
+    if not isinstance(accounts, list):
+        raise ValueError(f"LARDI_EXTRA_ACCOUNTS має бути JSON-списком, отримано {type(accounts).__name__}.")
+    for index, account in enumerate(accounts, start=1):
+        if not isinstance(account, dict):
+            raise ValueError(f"LARDI_EXTRA_ACCOUNTS[{index}] має бути об'єктом, отримано {type(account).__name__}.")
+        missing = [key for key in ("username", "password") if not isinstance(account.get(key), str) or not account[key]]
+        if missing:
+            raise ValueError(f"LARDI_EXTRA_ACCOUNTS[{index}]: відсутні або порожні ключі {', '.join(missing)}.")
+        unknown = set(account) - {"username", "password", "name"}
+        if unknown:
+            raise ValueError(f"LARDI_EXTRA_ACCOUNTS[{index}]: невідомі ключі {', '.join(sorted(unknown))}.")
+    return accounts
+
+
+def _build_sessions() -> List[LardiSession]:
+    """Основний обліковий запис (LARDI_USERNAME) та додаткові з LARDI_EXTRA_ACCOUNTS."""
+    rate = env_config.LARDI_SESSION_RATE_LIMIT_PER_SECOND
+    burst = env_config.LARDI_SESSION_RATE_BURST
+    sessions = [LardiSession("primary", lardi_cookie_manager, rate, burst)]
+    for index, account in enumerate(parse_extra_accounts(env_config.LARDI_EXTRA_ACCOUNTS), start=1):
+        cookie_manager = CookieManager(
+            cookies_file=f"cookies_{index}.json",
+            username=account["username"],
+            password=account["password"],
+            chrome_profile_dir=f"{env_config.LARDI_CHROME_PROFILE_DIR}_{index}",
+        )
+        sessions.append(LardiSession(account.get("name") or account["username"], cookie_manager, rate, burst))
+    return sessions
+
+
+lardi_session_pool = LardiSessionPool(
+    _build_sessions(),
+    strategy=env_config.LARDI_SESSION_STRATEGY,
+    failure_threshold=env_config.LARDI_SESSION_FAILURE_THRESHOLD,
+    recovery_interval=env_config.LARDI_SESSION_RECOVERY_INTERVAL,
+)
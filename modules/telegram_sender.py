@@ -0,0 +1,204 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from modules.app_config import env_config
+from modules.rate_governor import RateGovernor
+
+logger = logging.getLogger(__name__)
+
+
+class OutgoingMessage:
+    """Повідомлення в черзі відправки та future з результатом (Message) або помилкою."""
+    __slots__ = ("chat_id", "kwargs", "description", "future", "attempts")
+
+    def __init__(self, chat_id: int, kwargs: Dict[str, Any], description: str, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.description = description
+        self.future = future
+        self.attempts = 0
+
+
+class TelegramSendQueue:
+    """
+    Черга вихідних повідомлень Telegram з воркерами, що відправляють незалежно від пошуку вантажів.
+    Дотримується лімітів Telegram: не більше global_rate повідомлень на секунду загалом
+    і не частіше одного повідомлення на per_chat_interval секунд в один чат.
+    Повідомлення одного чату відправляються по черзі в порядку додавання.
+    На TelegramRetryAfter (flood wait) повідомлення повертається на початок черги свого чату, чат чекає
+    retry_after секунд, і на цей самий час призупиняється вся відправка, щоб інші воркери не впиралися в ліміт.
+    Future повідомлення завершується лише після доставки або остаточної помилки.
+    При зупинці черга спершу до drain_timeout секунд дочікується відправки вже доданих повідомлень.
+    """
+
+    def __init__(self, global_rate: float = 30, per_chat_interval: float = 1.0, workers: int = 8,
+                 max_retries: int = 5, drain_timeout: float = 10):
+        # Без сплесків (burst=1): відправки рівномірно розподілені в межах секунди
+        self.global_limiter = RateGovernor(rate=global_rate, burst=1)
+        self.per_chat_interval = per_chat_interval
+        self.workers = workers
+        self.max_retries = max_retries
+        self.drain_timeout = drain_timeout
+        self._bot: Optional[Bot] = None
+        self._chats: Dict[int, Deque[OutgoingMessage]] = {}
+        self._chat_ready_at: Dict[int, float] = {}
+        self._ready: List[tuple] = []  # heap: (ready_at, seq, chat_id) чатів, що чекають на відправку
+        self._scheduled: Set[int] = set()
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None  # Встановлена, коли немає ні черги, ні відправок
+        self._tasks: List[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self, bot: Bot):
+        """Запускає воркери відправки для бота."""
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        if not self._chats:
+            self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Запущено чергу відправки Telegram ({self.workers} воркерів).")
+
+    async def drain(self, timeout: float) -> bool:
+        """Чекає до timeout секунд, поки всі повідомлення черги буде відправлено. Повертає True, якщо черга спорожніла."""
+        if self._idle is None:
+            return not self._chats
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self):
+        """
+        Зупиняє воркери, спершу даючи їм до drain_timeout секунд відправити повідомлення з черги.
+        Повідомлення, не відправлені за цей час, залишаються в черзі, а їхні future не завершуються,
+        тож вантажі з них не записуються як надіслані.
+        """
+        if self._tasks and self._chats and not await self.drain(self.drain_timeout):
+            logger.warning(f"Черга відправки Telegram не спорожніла за {self.drain_timeout} с: {self.stats()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, chat_id: int, text: str, description: str = "", **kwargs) -> asyncio.Future:
+        """
+        Додає повідомлення (аргументи bot.send_message) до черги і одразу повертає future з результатом.
+        Результат очікувати не обов'язково: помилки відправки логуються чергою.
+        """
+        future = asyncio.get_running_loop().create_future()
+        kwargs["text"] = text
+        self._chats.setdefault(chat_id, deque()).append(OutgoingMessage(chat_id, kwargs, description, future))
+        if self._idle is not None:
+            self._idle.clear()
+        self._schedule(chat_id)
+        return future
+
+    def _schedule(self, chat_id: int):
+        if chat_id in self._scheduled:
+            return
+        self._scheduled.add(chat_id)
+        heapq.heappush(self._ready, (self._chat_ready_at.get(chat_id, 0.0), next(self._seq), chat_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _next_chat(self) -> int:
+        """Чекає на чат, у який вже можна відправити наступне повідомлення."""
+        while True:
+            timeout = None
+            if self._ready:
+                ready_at, _, chat_id = self._ready[0]
+                timeout = ready_at - time.monotonic()
+                if timeout <= 0:
+                    heapq.heappop(self._ready)
+                    return chat_id
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._next_chat()
+            ready_at = None
+            try:
+                await self.global_limiter.acquire()
+                ready_at = await self._send(self._chats[chat_id].popleft())
+            finally:
+                self._chat_ready_at[chat_id] = max(ready_at or 0.0, time.monotonic() + self.per_chat_interval)
+                self._scheduled.discard(chat_id)
+                if self._chats[chat_id]:
+                    self._schedule(chat_id)
+                else:
+                    del self._chats[chat_id]
+                    if not self._chats:
+                        self._idle.set()
+
+    async def _send(self, message: OutgoingMessage) -> Optional[float]:
+        """Відправляє повідомлення. Повертає момент, з якого чат знову доступний, якщо Telegram попросив чекати."""
+        message.attempts += 1
+        try:
+            result = await self._bot.send_message(chat_id=message.chat_id, **message.kwargs)
+        except TelegramRetryAfter as e:
+            if message.attempts <= self.max_retries:
+                self.retried += 1
+                logger.warning(f"Telegram обмежив відправку в чат {message.chat_id}: повтор через {e.retry_after} с.")
+                self.global_limiter.pause(e.retry_after)
+                self._chats[message.chat_id].appendleft(message)
+                return time.monotonic() + e.retry_after
+            self._fail(message, e)
+        except TelegramForbiddenError as e:
+            # Користувач заблокував бота - повтор не допоможе
+            self._fail(message, e)
+        except asyncio.CancelledError:
+            self._chats[message.chat_id].appendleft(message)
+            raise
+        except Exception as e:
+            self._fail(message, e)
+        else:
+            self.sent += 1
+            if message.description:
+                logger.info(f"Надіслано {message.description} (чат {message.chat_id}).")
+            if not message.future.done():
+                message.future.set_result(result)
+        return None
+
+    def _fail(self, message: OutgoingMessage, error: Exception):
+        self.failed += 1
+        logger.error(f"Не вдалося надіслати {message.description or 'повідомлення'} в чат {message.chat_id}: {error}\n"
+                     f"Текст повідомлення: {message.kwargs.get('text')}")
+        if not message.future.done():
+            message.future.set_exception(error)
+            message.future.exception()  # Позначаємо помилку обробленою, якщо результат ніхто не очікує
+
+    def stats(self) -> Dict[str, Any]:
+        """Стан черги для логів і моніторингу."""
+        return {
+            "queued": sum(len(messages) for messages in self._chats.values()),
+            "chats": len(self._chats),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+telegram_send_queue = TelegramSendQueue(
+    global_rate=env_config.TELEGRAM_GLOBAL_RATE_LIMIT,
+    per_chat_interval=env_config.TELEGRAM_CHAT_INTERVAL,
+    workers=env_config.TELEGRAM_SEND_WORKERS,
+    max_retries=env_config.TELEGRAM_SEND_MAX_RETRIES,
+    drain_timeout=env_config.TELEGRAM_SEND_DRAIN_TIMEOUT,
+)
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class AsyncTTLCache:
+    """
+    Обмежений за розміром (LRU) кеш з часом життя записів для асинхронних запитів.
+    Паралельні запити одного ключа чекають на одне спільне завантаження.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Повертає значення з кешу, якщо воно ще не застаріло."""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Зберігає значення та витісняє найдавніше використані записи понад max_entries."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Повертає значення з кешу або завантажує його через fetch().
+        Порожні значення (None) не кешуються; винятки отримують усі, хто чекав на це завантаження.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            self.hits += 1
+            return value
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.hits += 1
+            return await asyncio.shield(task)
+
+        self.misses += 1
+
+        async def load():
+            try:
+                loaded = await fetch()
+                if loaded is not None:
+                    self.set(key, loaded)
+                return loaded
+            finally:
+                self._in_flight.pop(key, None)
+
+        # Завантаження живе в окремій задачі, тож скасування одного з тих, хто чекає, не скасовує інших
+        task = asyncio.ensure_future(load())
+        self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика кешу для логів та моніторингу."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
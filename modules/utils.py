@@ -1,20 +1,16 @@
+import hashlib
 import re
-from datetime import datetime
 from typing import Dict, Any, Optional
 from logger import logger
 
 from modules.app_config import settings_manager
+from modules.json_codec import json_codec
+from modules.lardi_dates import display_lardi_date
 
 
 def date_format(date_string: str) -> str:
-    if date_string.endswith('+00:00'):
-        date_string = date_string[:-16]
-    try:
-        dt_object = datetime.strptime(date_string, '%Y-%m-%dT%H:%M:%S')
-    except ValueError:
-        dt_object = datetime.strptime(date_string, '%Y-%m-%dT%H')
-
-    return dt_object.strftime('%d.%m.%y %H:%M')  # Коротка дата
+    """Коротка дата для повідомлень ('01.06.25 10:00'); '-' для порожніх або некоректних дат."""
+    return display_lardi_date(date_string)
 
 
 def add_line(prefix: str, value: any, important: bool = False) -> str:
@@ -83,6 +79,16 @@ def user_filter_to_dict(lardi_filter_obj) -> dict:
     return user_filters
 
 
+def filter_fingerprint(filters: dict) -> str:
+    """
+    Повертає канонічний хеш фільтрів у форматі Lardi API.
+    Однакові за змістом фільтри (незалежно від порядку ключів і елементів списків,
+    з явними чи пропущеними значеннями "без обмеження") дають однаковий хеш.
+    """
+    canonical = json_codec.canonical_dumps(json_codec.canonical_filters(filters))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
 boolean_options_names = {
     "groupage": "Збірний вантаж",
     "photos": "З фотографіями",
@@ -2,6 +2,7 @@ import os
 import asyncio
 from aiohttp import web
 from modules.app_config import env_config  # Імпортуємо env_config для доступу до LARDI_COOKIE
+from modules.json_codec import json_codec
 from modules.lardi_api_client import LardiOfferClient  # Імпортуємо LardiOfferClient
 
 WEBAPP_DIR = os.path.join(os.path.dirname(__file__), 'webapp')
@@ -9,6 +10,11 @@ WEBAPP_DIR = os.path.join(os.path.dirname(__file__), 'webapp')
 lardi_offer_client = LardiOfferClient()
 
 
+def json_response(data, status: int = 200) -> web.Response:
+    """web.json_response зі спільним json_codec."""
+    return web.json_response(data, status=status, dumps=json_codec.dumps)
+
+
 async def webapp_handler(request):
     """
     Обробник запитів для Web App. Подає HTML-файл.
@@ -40,13 +46,13 @@ async def cargo_details_proxy_api(request):
     """
     cargo_id = request.query.get('id')
     if not cargo_id:
-        return web.json_response({"error": "Missing cargo ID"}, status=400)
+        return json_response({"error": "Missing cargo ID"}, status=400)
     try:
         cargo_data = await lardi_offer_client.get_offer(int(cargo_id))
-        return web.json_response(cargo_data)
+        return json_response(cargo_data)
     except Exception as e:
         print(f"Error fetching cargo details via proxy: {e}")
-        return web.json_response({"error": f"Failed to fetch cargo details: {e}"}, status=500)
+        return json_response({"error": f"Failed to fetch cargo details: {e}"}, status=500)
 
 
 async def start_web_app():
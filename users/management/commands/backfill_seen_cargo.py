@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from modules.app_config import env_config
+from users.models import SeenCargo, UserProfile
+
+
+class Command(BaseCommand):
+    """
+    Одноразове перенесення надісланих вантажів із застарілого UserProfile.cargo_skip у SeenCargo.
+    Запускається один раз перед стартом бота з SeenCargo: python manage.py backfill_seen_cargo
+    Повторний запуск безпечний: вже перенесені вантажі пропускаються.
+    """
+    help = "Переносить UserProfile.cargo_skip у таблицю SeenCargo."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clear", action="store_true",
+                            help="Очистити cargo_skip після перенесення")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Розмір пакета для bulk_create")
+
+    def handle(self, *args, **options):
+        # Коли саме вантаж надіслано, невідомо: вважаємо, що щойно, і записи живуть повний NOTIFICATION_SEEN_CARGO_TTL_DAYS
+        seen_at = timezone.now()
+        max_per_user = env_config.NOTIFICATION_SEEN_CARGO_MAX_PER_USER
+        profiles = UserProfile.objects.exclude(cargo_skip__isnull=True).only("id", "cargo_skip")
+
+        users = 0
+        records = 0
+        skipped = 0
+        for profile in profiles.iterator():
+            cargo_ids = []
+            for cargo_id in profile.cargo_skip if isinstance(profile.cargo_skip, list) else []:
+                try:
+                    cargo_ids.append(int(cargo_id))
+                except (TypeError, ValueError):
+                    skipped += 1
+            # cargo_skip поповнювався в кінець, тож останні ID - найсвіжіші
+            cargo_ids = list(dict.fromkeys(cargo_ids))[-max_per_user:]
+            with transaction.atomic():
+                if cargo_ids:
+                    SeenCargo.objects.bulk_create(
+                        [SeenCargo(user_id=profile.id, cargo_id=cargo_id, seen_at=seen_at) for cargo_id in cargo_ids],
+                        batch_size=options["batch_size"],
+                        ignore_conflicts=True,
+                    )
+                    users += 1
+                    records += len(cargo_ids)
+                if options["clear"]:
+                    UserProfile.objects.filter(id=profile.id).update(cargo_skip=None)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Оброблено {records} вантажів для {users} користувачів (некоректних ID пропущено: {skipped})."
+        ))
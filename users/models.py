@@ -6,8 +6,34 @@ class UserProfile(models.Model):
     telegram_id = models.BigIntegerField(unique=True)
     notification_status = models.BooleanField(default=False)
     notification_time = models.DateTimeField(auto_now_add=True, null=True)
-    cargo_skip = models.JSONField(blank=True, null=True)
+    cargo_skip = models.JSONField(blank=True, null=True)  # Застаріле: надіслані вантажі зберігаються в SeenCargo
     extra_data = models.JSONField(blank=True, null=True) # Для додаткових налаштувань
 
     def __str__(self):
         return f"{self.user.username} (Telegram ID: {self.telegram_id})"
+
+    @property
+    def notification_digest(self) -> bool:
+        """Чи отримує користувач нові вантажі дайджестом (зберігається в extra_data)."""
+        return bool((self.extra_data or {}).get("notification_digest"))
+
+    @notification_digest.setter
+    def notification_digest(self, enabled: bool):
+        self.extra_data = {**(self.extra_data or {}), "notification_digest": enabled}
+
+
+class SeenCargo(models.Model):
+    """
+    Вантаж, про який користувача вже сповіщено. Записи старші за NOTIFICATION_SEEN_CARGO_TTL_DAYS видаляються.
+    """
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name="seen_cargos")
+    cargo_id = models.BigIntegerField()
+    seen_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "cargo_id"], name="unique_seen_cargo_per_user"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.cargo_id}"
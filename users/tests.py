@@ -1,3 +1,853 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from aiogram.exceptions import TelegramRetryAfter
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from modules.app_config import env_config
+from modules.circuit_breaker import CircuitBreaker, LardiCircuitOpenError
+from modules.cookie_manager import CookieManager
+from modules.http_login import LardiHttpLogin, LardiInvalidCredentialsError
+from modules.lardi_dates import display_lardi_date, parse_lardi_timestamp
+from modules.notification_write_buffer import NotificationWriteBuffer
+from modules.notifications_module import TELEGRAM_MESSAGE_LIMIT, build_cargo_digests, run_isolated
+from modules.proposal import Proposal
+from modules.rate_governor import RateGovernor, RequestPriority
+from modules.seen_cargo_store import SeenCargoStore
+from modules.telegram_sender import TelegramSendQueue
+from modules.ttl_cache import AsyncTTLCache
+from users.models import SeenCargo, UserProfile
+
+LOGIN_PAGE = """
+<form method="post">
+  <input type="hidden" name="_csrf" value="csrf-token-1">
+  <input name="login"><input type="password" name="password">
+</form>
+"""
+
+
+class LoginStandIn:
+    """Локальна заміна passport-входу Lardi: форма з CSRF, ліміт сесій, перевірка авторизації."""
+
+    def __init__(self, password="secret", active_sessions=()):
+        self.password = password
+        self.active_sessions = list(active_sessions)
+        self.session_limit = 1
+        self.deleted_sessions = []
+        self.posted_forms = []
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/login", self.login_page)
+        app.router.add_post("/login", self.submit)
+        app.router.add_post("/sessions/delete", self.delete_session)
+        app.router.add_get("/log/search/gruz/", self.search_page)
+        return app
+
+    async def login_page(self, request):
+        response = web.Response(text=LOGIN_PAGE, content_type="text/html")
+        response.set_cookie("PASSPORT_TRACE", "trace-1")
+        return response
+
+    async def submit(self, request):
+        form = dict(await request.post())
+        self.posted_forms.append(form)
+        if form.get("_csrf") != "csrf-token-1" or request.cookies.get("PASSPORT_TRACE") != "trace-1":
+            return web.Response(status=400)
+        if form.get("password") != self.password:
+            return web.Response(text="Incorrect login or password", content_type="text/html")
+        if len(self.active_sessions) >= self.session_limit:
+            return web.json_response({"status": "SESSION_LIMIT", "sessions": [{"id": s} for s in self.active_sessions]})
+        response = web.json_response({"status": "OK"})
+        response.set_cookie("LTSID", "session-token", max_age=3600)
+        return response
+
+    async def delete_session(self, request):
+        session_id = (await request.post())["sessionId"]
+        self.deleted_sessions.append(session_id)
+        self.active_sessions.remove(session_id)
+        return web.json_response({"status": "OK"})
+
+    async def search_page(self, request):
+        if request.cookies.get("LTSID") != "session-token":
+            raise web.HTTPFound("/login")
+        return web.Response(text="ok")
+
+
+class LardiHttpLoginTests(SimpleTestCase):
+    """Вхід по HTTP без браузера проти локального стенду passport-форми."""
+
+    async def _login(self, stand_in, password="secret", with_delete_url=True):
+        server = TestServer(stand_in.app())
+        await server.start_server()
+        try:
+            client = LardiHttpLogin(
+                login_url=str(server.make_url("/login")),
+                authenticated_page_url=str(server.make_url("/log/search/gruz/")),
+                username="user@example.com",
+                password=password,
+                session_delete_url=str(server.make_url("/sessions/delete")) if with_delete_url else "",
+                timeout=5,
+            )
+            cookies = await client.login()
+            return cookies and {cookie["name"]: cookie for cookie in cookies}
+        finally:
+            await server.close()
+
+    async def test_login_returns_cookies(self):
+        stand_in = LoginStandIn()
+        cookies = await self._login(stand_in)
+        self.assertEqual(cookies["LTSID"]["value"], "session-token")
+        self.assertAlmostEqual(cookies["LTSID"]["expiry"], time.time() + 3600, delta=60)
+        self.assertEqual(cookies["PASSPORT_TRACE"]["value"], "trace-1")
+        self.assertNotIn("expiry", cookies["PASSPORT_TRACE"])
+        self.assertEqual(stand_in.posted_forms[0]["login"], "user@example.com")
+
+    async def test_session_limit_deletes_oldest_session(self):
+        stand_in = LoginStandIn(active_sessions=["old-1", "old-2"])
+        stand_in.session_limit = 2
+        cookies = await self._login(stand_in)
+        self.assertEqual(stand_in.deleted_sessions, ["old-1"])
+        self.assertEqual(cookies["LTSID"]["value"], "session-token")
+
+    async def test_session_limit_without_delete_url_falls_back(self):
+        stand_in = LoginStandIn(active_sessions=["old-1"])
+        self.assertIsNone(await self._login(stand_in, with_delete_url=False))
+
+    async def test_invalid_credentials_raise(self):
+        with self.assertRaises(LardiInvalidCredentialsError):
+            await self._login(LoginStandIn(), password="wrong")
+
+
+class CargoDigestTests(SimpleTestCase):
+    """Дайджест нових вантажів має вкладатися в ліміти Telegram."""
+
+    def _cargo(self, cargo_id, name="Зерно"):
+        return Proposal({
+            "id": cargo_id, "dateFrom": "2025-06-01T00:00:00", "gruzName": name, "gruzMass": "20 т",
+            "waypointListSource": [{"town": "Київ", "countrySign": "UA"}],
+            "waypointListTarget": [{"town": "Львів", "countrySign": "UA"}],
+        })
+
+    def test_digest_setting_in_extra_data(self):
+        user_profile = UserProfile(extra_data={"language": "uk"})
+        self.assertFalse(user_profile.notification_digest)
+        user_profile.notification_digest = True
+        self.assertTrue(user_profile.notification_digest)
+        self.assertEqual(user_profile.extra_data, {"language": "uk", "notification_digest": True})
+
+    def test_splits_by_cargo_count(self):
+        digests = build_cargo_digests([self._cargo(i) for i in range(1, 13)], max_cargos=5)
+        self.assertEqual([ids for _, ids in digests], [[1, 2, 3, 4, 5], [6, 7, 8, 9, 10], [11, 12]])
+        self.assertTrue(digests[2][0].startswith("🚛 Нові вантажі: *2*"))
+        self.assertIn("1\\. *Київ* \\(UA\\) → *Львів* \\(UA\\)", digests[1][0])
+
+    def test_respects_message_length_limit(self):
+        digests = build_cargo_digests([self._cargo(i, name="Б" * 1500) for i in range(5)], max_cargos=10)
+        self.assertEqual([ids for _, ids in digests], [[0, 1], [2, 3], [4]])
+        for text, _ in digests:
+            self.assertLessEqual(len(text.encode("utf-16-le")) // 2, TELEGRAM_MESSAGE_LIMIT)
+
+
+class NotificationWriteBufferTests(SimpleTestCase):
+    """Зміни тіку накопичуються в пам'яті до flush."""
+
+    def test_collects_and_discards_user_changes(self):
+        buffer = NotificationWriteBuffer()
+        first, later = timezone.now(), timezone.now() + timedelta(minutes=5)
+        buffer.add_seen_cargos(1, [10, 11], first)
+        buffer.add_seen_cargos(1, [11, 12], later)
+        buffer.add_seen_cargos(2, [10], first)
+        buffer.set_notification_time(1, first)
+        buffer.set_notification_time(1, later)
+        self.assertEqual(buffer.stats(), {"seen_cargos": 4, "notification_times": 1})
+        self.assertEqual(buffer._seen[(1, 11)], first)  # Перший час показу не перезаписується
+        self.assertEqual(buffer._notification_times[1], later)
+
+        buffer.discard_user(1)
+        self.assertEqual(buffer.stats(), {"seen_cargos": 1, "notification_times": 0})
+
+
+class BotStandIn:
+    """Замість aiogram.Bot: запам'ятовує відправлені повідомлення."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.delay)
+        self.sent.append((chat_id, text))
+        return len(self.sent)
+
+
+class TelegramSendQueueTests(SimpleTestCase):
+    """Черга відправки при зупинці дочікується повідомлень, вантажі яких уже позначені надісланими."""
+
+    async def test_stop_drains_queued_messages(self):
+        bot = BotStandIn(delay=0.01)
+        queue = TelegramSendQueue(global_rate=1000, per_chat_interval=0, workers=2, drain_timeout=5)
+        queue.start(bot)
+        futures = [queue.enqueue(chat_id, f"{chat_id}-{n}") for chat_id in (1, 2) for n in range(3)]
+        await queue.stop()
+        self.assertEqual(queue.stats()["queued"], 0)
+        self.assertEqual(len(bot.sent), 6)
+        # Повідомлення одного чату відправляються в порядку додавання
+        self.assertEqual([text for chat_id, text in bot.sent if chat_id == 1], ["1-0", "1-1", "1-2"])
+        self.assertTrue(all(future.done() for future in futures))
+
+    async def test_stop_gives_up_after_drain_timeout(self):
+        queue = TelegramSendQueue(global_rate=1000, per_chat_interval=0, workers=1, drain_timeout=0.05)
+        queue.start(BotStandIn(delay=1))
+        queue.enqueue(1, "slow")
+        queue.enqueue(1, "left in queue")
+        await queue.stop()
+        self.assertEqual(queue.stats()["queued"], 2)  # Перерване повідомлення повертається в чергу
+
+
+class FloodWaitBotStandIn(BotStandIn):
+    """Перша відправка в чат 1 отримує flood wait від Telegram."""
+
+    def __init__(self, retry_after):
+        super().__init__()
+        self.retry_after = retry_after
+        self.sent_at = {}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id == 1 and not self.sent:
+            self.sent.append((chat_id, "flood"))
+            raise TelegramRetryAfter(method=None, message="Flood control exceeded", retry_after=self.retry_after)
+        self.sent_at[text] = time.monotonic()
+        return await super().send_message(chat_id, text, **kwargs)
+
+
+class TelegramFloodWaitTests(SimpleTestCase):
+    """Flood wait призупиняє всю відправку, а не лише чат, який його отримав."""
+
+    async def test_retry_after_pauses_every_chat(self):
+        bot = FloodWaitBotStandIn(retry_after=1)
+        queue = TelegramSendQueue(global_rate=1000, per_chat_interval=0, workers=2, drain_timeout=5)
+        queue.start(bot)
+        started_at = time.monotonic()
+        first = queue.enqueue(1, "chat-1")
+        await asyncio.sleep(0.05)  # Flood wait отримано
+        second = queue.enqueue(2, "chat-2")
+        await asyncio.gather(first, second)
+        await queue.stop()
+
+        self.assertGreaterEqual(bot.sent_at["chat-2"] - started_at, 0.9)
+        self.assertEqual(queue.stats()["retried"], 1)
+
+
+class RateGovernorTests(SimpleTestCase):
+    """Token bucket видає токени в порядку пріоритету і не приймає некоректних лімітів."""
+
+    def test_rejects_invalid_limits(self):
+        for rate, burst in ((0, 10), (-1, 10), (5, 0)):
+            with self.subTest(rate=rate, burst=burst), self.assertRaises(ValueError):
+                RateGovernor(rate=rate, burst=burst)
+
+    async def test_interactive_requests_overtake_background(self):
+        governor = RateGovernor(rate=50, burst=1)
+        await governor.acquire()  # Забираємо єдиний токен, далі всі чекають у черзі
+        order = []
+
+        async def request(name, priority):
+            await governor.acquire(priority)
+            order.append(name)
+
+        tasks = [asyncio.create_task(request(f"background-{i}", RequestPriority.BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0)  # Фонові запити стають у чергу першими
+        tasks += [asyncio.create_task(request(f"interactive-{i}", RequestPriority.INTERACTIVE)) for i in range(2)]
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(order, ["interactive-0", "interactive-1", "background-0", "background-1", "background-2"])
+        self.assertEqual(governor.stats()["acquired"], {"interactive": 3, "background": 3})
+
+    async def test_pause_holds_tokens(self):
+        governor = RateGovernor(rate=1000, burst=5)
+        governor.pause(0.2)
+        started_at = time.monotonic()
+        await governor.acquire()
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.19)
+
+    async def test_cancelled_waiter_does_not_block_queue(self):
+        governor = RateGovernor(rate=50, burst=1)
+        await governor.acquire()
+        cancelled = asyncio.create_task(governor.acquire(RequestPriority.INTERACTIVE))
+        waiting = asyncio.create_task(governor.acquire(RequestPriority.BACKGROUND))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.wait_for(waiting, timeout=1)
+        self.assertEqual(governor.queue_depth(), {"interactive": 0, "background": 0})
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """Переходи closed -> open -> half_open -> closed/open."""
+
+    def open_breaker(self, breaker):
+        for _ in range(breaker.failure_threshold):
+            breaker.before_request()
+            breaker.record_failure()
+
+    def expire_reset_timeout(self, breaker):
+        breaker._opened_at -= breaker.reset_timeout
+
+    def test_opens_after_threshold_and_rejects(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(LardiCircuitOpenError):
+            breaker.before_request()
+        self.assertEqual(breaker.stats()["total_rejected"], 1)
+        self.assertEqual(breaker.stats()["times_opened"], 1)
+
+    def test_success_resets_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_one_trial_through_and_success_closes(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        self.open_breaker(breaker)
+        self.expire_reset_timeout(breaker)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+        breaker.before_request()  # Пробний запит
+        with self.assertRaises(LardiCircuitOpenError):
+            breaker.before_request()  # Другий паралельний запит чекає на результат пробного
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.before_request()
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        self.open_breaker(breaker)
+        self.expire_reset_timeout(breaker)
+        breaker.before_request()
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.stats()["times_opened"], 2)
+        with self.assertRaises(LardiCircuitOpenError):
+            breaker.before_request()
+
+    def test_abandoned_trial_does_not_block_forever(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        self.open_breaker(breaker)
+        self.expire_reset_timeout(breaker)
+        breaker.before_request()  # Пробний запит скасовано, результат так і не записано
+        breaker._trial_started_at -= breaker.reset_timeout
+        breaker.before_request()
+
+
+class AsyncTTLCacheTests(SimpleTestCase):
+    """Одне спільне завантаження на ключ; кешується все, крім None."""
+
+    async def test_concurrent_fetches_share_one_load(self):
+        cache = AsyncTTLCache(ttl=60)
+        calls = 0
+        release = asyncio.Event()
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"id": 1}
+
+        waiters = [asyncio.create_task(cache.get_or_fetch("offer", fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+        self.assertEqual(calls, 1)
+        self.assertEqual(results, [{"id": 1}] * 5)
+        self.assertEqual(cache.stats()["in_flight"], 0)
+
+    async def test_cancelled_waiter_does_not_cancel_shared_load(self):
+        cache = AsyncTTLCache(ttl=60)
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return {"id": 1}
+
+        first = asyncio.create_task(cache.get_or_fetch("offer", fetch))
+        second = asyncio.create_task(cache.get_or_fetch("offer", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        self.assertEqual(await second, {"id": 1})
+
+    async def test_empty_dict_is_cached(self):
+        cache = AsyncTTLCache(ttl=60)
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            return {}
+
+        self.assertEqual(await cache.get_or_fetch("geo", fetch), {})
+        self.assertEqual(await cache.get_or_fetch("geo", fetch), {})
+        self.assertEqual(calls, 1)
+
+    async def test_none_is_not_cached(self):
+        cache = AsyncTTLCache(ttl=60)
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            return None
+
+        self.assertIsNone(await cache.get_or_fetch("geo", fetch))
+        self.assertIsNone(await cache.get_or_fetch("geo", fetch))
+        self.assertEqual(calls, 2)
+
+    async def test_errors_reach_every_waiter_and_are_not_cached(self):
+        cache = AsyncTTLCache(ttl=60)
+
+        async def fetch():
+            await asyncio.sleep(0)
+            raise RuntimeError("Lardi недоступний")
+
+        results = await asyncio.gather(*(cache.get_or_fetch("offer", fetch) for _ in range(2)),
+                                       return_exceptions=True)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertIsNone(cache.get("offer"))
+
+    def test_expired_and_evicted_entries(self):
+        cache = AsyncTTLCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "a" використано нещодавно, витісняється "b"
+        cache.set("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+        cache.ttl = -1
+        cache.set("d", 4)
+        self.assertIsNone(cache.get("d"))
+
+
+class CookieStoreTests(SimpleTestCase):
+    """Cookie тримаються в пам'яті: файл перечитується лише після зміни, кожна зміна збільшує version."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cookies_file = os.path.join(directory.name, "cookies.json")
+        self.write_cookies({"LTSID": "first"})
+        self.manager = CookieManager(cookies_file=self.cookies_file, username="user", password="secret")
+
+    def write_cookies(self, cookies):
+        with open(self.cookies_file, "w", encoding="utf-8") as f:
+            json.dump(cookies, f)
+
+    def test_requests_do_not_read_the_file(self):
+        version = self.manager.version
+        with mock.patch.object(self.manager, "_load_cookies", wraps=self.manager._load_cookies) as load_cookies:
+            for _ in range(100):
+                self.assertEqual(self.manager.get_cookie_string(), "LTSID=first")
+        load_cookies.assert_not_called()
+        self.assertEqual(self.manager.version, version)
+
+    def test_changed_file_is_reloaded_once(self):
+        version = self.manager.version
+        self.write_cookies({"LTSID": "second", "LTAUTH": "token"})  # Інший розмір - інший підпис файлу
+        with mock.patch.object(self.manager, "_load_cookies", wraps=self.manager._load_cookies) as load_cookies:
+            self.assertEqual(self.manager.get_cookie_string(), "LTSID=second; LTAUTH=token")
+            self.assertEqual(self.manager.get_cookie_string(), "LTSID=second; LTAUTH=token")
+        self.assertEqual(load_cookies.call_count, 1)
+        self.assertEqual(self.manager.version, version + 1)
+
+    def test_own_writes_bump_version_without_reload(self):
+        version = self.manager.version
+        with mock.patch.object(self.manager, "_load_cookies", wraps=self.manager._load_cookies) as load_cookies:
+            self.manager._store_new_cookies([{"name": "LTAUTH", "value": "token", "expiry": time.time() + 3600}])
+            self.assertEqual(self.manager.get_cookie_string(), "LTSID=first; LTAUTH=token")
+        load_cookies.assert_not_called()
+        self.assertEqual(self.manager.version, version + 1)
+        # Інший екземпляр бачить збережені cookie
+        other = CookieManager(cookies_file=self.cookies_file, username="user", password="secret")
+        self.assertEqual(other.get_cookie_string(), "LTSID=first; LTAUTH=token")
+
+
+class CookieRefreshSingleFlightTests(SimpleTestCase):
+    """Паралельні 401 чекають на одне спільне оновлення cookie."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cookies_file = os.path.join(directory.name, "cookies.json")
+        with open(cookies_file, "w", encoding="utf-8") as f:
+            json.dump({"LTSID": "expired"}, f)
+        self.manager = CookieManager(cookies_file=cookies_file, username="user", password="secret")
+        self.manager.refresh_min_interval = 60
+        self.logins = 0
+        self.login_result = True
+        self.manager._refresh_cookies = self.login
+
+    async def login(self):
+        """Замість входу на Lardi: рахує входи і зберігає нові cookie."""
+        self.logins += 1
+        await asyncio.sleep(0.05)
+        if self.login_result:
+            self.manager._store_new_cookies([{"name": "LTSID", "value": f"fresh-{self.logins}"}])
+        return self.login_result
+
+    async def test_concurrent_callers_share_one_login(self):
+        version = self.manager.version
+        results = await asyncio.gather(*(self.manager.refresh_lardi_cookies_async(version) for _ in range(10)))
+        self.assertEqual(results, [True] * 10)
+        self.assertEqual(self.logins, 1)
+        self.assertEqual(self.manager.get_cookie_string(), "LTSID=fresh-1")
+
+    async def test_cancelled_waiter_does_not_cancel_login(self):
+        first = asyncio.create_task(self.manager.refresh_lardi_cookies_async())
+        second = asyncio.create_task(self.manager.refresh_lardi_cookies_async())
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertTrue(await second)
+        self.assertEqual(self.logins, 1)
+
+    async def test_stale_version_skips_login(self):
+        stale_version = self.manager.version
+        await self.manager.refresh_lardi_cookies_async(stale_version)
+        # Запит, що отримав 401 зі старими cookie, вже не запускає нового входу
+        self.manager._last_refresh_at = None
+        self.assertTrue(await self.manager.refresh_lardi_cookies_async(stale_version))
+        self.assertEqual(self.logins, 1)
+
+    async def test_min_interval_returns_last_result(self):
+        self.login_result = False
+        self.assertFalse(await self.manager.refresh_lardi_cookies_async(self.manager.version))
+        self.assertFalse(await self.manager.refresh_lardi_cookies_async(self.manager.version))
+        self.assertEqual(self.logins, 1)
+
+        self.manager._last_refresh_at -= self.manager.refresh_min_interval
+        self.login_result = True
+        self.assertTrue(await self.manager.refresh_lardi_cookies_async(self.manager.version))
+        self.assertEqual(self.logins, 2)
+
+
+class CookieRefreshWorkerTests(SimpleTestCase):
+    """Оновлення cookie в окремому процесі: розбір відповіді та примусове завершення за таймаутом."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cookies_file = os.path.join(directory.name, "cookies.json")
+        with open(cookies_file, "w", encoding="utf-8") as f:
+            json.dump({"LTSID": "old"}, f)
+        self.manager = CookieManager(cookies_file=cookies_file, username="user", password="secret")
+
+    def use_worker(self, source: str):
+        """Підміняє modules.cookie_refresh_worker процесом Python з кодом source."""
+        self.manager.refresh_worker_command = [sys.executable, "-c", source]
+
+    async def test_last_json_line_is_stored(self):
+        self.use_worker(
+            "import json, sys\n"
+            "print('DevTools listening', flush=True)\n"
+            "sys.stderr.write('chrome noise\\n')\n"
+            "print(json.dumps({'cookies': [{'name': 'LTSID', 'value': 'fresh'}]}))\n"
+        )
+        self.assertTrue(await self.manager.refresh_lardi_cookies_in_worker())
+        self.assertEqual(self.manager.get_cookie_string(), "LTSID=fresh")
+
+    async def test_invalid_output_is_rejected(self):
+        for source in ("print('not json')", "print('[1, 2]')", "import json; print(json.dumps({'cookies': None}))", ""):
+            self.use_worker(source)
+            self.assertFalse(await self.manager.refresh_lardi_cookies_in_worker(), source)
+        self.assertEqual(self.manager.get_cookie_string(), "LTSID=old")
+
+    @unittest.skipUnless(hasattr(os, "killpg"), "Група процесів завершується через killpg лише на POSIX")
+    async def test_timeout_kills_worker_process_group(self):
+        with tempfile.NamedTemporaryFile("r", suffix=".pid", delete=False) as f:
+            pid_file = f.name
+        self.addCleanup(os.remove, pid_file)
+        # Процес оновлення запускає дочірній процес (як Chrome) і зависає
+        self.use_worker(
+            "import subprocess, sys, time\n"
+            "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+            f"open({pid_file!r}, 'w').write(str(child.pid))\n"
+            "time.sleep(60)\n"
+        )
+        self.manager.refresh_worker_timeout = 1
+        started = time.monotonic()
+        self.assertFalse(await self.manager.refresh_lardi_cookies_in_worker())
+        self.assertLess(time.monotonic() - started, 10)
+
+        with open(pid_file, encoding="utf-8") as f:
+            child_pid = int(f.read())
+        for _ in range(50):
+            try:
+                os.kill(child_pid, 0)
+            except ProcessLookupError:
+                break
+            # Осиротілий процес може лишатися зомбі, доки його не прибере init
+            try:
+                with open(f"/proc/{child_pid}/stat", encoding="utf-8") as stat:
+                    if stat.read().rsplit(")", 1)[1].split()[0] == "Z":
+                        break
+            except FileNotFoundError:
+                break
+            await asyncio.sleep(0.1)
+        else:
+            self.fail("Дочірній процес оновлення cookie не завершено")
+        self.assertEqual(self.manager.get_cookie_string(), "LTSID=old")
+
+
+class CookieRefreshScheduleTests(SimpleTestCase):
+    """Оновлення cookie плануються за часом завершення дії критичних cookie."""
+
+    def make_manager(self, cookies, expiry, critical=()):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cookies_file = os.path.join(directory.name, "cookies.json")
+        with open(cookies_file, "w", encoding="utf-8") as f:
+            json.dump(cookies, f)
+        with open(os.path.join(directory.name, "cookies.expiry.json"), "w", encoding="utf-8") as f:
+            json.dump(expiry, f)
+        manager = CookieManager(cookies_file=cookies_file, username="user", password="secret")
+        manager.critical_cookies = set(critical)
+        manager.refresh_ahead = 600
+        manager.refresh_min_interval = 60
+        manager.max_refresh_interval = 86400
+        return manager
+
+    def test_unknown_expiry_uses_max_interval(self):
+        manager = self.make_manager({"LTSID": "a"}, {})
+        self.assertEqual(manager.seconds_until_refresh(), 86400)
+
+    def test_refreshes_ahead_of_earliest_critical_cookie(self):
+        now = time.time()
+        manager = self.make_manager(
+            {"LTSID": "a", "LTAUTH": "b", "_ga": "c"},
+            # Аналітичний _ga та cookie, якого вже немає серед поточних, не впливають на розклад
+            {"LTSID": now + 7200, "LTAUTH": now + 3600, "_ga": now + 100, "removed": now + 100},
+        )
+        self.assertAlmostEqual(manager.seconds_until_refresh(), 3000, delta=5)
+
+    def test_configured_critical_cookies(self):
+        now = time.time()
+        manager = self.make_manager(
+            {"LTSID": "a", "LTAUTH": "b"}, {"LTSID": now + 7200, "LTAUTH": now + 3600}, critical=["LTSID"]
+        )
+        self.assertAlmostEqual(manager.seconds_until_refresh(), 6600, delta=5)
+
+    def test_delay_is_clamped(self):
+        now = time.time()
+        expired = self.make_manager({"LTSID": "a"}, {"LTSID": now - 10})
+        self.assertEqual(expired.seconds_until_refresh(), 60)
+
+        far = self.make_manager({"LTSID": "a"}, {"LTSID": now + 10 * 86400})
+        self.assertEqual(far.seconds_until_refresh(), 86400)
+
+
+class LardiDatesTests(SimpleTestCase):
+    """Дати Lardi в усіх форматах, які повертає API."""
+
+    def test_naive_dates_are_utc(self):
+        timestamp = parse_lardi_timestamp("2025-06-01T10:00:00")
+        self.assertEqual(timestamp.utc, datetime(2025, 6, 1, 10, 0, tzinfo=dt_timezone.utc))
+        self.assertEqual(timestamp.display, "01.06.25 10:00")
+
+    def test_zone_suffixes(self):
+        self.assertEqual(parse_lardi_timestamp("2025-06-01T10:00:00Z").utc,
+                         datetime(2025, 6, 1, 10, 0, tzinfo=dt_timezone.utc))
+        with_offset = parse_lardi_timestamp("2025-06-01T10:00:00+03:00")
+        self.assertEqual(with_offset.utc, datetime(2025, 6, 1, 7, 0, tzinfo=dt_timezone.utc))
+        # У повідомленні показується час у зоні Lardi
+        self.assertEqual(with_offset.display, "01.06.25 10:00")
+
+    def test_long_fractions(self):
+        timestamp = parse_lardi_timestamp("2025-06-01T10:00:00.123456789Z")
+        self.assertEqual(timestamp.utc, datetime(2025, 6, 1, 10, 0, 0, 123456, tzinfo=dt_timezone.utc))
+
+    def test_invalid_values(self):
+        for value in (None, "", "вчора", 1717236000):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_lardi_timestamp(value))
+
+    def test_parsed_timestamps_are_shared(self):
+        self.assertIs(parse_lardi_timestamp("2025-06-01T10:00:00"), parse_lardi_timestamp("2025-06-01T10:00:00"))
+
+    def test_display_lardi_date(self):
+        self.assertEqual(display_lardi_date("2025-06-01T10:00:00"), "01.06.25 10:00")
+        self.assertEqual(display_lardi_date(parse_lardi_timestamp("2025-06-01T10:00:00")), "01.06.25 10:00")
+        self.assertEqual(display_lardi_date(None), "-")
+        self.assertEqual(display_lardi_date("not a date", default="—"), "—")
+
+
+class RunIsolatedTests(SimpleTestCase):
+    """Таймаут чи помилка одного користувача в тіку сповіщень не зачіпає інших."""
+
+    async def test_slow_and_failing_users_do_not_affect_others(self):
+        semaphore = asyncio.Semaphore(10)
+        finished = []
+
+        async def work(name, delay=0.0, error=None):
+            await asyncio.sleep(delay)
+            if error:
+                raise error
+            finished.append(name)
+
+        with mock.patch.object(env_config, "NOTIFICATION_USER_TIMEOUT", 0.1):
+            started_at = time.monotonic()
+            results = await asyncio.gather(
+                run_isolated(semaphore, "user_id=1", lambda: work("first")),
+                run_isolated(semaphore, "user_id=2", lambda: work("slow", delay=10)),
+                run_isolated(semaphore, "user_id=3", lambda: work("failing", error=RuntimeError("Telegram"))),
+                run_isolated(semaphore, "user_id=4", lambda: work("last", delay=0.01)),
+            )
+
+        self.assertEqual(results, [True, False, False, True])
+        self.assertEqual(finished, ["first", "last"])
+        self.assertLess(time.monotonic() - started_at, 1)
+
+    async def test_concurrency_is_limited_by_semaphore(self):
+        semaphore = asyncio.Semaphore(2)
+        running = peak = 0
+
+        async def work():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        results = await asyncio.gather(*(run_isolated(semaphore, f"user_id={i}", work) for i in range(6)))
+        self.assertTrue(all(results))
+        self.assertEqual(peak, 2)
+
+
+class SeenCargoStoreTests(TestCase):
+    """Надіслані вантажі: одне завантаження з БД на користувача, запис через буфер, очищення за ttl."""
+
+    def setUp(self):
+        self.user_profile = UserProfile.objects.create(user=User.objects.create(username="driver"), telegram_id=1)
+        self.write_buffer = NotificationWriteBuffer()
+        self.store = SeenCargoStore(ttl=timedelta(days=7), prune_interval=3600, write_buffer=self.write_buffer)
+
+    async def deliver(self, cargo_ids):
+        """Резервує вантажі і фіксує їх доставку, як після успішної відправки в Telegram."""
+        reserved = await self.store.reserve(self.user_profile.id, cargo_ids)
+        self.store.settle(self.user_profile.id, reserved, delivered=True)
+        return reserved
+
+    async def test_filter_unseen_skips_only_recent_records(self):
+        await SeenCargo.objects.acreate(user=self.user_profile, cargo_id=1, seen_at=timezone.now() - timedelta(days=1))
+        await SeenCargo.objects.acreate(user=self.user_profile, cargo_id=2, seen_at=timezone.now() - timedelta(days=8))
+
+        self.assertEqual(await self.store.filter_unseen(self.user_profile.id, [3, 2, 1]), [3, 2])
+        # Повторна перевірка не звертається до БД
+        await SeenCargo.objects.acreate(user=self.user_profile, cargo_id=3, seen_at=timezone.now())
+        self.assertEqual(await self.store.filter_unseen(self.user_profile.id, [3, 2, 1]), [3, 2])
+
+    async def test_delivered_cargos_are_buffered_until_flush(self):
+        self.assertEqual(await self.deliver([5, 6, 5]), [5, 6])
+        self.assertEqual(await self.store.filter_unseen(self.user_profile.id, [5, 6, 7]), [7])
+        self.assertEqual(await SeenCargo.objects.acount(), 0)
+
+        await self.write_buffer.flush()
+        self.assertEqual(
+            {cargo_id async for cargo_id in SeenCargo.objects.values_list("cargo_id", flat=True)}, {5, 6}
+        )
+
+    async def test_reserved_cargos_are_settled_by_send_result(self):
+        delivered, failed, cancelled = (asyncio.get_running_loop().create_future() for _ in range(3))
+        for cargo_id, sent in ((1, delivered), (2, failed), (3, cancelled)):
+            self.assertEqual(await self.store.reserve(self.user_profile.id, [cargo_id]), [cargo_id])
+            self.store.settle_when_sent(self.user_profile.id, [cargo_id], sent)
+        # Поки повідомлення в черзі, вантаж не резервується вдруге
+        self.assertEqual(await self.store.reserve(self.user_profile.id, [1, 2, 3]), [])
+
+        delivered.set_result(None)
+        failed.set_exception(RuntimeError("Telegram"))
+        cancelled.cancel()
+        await asyncio.sleep(0)
+
+        self.assertEqual(self.write_buffer.stats()["seen_cargos"], 1)
+        self.assertEqual(await self.store.filter_unseen(self.user_profile.id, [1, 2, 3]), [2, 3])
+
+    async def test_prune_removes_expired_records(self):
+        await SeenCargo.objects.acreate(user=self.user_profile, cargo_id=1, seen_at=timezone.now() - timedelta(days=1))
+        await SeenCargo.objects.acreate(user=self.user_profile, cargo_id=2, seen_at=timezone.now() - timedelta(days=8))
+        await self.store.preload([self.user_profile.id])
+        self.store._seen[self.user_profile.id][3] = timezone.now() - timedelta(days=9)  # Застаріло в пам'яті
+
+        await self.store.prune(force=True)
+        self.assertEqual(
+            [cargo_id async for cargo_id in SeenCargo.objects.values_list("cargo_id", flat=True)], [1]
+        )
+        self.assertEqual(self.store.stats(), {"users": 1, "cargos": 1})
+
+    async def test_prune_respects_interval(self):
+        await self.store.prune(force=True)
+        await SeenCargo.objects.acreate(user=self.user_profile, cargo_id=2, seen_at=timezone.now() - timedelta(days=8))
+        await self.store.prune()
+        self.assertEqual(await SeenCargo.objects.acount(), 1)
+
+    async def test_forget_user(self):
+        await SeenCargo.objects.acreate(user=self.user_profile, cargo_id=1, seen_at=timezone.now())
+        await self.deliver([2])
+
+        await self.store.forget_user(self.user_profile.id)
+        await self.write_buffer.flush()
+        self.assertEqual(await SeenCargo.objects.acount(), 0)
+        self.assertEqual(await self.store.filter_unseen(self.user_profile.id, [1, 2]), [1, 2])
+
+    async def test_memory_is_capped_per_user(self):
+        self.store.max_per_user = 3
+        await SeenCargo.objects.acreate(user=self.user_profile, cargo_id=2, seen_at=timezone.now() - timedelta(days=2))
+        await SeenCargo.objects.acreate(user=self.user_profile, cargo_id=1, seen_at=timezone.now() - timedelta(days=3))
+        await self.store.preload([self.user_profile.id])
+        self.assertEqual(list(self.store._seen[self.user_profile.id]), [1, 2])
+
+        self.store.ttl = timedelta(days=2.5)  # Запис 1 застарів, але prune ще не запускався
+        await self.deliver([4])
+        self.assertEqual(list(self.store._seen[self.user_profile.id]), [2, 4])
+
+        await self.deliver([5, 6])
+        self.assertEqual(list(self.store._seen[self.user_profile.id]), [4, 5, 6])
+        # Витіснені з пам'яті записи лишаються в БД, нові потрапляють у буфер
+        self.assertEqual(self.write_buffer.stats()["seen_cargos"], 3)
+
+
+class BackfillSeenCargoTests(TestCase):
+    """Одноразове перенесення UserProfile.cargo_skip у SeenCargo."""
+
+    def test_backfill_is_idempotent_and_clears_on_request(self):
+        profile = UserProfile.objects.create(user=User.objects.create(username="driver"), telegram_id=1,
+                                             cargo_skip=[11, "12", 11, "bad"])
+        UserProfile.objects.create(user=User.objects.create(username="empty"), telegram_id=2)
+        SeenCargo.objects.create(user=profile, cargo_id=12, seen_at=timezone.now() - timedelta(days=1))
+
+        call_command("backfill_seen_cargo", stdout=StringIO())
+        call_command("backfill_seen_cargo", "--clear", stdout=StringIO())
+
+        self.assertEqual(sorted(SeenCargo.objects.values_list("cargo_id", flat=True)), [11, 12])
+        profile.refresh_from_db()
+        self.assertIsNone(profile.cargo_skip)